@@ -80,11 +80,33 @@ class Eqpt1850TSS320(Equipment):
 
 
     def clean_up(self):
+        self.__dump_stats()
         self.tl1.thr_event_terminate()
         self.cli.disconnect()
         self.bm.clean_up()
 
 
+    def get_stats(self):
+        """ Return the command statistics of TL1 and CLI interfaces (see kstats.py)
+            as a dictionary "TL1"/"CLI" -> {verb -> statistics}
+        """
+        return { "TL1" : self.tl1.get_stats().get_stats(),
+                 "CLI" : self.cli.get_stats().get_stats() }
+
+
+    def __dump_stats(self):
+        """ INTERNAL USAGE
+            Write the command statistics of TL1 and CLI interfaces on collector area
+        """
+        stats_fn = "{:s}/{:s}_stats.log".format(self.__kenv.path_collector(), self.get_label())
+
+        with open(stats_fn, "w") as stats_f:
+            stats_f.write(self.tl1.get_stats().get_report())
+            stats_f.write("\n\n")
+            stats_f.write(self.cli.get_stats().get_report())
+            stats_f.write("\n")
+
+
     def get_preset(self, name):
         """ Get current value for specified presetting
         """
@@ -10,23 +10,1232 @@
 """
 
 import sys
+import os
+import re
 import json
+import time
+import gzip
+import shutil
+import mmap
+import zlib
+import array
+import struct
+import bisect
+import threading
+import collections
+
+
+
+class TL1Framer():
+    """ Incremental framer of TL1 messages on a byte stream.
+        Received data are kept on a bytearray and scanned only once for block
+        boundaries ('>' continuation or ';' termination at begin of line).
+        A message is decoded (and CR/LF normalized) only when it is complete
+    """
+    MARK_CONT = 0   # continuation block ('>')
+    MARK_TERM = 1   # terminating block (';')
+
+    BLOCK_END = re.compile(b"\n[>;]")
+    CRLF_RUN  = re.compile(b"(\r\n)+")
+    CTAG      = re.compile(rb"^M\s+(\S+)\s", re.MULTILINE)
+
+    def __init__(self):
+        """ Constructor for TL1 Framer
+        """
+        self.__buffer = bytearray()     # received data
+        self.__start  = 0               # begin of first unframed block
+        self.__scan   = 0               # data before this offset don't contain a block end
+        self.__parts  = []              # blocks of a partial message (see next_message())
+
+
+    def feed(self, data):
+        """ Append received data
+        """
+        self.__buffer.extend(data)
+
+
+    def reset(self):
+        """ Discard all received data and partial messages
+        """
+        self.__buffer = bytearray()
+        self.__start  = 0
+        self.__scan   = 0
+        self.__parts  = []
+
+
+    def next_block(self):
+        """ Extract the next TL1 block, if available (None otherwise)
+            A tuple (marker, payload) is returned:
+            marker  : MARK_CONT or MARK_TERM
+            payload : block content after TL1 header separator (bytes, not decoded),
+                      None for blocks without a TL1 header
+        """
+        buffer = self.__buffer
+
+        match = self.BLOCK_END.search(buffer, self.__scan)
+        if match is None:
+            # the last byte could be the '\n' of a block end
+            self.__scan = max(self.__start, len(buffer) - 1)
+            return None
+
+        idx_end = match.end()
+        marker  = self.MARK_CONT if buffer[idx_end-1] == ord('>') else self.MARK_TERM
+
+        idx_hdr = buffer.find(b"\r\n\n", self.__start, idx_end)
+        if idx_hdr == -1:
+            payload = None
+        else:
+            payload = bytes(buffer[idx_hdr+3:idx_end])
+
+        self.__start = idx_end
+        self.__scan  = idx_end
+
+        # Release consumed data only when it is worth
+        if self.__start > 65536  and  self.__start * 2 > len(buffer):
+            del buffer[:self.__start]
+            self.__scan  = self.__scan - self.__start
+            self.__start = 0
+
+        return marker, payload
+
+
+    def next_message(self):
+        """ Extract the next complete TL1 message (continuation blocks are joined)
+            The decoded message is returned, or None if not yet available
+        """
+        while True:
+            block = self.next_block()
+            if block is None:
+                return None
+
+            marker, payload = block
+            if payload is None:
+                continue
+
+            self.__parts.append(payload)
+
+            if marker == self.MARK_CONT:
+                self.__parts.append(b"\n")
+                continue
+
+            message = self.join(self.__parts)
+            self.__parts = []
+
+            if message.strip() == ";":
+                continue
+
+            return message
+
+
+    @classmethod
+    def join(cls, parts):
+        """ Build a TL1 message from a list of block payloads (see next_block())
+            The message is decoded once, with CR/LF runs normalized
+        """
+        return str(cls.CRLF_RUN.sub(b"\r\n", b"".join(parts)), 'utf-8')
+
+
+    @classmethod
+    def get_ctag(cls, payload):
+        """ Return the CTAG of a command response block ('M' line), or None
+            payload : a block (bytes, see next_block()) or a message (string)
+        """
+        if isinstance(payload, str):
+            payload = payload.encode()
+
+        match = cls.CTAG.search(payload)
+        if match is None:
+            return None
+
+        return str(match.group(1), 'utf-8')
+
+
+    @staticmethod
+    def tag_cmd(cmd, ctag):
+        """ Replace (or insert) the CTAG field on a TL1 command
+            (VERB:TID:AID:CTAG:GENERAL_BLOCK:...)
+        """
+        fields = cmd.strip().rstrip(";").split(":")
+
+        while len(fields) < 4:
+            fields.append("")
+
+        fields[3] = ctag
+
+        return "{:s};".format(":".join(fields))
+
+
+
+class TL1EventLog():
+    """ TL1 Event collection file writer.
+        Each event is written as a compact JSON line:
+            {"MSG":{...coded TL1 message...},"TIME":receiving time}
+        Lines are buffered and flushed in batch; the file could be rotated by size
+    """
+
+    def __init__(self, event_file, max_size=0, backups=5, compress=False,
+                 flush_items=100, flush_time=1.0):
+        """ Constructor for Event Log
+            event_file  : file name
+            max_size    : (bytes) file size for rotation (0: no rotation)
+            backups     : number of rotated files kept (event_file.1 ... event_file.N)
+            compress    : True for gzip rotated files (event_file.1.gz ...)
+            flush_items : max number of buffered events
+            flush_time  : (seconds) max buffering time for an event
+        """
+        self.__file        = event_file
+        self.__max_size    = max_size
+        self.__backups     = backups
+        self.__compress    = compress
+        self.__flush_items = flush_items
+        self.__flush_time  = flush_time
+        self.__lock        = threading.Lock()
+        self.__buffer      = []             # pending lines
+        self.__last_flush  = time.time()
+
+        if os.path.isfile(self.__file):os.remove(self.__file)
+        self.__f = open(self.__file, "w")
+        os.chmod(self.__file, 0o666)
+
+
+    def write(self, msg, recv_time=None):
+        """ Append an event to log
+            msg       : TL1message instance
+            recv_time : receiving time (seconds since epoch - default: now)
+        """
+        if recv_time is None:
+            recv_time = time.time()
+
+        line = '{{"MSG":{:s},"TIME":{:.6f}}}\n'.format(msg.decode("JSONL"), recv_time)
+
+        with self.__lock:
+            if self.__f.closed:
+                return
+
+            self.__buffer.append(line)
+
+            if ( len(self.__buffer) >= self.__flush_items  or
+                 recv_time - self.__last_flush >= self.__flush_time ):
+                self.__flush()
+
+
+    def flush(self):
+        """ Write all buffered events on file
+        """
+        with self.__lock:
+            self.__flush()
+
+
+    def close(self):
+        """ Flush and close the event file
+        """
+        with self.__lock:
+            self.__flush()
+            self.__f.close()
+
+
+    def __flush(self):
+        """ INTERNAL USAGE
+        """
+        self.__last_flush = time.time()
+
+        if len(self.__buffer) == 0  or  self.__f.closed:
+            return
+
+        self.__f.write("".join(self.__buffer))
+        self.__f.flush()
+        self.__buffer = []
+
+        if self.__max_size > 0  and  self.__f.tell() >= self.__max_size:
+            self.__rotate()
+
+
+    def __rotate(self):
+        """ INTERNAL USAGE
+            event_file -> event_file.1 -> ... -> event_file.N
+        """
+        self.__f.close()
+
+        suffix = ".gz" if self.__compress else ""
+
+        for idx in range(self.__backups - 1, 0, -1):
+            src = "{:s}.{:d}{:s}".format(self.__file, idx, suffix)
+            if os.path.isfile(src):
+                os.replace(src, "{:s}.{:d}{:s}".format(self.__file, idx + 1, suffix))
+
+        rotated = "{:s}.1".format(self.__file)
+        os.replace(self.__file, rotated)
+
+        if self.__compress:
+            # Compression on background, in order to not delay the event collection
+            thread = threading.Thread(target=self.__gzip, args=(rotated,), name="TL1_Event_Gzip")
+            thread.daemon = False
+            thread.start()
+
+        self.__f = open(self.__file, "w")
+        os.chmod(self.__file, 0o666)
+
+
+    @staticmethod
+    def __gzip(file_name):
+        """ INTERNAL USAGE
+        """
+        with open(file_name, "rb") as f_in:
+            with gzip.open("{:s}.gz".format(file_name), "wb") as f_out:
+                shutil.copyfileobj(f_in, f_out)
+        os.remove(file_name)
+
+
+
+class TL1Transcript():
+    """ Compact binary transcript of TL1 byte streams (CMD and EVE connections).
+        The file starts with MAGIC, followed by a record for each chunk of data:
+            stream id (uint16), kind (1 char), time (double), length (uint32), data
+        Kinds: 'O' new connection (data: channel name, "CMD"/"EVE")
+               'S' data sent to equipment
+               'R' data received from equipment
+        Times are monotonic, in seconds from transcript start.
+    """
+    MAGIC  = b"KTL1TRC1"
+    RECORD = struct.Struct("<HcdI")
+
+    def __init__(self, transcript_file):
+        """ Open a transcript file for recording (an existing file is replaced)
+        """
+        self.__file   = transcript_file
+        self.__lock   = threading.Lock()
+        self.__start  = time.monotonic()
+        self.__stream = 0
+
+        self.__f = open(self.__file, "wb")
+        self.__f.write(self.MAGIC)
+
+
+    def open_stream(self, channel):
+        """ Register a new connection and return its stream id
+            channel : "CMD" / "EVE"
+        """
+        with self.__lock:
+            self.__stream = self.__stream + 1
+            stream = self.__stream
+
+        self.write(stream, "O", channel.encode())
+
+        return stream
+
+
+    def write(self, stream, kind, data):
+        """ Append a chunk of data of a stream
+            kind : 'S' (sent) / 'R' (received) / 'O' (new connection)
+        """
+        if len(data) == 0  and  kind != "O":
+            return
+
+        record = self.RECORD.pack(stream, kind.encode(), time.monotonic() - self.__start, len(data))
+
+        with self.__lock:
+            if not self.__f.closed:
+                self.__f.write(record + data)
+
+
+    def flush(self):
+        """ Write the buffered records on file
+        """
+        with self.__lock:
+            if not self.__f.closed:
+                self.__f.flush()
+
+
+    def close(self):
+        """ Flush and close the transcript file
+        """
+        with self.__lock:
+            self.__f.close()
+
+
+    @classmethod
+    def read(cls, transcript_file):
+        """ Yield all records of a transcript file as tuples (stream, kind, time, data)
+        """
+        with open(transcript_file, "rb") as f_in:
+            if f_in.read(len(cls.MAGIC)) != cls.MAGIC:
+                raise ValueError("{:s}: not a TL1 transcript".format(transcript_file))
+
+            while True:
+                header = f_in.read(cls.RECORD.size)
+                if len(header) < cls.RECORD.size:
+                    return
+
+                stream, kind, rec_time, length = cls.RECORD.unpack(header)
+
+                yield stream, kind.decode(), rec_time, f_in.read(length)
+
+
+    @classmethod
+    def load(cls, transcript_file):
+        """ Return the streams of a transcript file, in opening order, as a list of
+            tuples (channel, records); records is the list of (kind, time, data) of stream
+        """
+        streams = collections.OrderedDict()
+
+        for stream, kind, rec_time, data in cls.read(transcript_file):
+            if kind == "O":
+                streams[stream] = (data.decode(), [])
+            elif stream in streams:
+                streams[stream][1].append((kind, rec_time, data))
+
+        return list(streams.values())
 
 
 
 class TL1EventScan():
     """ TL1 Event collection scan
+        Post-run queries on an event collector file (see TL1EventLog), without loading it.
+        The file is memory mapped; receiving time, AID, Condition Type and message code of
+        each event are kept on a sidecar index file (event_file + ".idx"), built on first
+        open and extended with the events appended later (see refresh()).
+        Only events matching a query are decoded.
+        Index file layout:
+            MAGIC, crc32 and length of the first line of event file (uint32, uint32)
+            one or more blocks, one for each index update:
+                number of records (uint32), length of new names (uint32), indexed size
+                of event file (uint64), new names (utf-8, '\\n' separated), records
+            record: offset (uint64), length (uint32), time (double), AID, Condition Type
+                    and message code (uint32 name ids, NONE_ID if missing)
     """
+    MAGIC   = b"KTL1IDX1"
+    HEADER  = struct.Struct("<II")
+    BLOCK   = struct.Struct("<IIQ")
+    RECORD  = struct.Struct("<QIdIII")
+    NONE_ID = 0xFFFFFFFF
+    PREFIX  = 4096              # max length of first line, for event file identity
 
     def __init__(self, event_file):
         """ Constructor for Event Scanner
+            event_file : event collector file (not compressed)
+        """
+        self.__file    = event_file
+        self.__index   = "{:s}.idx".format(event_file)
+        self.__f       = None       # event file
+        self.__mm      = None       # event file map (None for empty file)
+        self.__prefix  = None       # (crc32, length) of first line of event file
+        self.__end     = 0          # indexed size of event file
+        self.__names   = []         # name id -> name (AID, Condition Type, message code)
+        self.__ids     = {}         # name -> name id
+        self.__offset  = array.array('Q')   # record -> offset of event line
+        self.__length  = array.array('I')   # record -> length of event line
+        self.__time    = array.array('d')   # record -> receiving time
+        self.__aid     = array.array('I')   # record -> AID id
+        self.__cond    = array.array('I')   # record -> Condition Type id
+        self.__code    = array.array('I')   # record -> message code id
+        self.__by_name = {}         # name id -> records with this AID / Condition Type / code
+        self.__sorted  = True       # True if receiving times are not decreasing
+
+        self.__f = open(self.__file, "rb")
+
+        if not self.__load():
+            self.__reset()
+            self.__write_index(self.__scan(), rewrite=True)
+        else:
+            self.refresh()
+
+
+    def refresh(self):
+        """ Map the events appended to event file after the latest update, extending the
+            index (a replaced event file is indexed again from scratch).
+            The number of new events is returned
+        """
+        if not self.__same_file():
+            self.__reset()
+            return self.__write_index(self.__scan(), rewrite=True)
+
+        return self.__write_index(self.__scan(), rewrite=False)
+
+
+    def close(self):
+        """ Release the event file
+        """
+        if self.__mm is not None:
+            self.__mm.close()
+            self.__mm = None
+
+        self.__f.close()
+
+
+    def size(self):
+        """ Return the number of indexed events
+        """
+        return len(self.__offset)
+
+
+    def get_names(self, kind="AID"):
+        """ Return a dictionary name -> number of events, for kind:
+            "AID" (event AID) / "COND" (Condition Type) / "CODE" (message code)
+        """
+        column = {"AID": self.__aid, "COND": self.__cond, "CODE": self.__code}[kind]
+
+        return { self.__names[name_id] : counter
+                    for name_id,counter in collections.Counter(column).items()
+                        if name_id != self.NONE_ID }
+
+
+    def count(self, since=None, until=None, aid=None, cond=None, code=None):
+        """ Return the number of events matching all specified criteria (see events()),
+            without decoding them
+        """
+        return len(self.__select(since, until, aid, cond, code))
+
+
+    def iter_events(self, since=None, until=None, aid=None, cond=None, code=None):
+        """ Yield a tuple (receiving time, TL1message) for each event matching all specified
+            criteria (see events()), in file order. Events are decoded while iterating
+        """
+        for rec in self.__select(since, until, aid, cond, code):
+            yield self.__time[rec], self.__decode(rec)
+
+
+    def events(self, since=None, until=None, aid=None, cond=None, code=None):
+        """ Return the list of events (TL1message instances) matching all specified
+            criteria, in file order (see TL1EventStore.events())
+            since : receiving time lower bound (seconds since epoch, included)
+            until : receiving time upper bound (seconds since epoch, excluded)
+            aid   : AID of event
+            cond  : Condition Type of event (i.e. "ABNORMAL")
+            code  : Message code ("*C" / "**" / "*" / "A")
+        """
+        return [self.__decode(rec) for rec in self.__select(since, until, aid, cond, code)]
+
+
+    def evaluate(self, check, since=None, until=None, cond=None, code=None,
+                 pst='OR', sst='OR', fld='OR'):
+        """ Perform a filter check (TL1check instance) on events received in a time range
+            (see events() and TL1check.evaluate_event()). AID, Condition Type and code
+            filters are evaluated on index: only remaining events are decoded.
+            A list of tuples (receiving time, TL1message, match_list) is returned, in
+            file order
+        """
+        decoded = {}
+
+        def get_msg(rec):
+            decoded[rec] = self.__decode(rec)
+            return decoded[rec]
+
+        result = check.evaluate_columns(self.__names, self.__aid, self.__cond, self.__code, get_msg,
+                                        rows=self.__select(since, until, None, None, None),
+                                        pst=pst, sst=sst, fld=fld, cond=cond, code=code)
+
+        return [(self.__time[rec], decoded[rec], match_list) for rec, _, match_list in result]
+
+
+    def __select(self, since, until, aid, cond, code):
+        """ INTERNAL USAGE
+            Return the list of records matching all criteria (without decoding events)
+        """
+        keys = []
+        for name, column in ((aid, self.__aid), (cond, self.__cond), (code, self.__code)):
+            if name is not None:
+                name_id = self.__ids.get(name)
+                if name_id is None:
+                    return []
+                keys.append((name_id, column))
+
+        # smallest candidate list: records of a name, or all records
+        candidates = range(len(self.__offset))
+        for name_id, _ in keys:
+            if len(self.__by_name[name_id]) < len(candidates):
+                candidates = self.__by_name[name_id]
+
+        if self.__sorted:
+            # time range on sorted records: bisect on candidates
+            if since is not None:
+                first = bisect.bisect_left(self.__time, since)
+                candidates = candidates[bisect.bisect_left(candidates, first):]
+            if until is not None:
+                last = bisect.bisect_left(self.__time, until)
+                candidates = candidates[:bisect.bisect_left(candidates, last)]
+            since = until = None
+
+        result = []
+        for rec in candidates:
+            if since is not None  and  self.__time[rec] < since:
+                continue
+            if until is not None  and  self.__time[rec] >= until:
+                continue
+            if all(column[rec] == name_id for name_id, column in keys):
+                result.append(rec)
+
+        return result
+
+
+    def __decode(self, rec):
+        """ INTERNAL USAGE
+            Build the TL1message of a record
+        """
+        start = self.__offset[rec]
+        entry = json.loads(self.__mm[start:start + self.__length[rec]].decode())
+
+        return TL1message.from_coded(entry["MSG"])
+
+
+    def __scan(self):
+        """ INTERNAL USAGE
+            Map the event file and index its complete lines after the indexed size.
+            Return the list of new records (offset, length, time, AID, Condition Type, code)
+        """
+        if self.__mm is not None:
+            self.__mm.close()
+            self.__mm = None
+
+        file_size = os.fstat(self.__f.fileno()).st_size
+        if file_size == 0:
+            return []
+
+        self.__mm = mmap.mmap(self.__f.fileno(), file_size, access=mmap.ACCESS_READ)
+
+        records = []
+        start   = self.__end
+
+        while True:
+            end = self.__mm.find(b"\n", start)
+            if end == -1:
+                break
+
+            try:
+                entry = json.loads(self.__mm[start:end].decode())
+                msg   = TL1message.from_coded(entry["MSG"])
+                records.append((start, end - start, float(entry["TIME"]),
+                                msg.get_eve_aid(), msg.get_eve_cond(), msg.get_message_code()))
+            except (ValueError, KeyError, TypeError):
+                pass    # not an event line (i.e. truncated by a crash)
+
+            start = end + 1
+
+        if self.__prefix is None  and  start > 0:
+            first = self.__mm.find(b"\n", 0, self.PREFIX)
+            first = self.PREFIX if first == -1 else first
+            self.__prefix = (zlib.crc32(self.__mm[:first]), first)
+
+        self.__end = start
+
+        return records
+
+
+    def __write_index(self, records, rewrite):
+        """ INTERNAL USAGE
+            Add new records to memory index and to index file (as a new block).
+            Return the number of added records
+        """
+        new_names = []
+        packed    = []
+
+        for offset, length, recv_time, aid, cond, code in records:
+            ids = []
+            for name in (aid, cond, code):
+                if name is None:
+                    ids.append(self.NONE_ID)
+                    continue
+                name_id = self.__ids.get(name)
+                if name_id is None:
+                    name_id = len(self.__names)
+                    self.__names.append(name)
+                    self.__ids[name] = name_id
+                    new_names.append(name)
+                ids.append(name_id)
+            self.__add(offset, length, recv_time, ids[0], ids[1], ids[2])
+            packed.append(self.RECORD.pack(offset, length, recv_time, ids[0], ids[1], ids[2]))
+
+        if self.__prefix is None:
+            return len(records)
+
+        names = "\n".join(new_names).encode()
+
+        try:
+            with open(self.__index, "wb" if rewrite else "ab") as f_idx:
+                if rewrite:
+                    f_idx.write(self.MAGIC + self.HEADER.pack(*self.__prefix))
+                f_idx.write(self.BLOCK.pack(len(packed), len(names), self.__end))
+                f_idx.write(names)
+                f_idx.write(b"".join(packed))
+        except OSError:
+            pass    # index file not writable - memory index only
+
+        return len(records)
+
+
+    def __load(self):
+        """ INTERNAL USAGE
+            Load the index file. Return False if missing, not valid or built for another
+            event file (memory index is then undefined)
+        """
+        try:
+            with open(self.__index, "rb") as f_idx:
+                data = f_idx.read()
+        except OSError:
+            return False
+
+        size = len(self.MAGIC) + self.HEADER.size
+        if len(data) < size  or  data[:len(self.MAGIC)] != self.MAGIC:
+            return False
+
+        self.__prefix = self.HEADER.unpack_from(data, len(self.MAGIC))
+
+        pos = size
+        while pos + self.BLOCK.size <= len(data):
+            n_records, names_len, end = self.BLOCK.unpack_from(data, pos)
+            pos = pos + self.BLOCK.size
+
+            if pos + names_len + n_records * self.RECORD.size > len(data):
+                return False    # truncated block
+
+            if names_len > 0:
+                try:
+                    names = data[pos:pos + names_len].decode().split("\n")
+                except UnicodeDecodeError:
+                    return False
+                for name in names:
+                    self.__ids[name] = len(self.__names)
+                    self.__names.append(name)
+            pos = pos + names_len
+
+            block = data[pos:pos + n_records * self.RECORD.size]
+            for record in self.RECORD.iter_unpack(block):
+                self.__add(*record)
+            pos = pos + len(block)
+
+            self.__end = end
+
+        if pos != len(data):
+            return False    # truncated block header
+
+        return self.__same_file()
+
+
+    def __same_file(self):
+        """ INTERNAL USAGE
+            True if the event file is the indexed one (same first line, not shorter)
+        """
+        if self.__prefix is None:
+            return self.__end == 0
+
+        crc, length = self.__prefix
+
+        file_size = os.fstat(self.__f.fileno()).st_size
+        if file_size < self.__end  or  file_size < length:
+            return False
+
+        self.__f.seek(0)
+        return zlib.crc32(self.__f.read(length)) == crc
+
+
+    def __add(self, offset, length, recv_time, aid_id, cond_id, code_id):
+        """ INTERNAL USAGE
+        """
+        rec = len(self.__offset)
+
+        if rec > 0  and  recv_time < self.__time[-1]:
+            self.__sorted = False
+
+        self.__offset.append(offset)
+        self.__length.append(length)
+        self.__time.append(recv_time)
+        self.__aid.append(aid_id)
+        self.__cond.append(cond_id)
+        self.__code.append(code_id)
+
+        for name_id in (aid_id, cond_id, code_id):
+            if name_id != self.NONE_ID:
+                try:
+                    self.__by_name[name_id].append(rec)
+                except KeyError:
+                    self.__by_name[name_id] = array.array('I', [rec])
+
+
+    def __reset(self):
+        """ INTERNAL USAGE
+            Discard the memory index
+        """
+        self.__prefix  = None
+        self.__end     = 0
+        self.__names   = []
+        self.__ids     = {}
+        self.__offset  = array.array('Q')
+        self.__length  = array.array('I')
+        self.__time    = array.array('d')
+        self.__aid     = array.array('I')
+        self.__cond    = array.array('I')
+        self.__code    = array.array('I')
+        self.__by_name = {}
+        self.__sorted  = True
+
+
+
+class TL1ResponseCache():
+    """ Cache of TL1 retrieve command responses, keyed by normalized command.
+        Entries expire after a time-to-live; the least recently used entries are
+        discarded when the cache is full.
+        Entries are invalidated by AID: an AID overlaps a cached command when
+        their locations (the AID without the entity type, i.e. "1-1-18" for
+        "MDL-1-1-18") are equal or one of them contains the other.
+    """
+
+    def __init__(self, ttl=10, size=256):
+        """ Constructor for Response Cache
+            ttl  : (seconds) time-to-live of each entry
+            size : max number of entries
+        """
+        self.__ttl     = ttl
+        self.__size    = size
+        self.__lock    = threading.Lock()
+        self.__entries = collections.OrderedDict()  # key -> (expire time, response, locations)
+        self.__hits    = 0
+        self.__misses  = 0
+        self.__invalid = 0
+
+
+    def get(self, cmd):
+        """ Return the cached response for specified command, or None
+        """
+        key = self.get_key(cmd)
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+
+            if entry is None  or  entry[0] < time.time():
+                if entry is not None:
+                    del self.__entries[key]
+                self.__misses = self.__misses + 1
+                return None
+
+            self.__entries.move_to_end(key)
+            self.__hits = self.__hits + 1
+
+            return entry[1]
+
+
+    def put(self, cmd, response):
+        """ Store the response of specified command
+        """
+        key = self.get_key(cmd)
+
+        entry = (time.time() + self.__ttl, response, self.get_locations(self.get_aid(cmd)))
+
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+
+            while len(self.__entries) > self.__size:
+                self.__entries.popitem(last=False)
+
+
+    def invalidate(self, aid=None):
+        """ Remove all entries overlapping the specified AID (None: all entries)
+        """
+        if aid is None:
+            locations = None
+        else:
+            locations = self.get_locations(aid)
+
+        with self.__lock:
+            if locations is None:
+                self.__invalid = self.__invalid + len(self.__entries)
+                self.__entries.clear()
+                return
+
+            for key in [k for k,e in self.__entries.items()
+                                    if self.__is_overlapped(e[2], locations)]:
+                del self.__entries[key]
+                self.__invalid = self.__invalid + 1
+
+
+    def stats(self):
+        """ Return a dictionary with cache counters:
+            "hits", "misses", "invalidated" (number of entries) and "entries" (current size)
+        """
+        with self.__lock:
+            return { "hits"        : self.__hits,
+                     "misses"      : self.__misses,
+                     "invalidated" : self.__invalid,
+                     "entries"     : len(self.__entries) }
+
+
+    @staticmethod
+    def get_key(cmd):
+        """ Return the normalized form of a TL1 command (upper case, no blanks, no CTAG)
         """
-        self.__file = event_file
+        fields = "".join(cmd.split()).rstrip(";").upper().split(":")
+
+        if len(fields) > 3:
+            fields[3] = ""
+
+        return ":".join(fields).rstrip(":")
+
+
+    @staticmethod
+    def get_aid(cmd):
+        """ Return the AID field of a TL1 command (VERB:TID:AID:CTAG:...)
+        """
+        fields = cmd.strip().rstrip(";").split(":")
+
+        if len(fields) < 3:
+            return ""
+
+        return fields[2].strip()
+
+
+    @staticmethod
+    def get_locations(aid):
+        """ Return the list of locations (tuples) of an AID field
+            None is returned for AIDs matching any location ("", "ALL", ranges)
+            (i.e. "MDL-1-1-1&-18" -> [("1","1","1"), ("1","1","18")])
+        """
+        if aid == ""  or  aid.upper().find("ALL") != -1  or  aid.find("&&") != -1:
+            return None
+
+        locations = []
+
+        for item in aid.split("&"):
+            words = item.split("-")
+            if item.startswith("-")  and  len(locations) > 0:
+                # Short form: replace the last components of previous AID
+                base = locations[-1]
+                comps = tuple(words[1:])
+                locations.append(base[:max(len(base) - len(comps), 0)] + comps)
+            else:
+                locations.append(tuple(words[1:]))
+
+        return locations
+
+
+    @staticmethod
+    def __is_overlapped(loc_a, loc_b):
+        """ INTERNAL USAGE
+        """
+        if loc_a is None  or  loc_b is None:
+            return True
+
+        for elem_a in loc_a:
+            for elem_b in loc_b:
+                depth = min(len(elem_a), len(elem_b))
+                if elem_a[:depth] == elem_b[:depth]:
+                    return True
+
+        return False
+
+
+
+class TL1EventStore():
+    """ Bounded in-memory store of TL1 autonomous messages, indexed by
+        AID, condition type, message code and receiving time
+    """
+
+    def __init__(self, max_events=10000):
+        """ Constructor for Event Store
+            max_events : max number of stored events (the oldest ones are discarded)
+        """
+        self.__lock     = threading.Lock()
+        self.__max      = max_events
+        self.__seq      = 0     # sequence number of next event
+        self.__first    = 0     # sequence number of oldest available event
+        self.__events   = []    # list of (time, seq, TL1message), ordered by time
+        self.__by_aid   = {}    # AID            -> list of (time, seq, TL1message)
+        self.__by_cond  = {}    # Condition Type -> list of (time, seq, TL1message)
+        self.__by_code  = {}    # Message code   -> list of (time, seq, TL1message)
+
+
+    def add(self, msg, recv_time=None):
+        """ Store an autonomous message
+            msg       : TL1message instance
+            recv_time : receiving time (seconds since epoch - default: now)
+        """
+        if recv_time is None:
+            recv_time = time.time()
+
+        with self.__lock:
+            entry = (recv_time, self.__seq, msg)
+            self.__seq = self.__seq + 1
+
+            self.__events.append(entry)
+            self.__index(self.__by_aid,  msg.get_eve_aid(),      entry)
+            self.__index(self.__by_cond, msg.get_eve_cond(),     entry)
+            self.__index(self.__by_code, msg.get_message_code(), entry)
+
+            if len(self.__events) > self.__max:
+                self.__purge()
+
+
+    def events(self, since=None, until=None, aid=None, cond=None, code=None):
+        """ Return the list of stored events (TL1message instances) matching all
+            specified criteria, ordered by receiving time
+            since : receiving time lower bound (seconds since epoch, included)
+            until : receiving time upper bound (seconds since epoch, excluded)
+            aid   : AID of event
+            cond  : Condition Type of event (i.e. "ABNORMAL")
+            code  : Message code ("*C" / "**" / "*" / "A")
+        """
+        with self.__lock:
+            candidates = self.__events
+            for key, index in ((aid, self.__by_aid), (cond, self.__by_cond), (code, self.__by_code)):
+                if key is not None:
+                    key_list = index.get(key, [])
+                    if len(key_list) < len(candidates):
+                        candidates = key_list
+
+            start = 0
+            if since is not None:
+                start = bisect.bisect_left(candidates, (since,))
+
+            end = len(candidates)
+            if until is not None:
+                end = bisect.bisect_left(candidates, (until,))
+
+            result = []
+            for _, seq, msg in candidates[start:end]:
+                if seq < self.__first:
+                    continue
+                if aid is not None  and  msg.get_eve_aid() != aid:
+                    continue
+                if cond is not None  and  msg.get_eve_cond() != cond:
+                    continue
+                if code is not None  and  msg.get_message_code() != code:
+                    continue
+                result.append(msg)
+
+        return result
+
+
+    def size(self):
+        """ Return the number of stored events
+        """
+        return len(self.__events)
+
+
+    def clear(self):
+        """ Remove all stored events
+        """
+        with self.__lock:
+            self.__first   = self.__seq
+            self.__events  = []
+            self.__by_aid  = {}
+            self.__by_cond = {}
+            self.__by_code = {}
+
+
+    @staticmethod
+    def __index(index, key, entry):
+        """ INTERNAL USAGE
+        """
+        if key is None:
+            return
+
+        try:
+            index[key].append(entry)
+        except KeyError:
+            index[key] = [entry]
+
+
+    def __purge(self):
+        """ INTERNAL USAGE
+            Discard the oldest events (a quarter of store) and compact the indexes
+        """
+        n_drop = max(len(self.__events) - self.__max, self.__max // 4)
+
+        self.__events = self.__events[n_drop:]
+        self.__first  = self.__events[0][1]
+
+        for index in (self.__by_aid, self.__by_cond, self.__by_code):
+            for key in list(index.keys()):
+                key_list = index[key]
+                idx = 0
+                while idx < len(key_list)  and  key_list[idx][1] < self.__first:
+                    idx = idx + 1
+                if idx == len(key_list):
+                    del index[key]
+                elif idx > 0:
+                    index[key] = key_list[idx:]
+
+
+
+class TL1AlarmMirror():
+    """ Table of active conditions (AID, Condition Type) of an equipment, seeded by a
+        RTRV-COND response and kept current by autonomous messages:
+        - REPT ALM : raised, or cleared by notification code "CL"
+        - REPT EVT : raised by condition effect "SC" (standing condition), cleared by "CL"
+                     (transient conditions are ignored)
+        Applied events are kept for JOURNAL seconds: a seed re-applies the events received
+        after the RTRV-COND command was sent, so no raise/clear is lost while waiting for
+        the response. Thread safe: callers could wait for a condition change.
+    """
+    JOURNAL  = 600      # (seconds) max age of journal entries
+
+    # "AID[,AIDTYPE]:NTFCNCDE,CONDTYPE,SRVEFF,..." rows of a RTRV-COND response
+    COND_ROW = re.compile(r'^\s*"([^,:"]*)(?:,[^:"]*)?:([^,:"]*),([^,:"]*),?([^,:"]*)', re.MULTILINE)
+
+    def __init__(self):
+        self.__cond    = threading.Condition()          # protect table, wake up waiters
+        self.__active  = {}     # (AID, Condition Type) -> (notification code, service effect, time)
+        self.__journal = collections.deque()            # (time, key, entry or None for clear)
+        self.__seeded  = None   # time of latest seed
+        self.__raised  = 0      # conditions raised by events
+        self.__cleared = 0      # conditions cleared by events
+        self.__drift   = 0      # differences found by seeds (except the first one)
+
+
+    def seed(self, tl1_response, since=None, seed_time=None):
+        """ Replace the table with the conditions of a RTRV-COND successful response
+            tl1_response : the response (ASCII)
+            since        : sending time of RTRV-COND command: the events received after it
+                           are applied again (None: no one)
+            seed_time    : time of seed (seconds since epoch - default: now)
+            The number of conditions differing from the previous table is returned
+            (0 for the first seed)
+        """
+        if seed_time is None:
+            seed_time = time.time()
+
+        table = {}
+        for match in self.COND_ROW.finditer(tl1_response):
+            the_aid, ntfcncde, cond, srveff = match.groups()
+            table[(the_aid, cond)] = (ntfcncde, srveff, seed_time)
+
+        with self.__cond:
+            if since is not None:
+                for recv_time, key, entry in self.__journal:
+                    if recv_time >= since:
+                        if entry is None:
+                            table.pop(key, None)
+                        else:
+                            table[key] = entry
+
+            drift = 0
+            if self.__seeded is not None:
+                drift = len(table.keys() ^ self.__active.keys())
+                self.__drift = self.__drift + drift
+
+            self.__active = table
+            self.__seeded = seed_time
+            self.__cond.notify_all()
+
+        return drift
+
+
+    def apply(self, msg, recv_time=None):
+        """ Update the table with an autonomous message (TL1message instance)
+            recv_time : receiving time (seconds since epoch - default: now)
+            True is returned if the table is changed
+        """
+        eve_type = msg.get_eve_type()
+        the_body = msg.get_eve_body()
+
+        if eve_type is None  or  the_body is None  or  len(the_body) < 2:
+            return False
+
+        if eve_type.startswith("REPT ALM"):
+            ntfcncde = the_body[0]
+            key      = (msg.get_eve_aid(), the_body[1])
+            srveff   = the_body[2] if len(the_body) > 2 else ""
+        elif eve_type.startswith("REPT EVT")  and  the_body[1] in ("SC", "CL"):
+            ntfcncde = "NR" if the_body[1] == "SC" else "CL"
+            key      = (msg.get_eve_aid(), the_body[0])
+            srveff   = ""
+        else:
+            return False
+
+        if recv_time is None:
+            recv_time = time.time()
+
+        entry = None if ntfcncde == "CL" else (ntfcncde, srveff, recv_time)
+
+        with self.__cond:
+            self.__journal.append((recv_time, key, entry))
+            while self.__journal[0][0] < recv_time - self.JOURNAL:
+                self.__journal.popleft()
+
+            if entry is None:
+                if self.__active.pop(key, None) is None:
+                    return False
+                self.__cleared = self.__cleared + 1
+            else:
+                if key not in self.__active:
+                    self.__raised = self.__raised + 1
+                self.__active[key] = entry
+
+            self.__cond.notify_all()
+
+        return True
+
+
+    def is_active(self, aid, cond=None):
+        """ True if the condition is active on AID (cond=None: any condition)
+        """
+        with self.__cond:
+            return self.__is_active(aid, cond)
+
+
+    def wait(self, aid, cond=None, active=True, timeout=None):
+        """ Wait until the condition is active (or not active) on AID
+            cond    : Condition Type (None: any condition)
+            active  : True for waiting a raise, False for waiting a clear
+            timeout : (seconds) max waiting time (None: forever)
+            False is returned on timeout
+        """
+        end_time = None if timeout is None else time.time() + timeout
+
+        with self.__cond:
+            while self.__is_active(aid, cond) != active:
+                if end_time is None:
+                    self.__cond.wait()
+                    continue
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    return False
+                self.__cond.wait(remaining)
+
+        return True
+
+
+    def get_active(self, aid=None):
+        """ Return the list of active conditions (on specified AID, if any), sorted, as
+            tuples (AID, Condition Type, notification code, service effect)
+        """
+        with self.__cond:
+            return sorted( (key[0], key[1], entry[0], entry[1])
+                                for key,entry in self.__active.items()
+                                    if aid is None  or  key[0] == aid )
+
+
+    def stats(self):
+        """ Return a dictionary with mirror counters:
+            "active" (current conditions), "raised" and "cleared" (by events),
+            "drift" (differences found by seeds) and "seeded" (time of latest seed)
+        """
+        with self.__cond:
+            return { "active"  : len(self.__active),
+                     "raised"  : self.__raised,
+                     "cleared" : self.__cleared,
+                     "drift"   : self.__drift,
+                     "seeded"  : self.__seeded }
+
+
+    def __is_active(self, aid, cond):
+        """ INTERNAL USAGE
+        """
+        if cond is not None:
+            return (aid, cond) in self.__active
+
+        for key in self.__active:
+            if key[0] == aid:
+                return True
+
+        return False
+
 
 
 class TL1check():
     """ TL1 Message Scanner
+        Filters are compiled before evaluation (see compile()): the cost of evaluation
+        for each AID doesn't depend on the number of filters
     """
+    AID_REGEX = re.compile(r"[.^$*+?{}\[\]\\|()]")     # an AID filter with these chars is a RE
 
     def __init__(self):
         """ Constructor for a TL1 Scanner
@@ -34,7 +1243,14 @@ class TL1check():
         self.__aid_l = []   # List of AID (could be contains Regular Expression)
         self.__pst_l = []   # List of values for Primary State to search on a TL1 Message
         self.__sst_l = []   # List of values for Secondary State to search on a TL1 Message
-        self.__fld_l = {}   # Dictionary of <ATTR,VALUE> couple to search on a TL1 Message
+        self.__fld_l = {}   # Dictionary of <ATTR,list of VALUE> to search on a TL1 Message
+
+        self.__compiled = False     # False if filters are changed after compile()
+        self.__c_aid    = None      # frozenset of plain AID filters
+        self.__c_aid_re = None      # single Regular Expression for AID patterns (None: no patterns)
+        self.__c_pst    = None      # frozenset of Primary State values
+        self.__c_sst    = None      # frozenset of Secondary State values
+        self.__c_fld    = None      # dictionary ATTR -> frozenset of VALUE
 
 
     def add_field(self, attr, value):
@@ -42,11 +1258,8 @@ class TL1check():
             an ATTR calling this method with different VALUE
             Please note: a Positional value is a Named value with ATTR := position
         """
-        self.__fld_l[attr] = value
-        #try:
-            #self.__fld_l[attr].append(value)
-        #except KeyError:
-            #self.__fld_l[attr] = [value]
+        self.__fld_l.setdefault(attr, []).append(value)
+        self.__compiled = False
 
 
     def res_field(self, attr=None, value=None):
@@ -62,11 +1275,16 @@ class TL1check():
             else:
                 self.__fld_l.pop(attr)
 
+        self.__compiled = False
+
 
     def add_aid(self, aid):
         """ Insert an AID filter.
+            An AID containing Regular Expression chars (i.e. "MVC4-1-1-36-.*") is a pattern,
+            matching the whole AID
         """
         self.__aid_l.append(aid)
+        self.__compiled = False
 
 
     def res_aid(self, aid=None):
@@ -77,11 +1295,30 @@ class TL1check():
         else:
             self.__aid_l.remove(aid)
 
+        self.__compiled = False
+
+
+    def get_aid_list(self):
+        """ Return the list of AID filters
+        """
+        return list(self.__aid_l)
+
+
+    def match_aid(self, aid):
+        """ Return True if specified AID satisfies the AID filters
+            (always True if no AID filter is specified)
+        """
+        if not self.__compiled:
+            self.compile()
+
+        return self.__evaluate_aid(aid)
+
 
     def add_pst(self, pst):
         """ Add a PRIMARY STATE value
         """
         self.__pst_l.append(pst)
+        self.__compiled = False
 
 
     def res_pst(self, pst=None):
@@ -92,11 +1329,14 @@ class TL1check():
         else:
             self.__pst_l.remove(pst)
 
+        self.__compiled = False
+
 
     def add_sst(self, sst):
         """ Add a SECONDARY STATE value
         """
         self.__sst_l.append(sst)
+        self.__compiled = False
 
 
     def res_sst(self, sst=None):
@@ -107,6 +1347,35 @@ class TL1check():
         else:
             self.__sst_l.remove(sst)
 
+        self.__compiled = False
+
+
+    def compile(self):
+        """ Prepare the filters for evaluation (called by evaluate_xxx() methods after any
+            filter change, it could be called in advance)
+            Plain AIDs, Primary and Secondary States are kept on sets, AID patterns are
+            joined on a single Regular Expression, fields on a dictionary ATTR -> set of
+            VALUE. A wrong AID pattern raises re.error
+            The instance is returned
+        """
+        plain_l = []
+        regex_l = []
+        for aid in self.__aid_l:
+            if self.AID_REGEX.search(aid):
+                regex_l.append("(?:{:s})".format(aid))
+            else:
+                plain_l.append(aid)
+
+        self.__c_aid    = frozenset(plain_l)
+        self.__c_aid_re = re.compile("|".join(regex_l)) if len(regex_l) > 0 else None
+        self.__c_pst    = frozenset(self.__pst_l)
+        self.__c_sst    = frozenset(self.__sst_l)
+        self.__c_fld    = { attr : frozenset(values) for attr,values in self.__fld_l.items()
+                                                     if len(values) > 0 }
+        self.__compiled = True
+
+        return self
+
 
     def evaluate_msg(self, msg, pst='OR', sst='OR', fld='OR'):
         """ Perform a filter check on supplied TL1 encoded message
@@ -130,10 +1399,21 @@ class TL1check():
                 | General rule (after FILTERS evaluation) |
                 |     AID  &&  PST  &&  SST  &&  FLD      |
                 +-----------------------------------------+
+            Inner rules:
+                OR  : at least one filter value is found (PST, SST), or at least one
+                      filter ATTR has one of its VALUEs (FLD)
+                AND : all filter values are found (PST, SST), or all filter ATTRs have
+                      one of their VALUEs (FLD)
             NOTE:
             if any Filter class isn't specified, its contribution is always TRUE
+            For spontaneous messages, see evaluate_event()
         """
-        result = False
+        if not self.__compiled:
+            self.compile()
+
+        # TL1 spontaneous message scenario
+        if msg.get_cmd_status() == (False, None):
+            return self.evaluate_event(msg, pst=pst, sst=sst, fld=fld)
 
         result_list = {}
 
@@ -145,31 +1425,29 @@ class TL1check():
                 if not self.__evaluate_aid(the_aid):
                     continue
 
-                match_list = []
-
-                match_pst = self.__evaluate_pst(msg.get_cmd_pst(the_aid), rule=pst)
-                match_sst = self.__evaluate_sst(msg.get_cmd_sst(the_aid), rule=sst)
-
-                if match_pst[0] and match_sst[0]:
-
-                    #print("messaggio := {}".format(msg.get_cmd_attr_values(the_aid)))
-                    #print(" da filtr := {}".format(self.__fld_l))
-
-                    for the_attr,the_val in msg.get_cmd_attr_values(the_aid).items():
+                match_pst = self.__evaluate_states(self.__c_pst, msg.get_cmd_pst(the_aid), pst)
+                if not match_pst[0]:
+                    continue
 
-                        match_attr_val = self.__evaluate_attr_val(the_attr, the_val, rule=fld)
+                match_sst = self.__evaluate_states(self.__c_sst, msg.get_cmd_sst(the_aid), sst)
+                if not match_sst[0]:
+                    continue
 
-                        if match_attr_val[0]:
-                            match_list.append(match_attr_val[1])
+                if len(self.__c_fld) > 0:
+                    match_fld = self.__evaluate_fields(msg.get_cmd_attr_values(the_aid), fld)
+                    if not match_fld[0]:
+                        continue
+                    match_list = match_fld[1]
+                else:
+                    match_list = []
 
-                    if match_pst[1] != {}:
-                        match_list.append(match_pst[1])
+                if match_pst[1] != {}:
+                    match_list.append(match_pst[1])
 
-                    if match_sst[1] != {}:
-                        match_list.append(match_sst[1])
+                if match_sst[1] != {}:
+                    match_list.append(match_sst[1])
 
-                if match_list != []:
-                    result_list[the_aid] = match_list
+                result_list[the_aid] = match_list
 
             result = (len(result_list) > 0)
 
@@ -180,76 +1458,453 @@ class TL1check():
         return False,None
 
 
+    def evaluate_event(self, msg, pst='OR', sst='OR', fld='OR'):
+        """ Perform a filter check on supplied TL1 spontaneous message (see evaluate_msg())
+            The AID filter is applied to event AID; PST and SST filters are applied to
+            the values of event body; field filters are applied to <ATTR,VALUE> items of
+            event body (for positional items, ATTR is the position, starting from 1)
+            A tuple <True/False, result_list> is returned.
+        """
+        if not self.__compiled:
+            self.compile()
+
+        the_aid = msg.get_eve_aid()
+        if the_aid is None:
+            return False, None
+
+        if not self.__evaluate_aid(the_aid):
+            return False, None
+
+        return self.__evaluate_body(msg, the_aid, pst, sst, fld)
+
+
+    def evaluate_batch(self, events, pst='OR', sst='OR', fld='OR', cond=None, code=None):
+        """ Perform a filter check on a batch of TL1 messages
+            events : list of TL1message instances, structured messages (see
+                     TL1message.from_coded()) or event collector lines loaded from JSON
+                     ({"MSG":..., "TIME":...})
+            cond   : Condition Type (or list of) required for spontaneous messages
+            code   : Message code (or list of) required for spontaneous messages
+            Filters are compiled once for the batch: the AID filter is evaluated once for
+            each distinct AID, and a structured message is turned into a TL1message only
+            if its AID matches. Command responses are evaluated by evaluate_msg().
+            A list of tuples (position, aid, match_list) is returned, for each matching AID
+            of each message, ordered by position on batch
+        """
+        if not self.__compiled:
+            self.compile()
+
+        conds    = None if cond is None else frozenset([cond] if isinstance(cond, str) else cond)
+        codes    = None if code is None else frozenset([code] if isinstance(code, str) else code)
+        aid_keep = {None : False}   # AID -> result of AID filter
+
+        result = []
+
+        for pos, msg in enumerate(events):
+            if isinstance(msg, dict):
+                coded = msg.get("MSG", msg)
+                if 'S_VMM' in coded  and  aid_keep.get(coded.get('S_AID')) is False:
+                    continue
+                msg = TL1message.from_coded(coded)
+
+            status = msg.get_cmd_status()
+
+            if status[0]:
+                if status[1] == 'COMPLD':
+                    for the_aid, match_list in self.evaluate_msg(msg, pst=pst, sst=sst, fld=fld)[1].items():
+                        result.append((pos, the_aid, match_list))
+                continue
+
+            the_aid = msg.get_eve_aid()
+
+            keep = aid_keep.get(the_aid)
+            if keep is None:
+                keep = self.__evaluate_aid(the_aid)
+                aid_keep[the_aid] = keep
+
+            if not keep:
+                continue
+
+            if conds is not None  and  msg.get_eve_cond() not in conds:
+                continue
+
+            if codes is not None  and  msg.get_message_code() not in codes:
+                continue
+
+            match = self.__evaluate_body(msg, the_aid, pst, sst, fld)
+            if match[0]:
+                result.append((pos, the_aid, match[1][the_aid]))
+
+        return result
+
+
+    def evaluate_columns(self, names, aid_col, cond_col, code_col, get_msg, rows=None,
+                         pst='OR', sst='OR', fld='OR', cond=None, code=None):
+        """ Perform a filter check on spontaneous messages described by columns
+            names    : list of names (AIDs, Condition Types, codes), indexed by name id
+            aid_col  : array of AID ids, for each message position
+            cond_col : array of Condition Type ids, for each message position
+            code_col : array of Message code ids, for each message position
+                       (an id outside names means a missing value; Condition Type and
+                       code columns could be None if not filtered)
+            get_msg  : function(position) -> TL1message, called only for messages
+                       satisfying AID, Condition Type and code filters
+            rows     : positions to evaluate (default: all)
+            cond     : Condition Type (or list of) required
+            code     : Message code (or list of) required
+            A list of tuples (position, aid, match_list) is returned (see evaluate_batch())
+        """
+        if not self.__compiled:
+            self.compile()
+
+        # Filters are evaluated once for each distinct name, then applied to columns
+        columns = [ (aid_col, self.__evaluate_aid) ]
+
+        for column, wanted in ((cond_col, cond), (code_col, code)):
+            if wanted is not None:
+                wanted = frozenset([wanted] if isinstance(wanted, str) else wanted)
+                columns.append((column, wanted.__contains__))
+
+        if rows is None:
+            rows = range(len(aid_col))
+
+        for column, evaluate in columns:
+            keep = { name_id : name_id < len(names)  and  evaluate(names[name_id])
+                        for name_id in set(column) }
+            rows = [pos for pos in rows if keep[column[pos]]]
+
+        result = []
+
+        for pos in rows:
+            msg   = get_msg(pos)
+            match = self.__evaluate_body(msg, msg.get_eve_aid(), pst, sst, fld)
+            if match[0]:
+                for the_aid, match_list in match[1].items():
+                    result.append((pos, the_aid, match_list))
+
+        return result
+
+
+    def __evaluate_body(self, msg, the_aid, pst, sst, fld):
+        """ INTERNAL USAGE
+            State and field filters on the body of a spontaneous message (AID already
+            evaluated). Only the body items needed by filters are extracted
+        """
+        body = msg.get_eve_body() or []
+
+        if len(self.__c_pst) > 0  or  len(self.__c_sst) > 0:
+            states = []
+            for elem in body:
+                if elem.find('=') == -1:
+                    states.extend(elem.split('&'))
+
+            match_pst = self.__evaluate_states(self.__c_pst, states, pst)
+            match_sst = self.__evaluate_states(self.__c_sst, states, sst)
+
+            if not (match_pst[0] and match_sst[0]):
+                return False, None
+        else:
+            match_pst = match_sst = (True, {})
+
+        match_fld = self.__evaluate_fields(self.__event_fields(body), fld)
+        if not match_fld[0]:
+            return False, None
+
+        match_list = match_fld[1]
+
+        if match_pst[1] != {}:
+            match_list.append(match_pst[1])
+
+        if match_sst[1] != {}:
+            match_list.append(match_sst[1])
+
+        return True, {the_aid : match_list}
+
+
+    def __event_fields(self, body):
+        """ INTERNAL USAGE
+            <ATTR,VALUE> items of an event body needed by field filters (for positional
+            items, ATTR is the position, starting from 1)
+        """
+        attr_val_list = {}
+
+        if len(self.__c_fld) == 0:
+            return attr_val_list
+
+        if all(isinstance(attr, int) for attr in self.__c_fld):
+            # only positional filters: direct access to body items
+            for attr in self.__c_fld:
+                if 0 < attr <= len(body)  and  body[attr - 1].find('=') == -1:
+                    attr_val_list[attr] = body[attr - 1]
+            return attr_val_list
+
+        positional = 1
+        for elem in body:
+            if elem.find('=') != -1:
+                attr_val_list[elem.split('=')[0]] = elem.split('=')[1]
+            else:
+                attr_val_list[positional] = elem
+            positional = positional + 1
+
+        return attr_val_list
+
+
     def __evaluate_aid(self, aid):
         """ INTERNAL USAGE
         """
         if len(self.__aid_l) == 0:
             return True
 
-        if aid in self.__aid_l:
+        if aid in self.__c_aid:
             return True
 
-        return False
+        return self.__c_aid_re is not None  and  self.__c_aid_re.fullmatch(aid) is not None
 
 
-    def __evaluate_pst(self, pst_list, rule='OR'):
+    @staticmethod
+    def __evaluate_states(filter_set, state_list, rule='OR'):
         """ INTERNAL USAGE
+            OR  : at least a filter value is on state list
+            AND : all filter values are on state list
         """
-        if len(self.__pst_l) == 0:
+        if len(filter_set) == 0:
             return True, {}
 
-        intersection = set(pst_list).intersection(self.__pst_l)
+        if state_list is None:
+            state_list = ()
 
         if rule == 'OR':
+            intersection = filter_set.intersection(state_list)
             if len(intersection) > 0:
-                return True, intersection
+                return True, set(intersection)
         else:
-            if intersection == set(pst_list):
-                return True, intersection
+            if filter_set.issubset(state_list):
+                return True, set(filter_set)
 
         return False, None
 
 
-    def __evaluate_sst(self, sst_list, rule='OR'):
+    def __evaluate_fields(self, attr_val_list, rule='OR'):
         """ INTERNAL USAGE
+            OR  : at least a filter ATTR has one of its VALUEs
+            AND : all filter ATTRs have one of their VALUEs
+            A tuple (True/False, list of matched "ATTR=VALUE") is returned
         """
-        if len(self.__sst_l) == 0:
-            return True, {}
+        if len(self.__c_fld) == 0:
+            return True, []
 
-        intersection = set(sst_list).intersection(self.__sst_l)
+        match_list = []
 
-        if rule == 'OR':
-            if len(intersection) > 0:
-                return True, intersection
-        else:
-            if intersection == set(sst_list):
-                return True, intersection
+        for the_attr,values in self.__c_fld.items():
+            the_val = attr_val_list.get(the_attr)
+            if the_val in values:
+                match_list.append("{}={}".format(the_attr, the_val))
+            elif rule != 'OR':
+                return False, []
 
-        return False, None
+        return len(match_list) > 0, match_list
 
 
-    def __evaluate_attr_val(self, the_attr, the_val, rule='OR'):
+    def debug(self):
         """ INTERNAL USAGE
         """
-        if rule == 'OR':
-            for attr, values in self.__fld_l.items():
-                if attr == the_attr:
-                    for val in values:
-                        if val == the_val:
-                            return True, "{:s}={:s}".format(attr, val)
-        else:
-            pass
+        print("aid list : {}".format(self.__aid_l))
+        print("fld list : {}".format(self.__fld_l))
+        print("PST list : {}".format(self.__pst_l))
+        print("SST list : {}".format(self.__sst_l))
+
+
+
+
+class TL1row():
+    """ Compact decoded row of a TL1 command response body.
+        Attribute values are kept on a tuple. Attribute names (or positions) are kept on
+        a layout (dictionary name -> index of value), shared by all rows of a row format with
+        the same attribute sequence: names are stored once, and interned
+    """
+    __slots__ = ("layout", "values", "pst", "sst")
+
+    def __init__(self, layout, values, pst=None, sst=None):
+        """ Constructor for a response row (see get_layout())
+        """
+        self.layout = layout    # shared dictionary attribute name (or position) -> index on values
+        self.values = values    # tuple of attribute values
+        self.pst    = pst       # Primary State list (None for rows without states)
+        self.sst    = sst       # Secondary State list (None for rows without states)
+
+
+    def get_value(self, attr):
+        """ Return the value of specified attribute (KeyError if not found)
+        """
+        return self.values[self.layout[attr]]
+
+
+    def get_values(self):
+        """ Return a dictionary attribute -> value (new for each call)
+        """
+        return dict(zip(self.layout, self.values))
+
+
+    def to_dict(self):
+        """ Return the row in R_BODY_OK format ('VALUE', 'PST', 'SST' dictionary)
+        """
+        if self.pst is None:
+            return {'VALUE' : self.get_values()}
+
+        return {'VALUE' : self.get_values(), 'PST' : self.pst, 'SST' : self.sst}
+
+
+    @staticmethod
+    def get_layout(layouts, names):
+        """ Return the shared layout of an attribute sequence
+            layouts : table of layouts of a row format (dictionary names -> layout)
+            names   : tuple of attribute names, or number of positional attributes
+        """
+        layout = layouts.get(names)
+
+        if layout is None:
+            if isinstance(names, int):
+                layout = {pos : pos - 1 for pos in range(1, names + 1)}
+            else:
+                layout = {}
+                for name in names:
+                    layout.setdefault(sys.intern(name), len(layout))
+            layouts[names] = layout
+
+        return layout
+
+
+
+
+class TL1schema():
+    """ Typed decoding of the response rows of a TL1 verb (see TL1message.register_schema())
+        Each field (attribute name, or name of a positional attribute) could have a
+        converter from the raw string value; fields without converter are kept as string.
+        Converters are resolved once for each row layout (see TL1row.get_layout()), so a
+        row is converted in a single pass on its values
+    """
+    NTFCNCDE = ("CR", "MJ", "MN", "NA", "NR", "CL")     # Notification codes
+    SRVEFF   = ("SA", "NSA")                            # Service effect
+
+    def __init__(self, fields=None, names=()):
+        """
+        fields : dictionary field -> converter, a function(raw string) -> value, called
+                 also for empty values (see to_int(), to_float(), to_number(), enum(),
+                 list_of()). Positional attributes are identified by name, or position
+        names  : names of positional attributes (first name for position 1)
+        """
+        self.__fields   = dict(fields or {})
+        self.__names    = tuple(names)
+        self.__pos      = { name : pos for pos,name in enumerate(self.__names, 1) }
+        self.__compiled = {}    # id of row layout -> (layout, tuple of (field, converter))
+
+
+    def get_names(self):
+        """ Return the names of positional attributes
+        """
+        return self.__names
+
+
+    def get_value(self, row, field):
+        """ Return the converted value of a field of a row (TL1row). None if not found
+        """
+        index = row.layout.get(self.__pos.get(field, field))
+
+        if index is None:
+            return None
+
+        converter = self.__compile(row.layout)[index][1]
+
+        if converter is None:
+            return row.values[index]
+
+        return converter(row.values[index])
+
+
+    def get_values(self, row):
+        """ Return a dictionary field -> converted value of a row (TL1row)
+        """
+        return { field : value if converter is None else converter(value)
+                    for (field, converter),value in zip(self.__compile(row.layout), row.values) }
+
+
+    @staticmethod
+    def to_int(value):
+        """ Converter to integer (None for empty values)
+        """
+        return None if value == "" else int(value)
+
+
+    @staticmethod
+    def to_float(value):
+        """ Converter to float (None for empty values)
+        """
+        return None if value == "" else float(value)
+
+
+    @staticmethod
+    def to_number(value):
+        """ Converter to integer, or float for decimal values (None for empty values)
+        """
+        if value == "":
+            return None
+
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+
+
+    @staticmethod
+    def enum(*values):
+        """ Return a converter checking that the value is one of supplied values
+            (ValueError if not). None for empty values
+        """
+        allowed = frozenset(values)
+
+        def converter(value):
+            if value == "":
+                return None
+            if value not in allowed:
+                raise ValueError("TL1 value '{:s}' not in {}".format(value, sorted(allowed)))
+            return value
+
+        return converter
+
+
+    @staticmethod
+    def list_of(item=None, sep='&'):
+        """ Return a converter splitting the value on 'sep' (i.e. "HOTIM&LOTIM"), and
+            converting each item with 'item' converter (if any). [] for empty values
+        """
+        def converter(value):
+            if value == "":
+                return []
+            if item is None:
+                return value.split(sep)
+            return [item(elem) for elem in value.split(sep)]
 
-        return False, ""
+        return converter
 
 
-    def debug(self):
+    def __compile(self, layout):
         """ INTERNAL USAGE
+            Return the converters of a row layout, as a tuple of (field, converter)
+            ordered by value index
         """
-        print("aid list : {}".format(self.__aid_l))
-        print("fld list : {}".format(self.__fld_l))
-        print("PST list : {}".format(self.__pst_l))
-        print("SST list : {}".format(self.__sst_l))
+        entry = self.__compiled.get(id(layout))
+
+        if entry is None  or  entry[0] is not layout:
+            plan = []
+            for attr in layout:
+                field = attr
+                if isinstance(attr, int)  and  0 < attr <= len(self.__names):
+                    field = self.__names[attr - 1]
+                plan.append((field, self.__fields.get(field, self.__fields.get(attr))))
+            entry = (layout, tuple(plan))
+            self.__compiled[id(layout)] = entry
+
+        return entry[1]
 
 
 
@@ -257,6 +1912,40 @@ class TL1check():
 class TL1message():
     """ TL1 Message decomposer
     """
+    EVENT_CODES = ("*C", "**", "*", "A")        # codes of Spontaneous Messages
+
+    ROW_TYPES   = [ ("RTRV-ASAP-PROF", "ASAP_PROF"),     # command verb -> row format
+                    ("RTRV-COND",      "RTRV_COND"),
+                    ("RTRV-PM",        "RTRV_PM") ]
+
+    SCHEMAS     = [ # command verb -> typed decoding of response rows (see TL1schema)
+                    ("RTRV-ASAP-PROF", TL1schema({ "DFLT"     : TL1schema.enum("Y", "N"),
+                                                   "NTFCNCDE" : TL1schema.enum(*TL1schema.NTFCNCDE),
+                                                   "SRVEFF"   : TL1schema.enum(*TL1schema.SRVEFF) },
+                                                 names=("CONDTYPE", "NTFCNCDE", "SRVEFF", "LOCN"))),
+                    ("RTRV-COND",      TL1schema({ "NTFCNCDE" : TL1schema.enum(*TL1schema.NTFCNCDE),
+                                                   "SRVEFF"   : TL1schema.enum(*TL1schema.SRVEFF) },
+                                                 names=("NTFCNCDE", "CONDTYPE", "SRVEFF", "OCRDAT",
+                                                        "OCRTM", "LOCN", "DIRN"))),
+                    ("RTRV-PM",        TL1schema({ "MONVAL"   : TL1schema.to_number },
+                                                 names=("AID", "AIDTYPE", "MONTYPE", "MONVAL", "VLDTY",
+                                                        "LOCN", "DIRN", "TMPER", "MONDAT", "MONTM"))),
+                    ("RTRV-EQPT",      TL1schema({ "AUTOPROV" : TL1schema.enum("ON", "OFF") })),
+                    ("RTRV-PTF",       TL1schema({ "BRSTINTVL"  : TL1schema.to_int,
+                                                   "BRSTTH"     : TL1schema.to_int,
+                                                   "SDTH"       : TL1schema.to_int,
+                                                   "SFTH"       : TL1schema.to_int,
+                                                   "TRCMON"     : TL1schema.enum("Y", "N"),
+                                                   "TRCCONSACT" : TL1schema.enum("Y", "N"),
+                                                   "CAPLIST"    : TL1schema.list_of() })) ]
+
+    LAYOUTS     = {}        # row format -> table of shared row layouts (see TL1row.get_layout())
+    ATTR_MULTI  = re.compile(r"=[^,]*=")    # an "ATTR=VAL" item with more than one '='
+
+    BIN_MAGIC   = b"T1"
+    BIN_HEAD    = struct.Struct("<I2sBBII")     # binary codec: size (after this field), magic,
+                                                # kind (0: spontaneous, 1: response), flags
+                                                # (S_AID / R_BODY_CMD present) and two counters
 
     def __init__(self, tl1_msg):
         """
@@ -287,390 +1976,431 @@ class TL1message():
         self.__m_plain = tl1_msg    # Plain ascii TL1 Message Response
         self.__m_coded = None       # Coded Tl1 Message Response (dictionary)
         self.__m_event = None       # True is the message is a Spontaneous Message
+        self.__m_body  = None       # Offset of Body Section not yet scanned (see __scan_body())
+        self.__m_parse = None       # Row parser for not yet decoded rows of R_BODY_OK
+        self.__m_names = None       # Table of row layouts of row format
+        self.__m_typed = None       # Schema of command verb (False if not defined)
 
         if tl1_msg is not None  and  tl1_msg != "":
             self.__encode()
 
 
-    def __encode_event(self):
-        """ INTERNAL USAGE
+    @classmethod
+    def from_coded(cls, coded):
+        """ Build a TL1message from its structured format (i.e. a dictionary loaded from
+            a "JSON" / "JSONL" decoded message, see decode())
         """
-        f_header = True
-        f_ident  = True
-        f_block  = True
-
-        for line in self.__m_plain.split('\n'):
-            if f_header:
-                if line.strip() == "":
-                    continue
-
-                self.__m_coded['C_SID']  = " ".join(line.split()[:-2]).replace('"', '')
-                self.__m_coded['C_DATE'] = line.split()[-2]
-                self.__m_coded['C_TIME'] = line.split()[-1]
-                f_header = False
-                continue
+        msg = cls(None)
 
-            if f_ident:
-                words = line.split()
-                check_event = ( words[0] == '*C' or
-                                words[0] == '**' or
-                                words[0] == '*'  or
-                                words[0] == 'A'  )
-                if not check_event:
-                    print("MESSAGGIO MALFORMATO")
-                    return
+        coded = dict(coded)     # the supplied dictionary is left untouched
 
-                self.__m_coded['C_CODE'] = words[0]
-                self.__m_coded['C_TAG']  = words[1]
-                self.__m_coded['S_VMM']  = words[2:]
-                f_ident = False
-                continue
+        msg.__m_coded = coded
 
-            if f_block:
-                # Event Response
-                words = line.strip().replace('"', '').split(':')
-                self.__m_coded['S_AID']  = words[0]
-                self.__m_coded['S_BODY'] = words[1].split(',')
-                f_block = False
-                continue
+        if 'S_VMM' in coded:
+            msg.__m_event = True
+        elif 'R_STATUS' in coded:
+            msg.__m_event = False
+            layouts = cls.LAYOUTS.setdefault(cls.get_row_type(coded.get('R_BODY_CMD', "")), {})
+            coded['R_BODY_OK'] = { the_aid : cls.__coded_row(layouts, the_row)
+                                       for the_aid,the_row in coded.get('R_BODY_OK', {}).items() }
 
-            if line == ';':
-                # TERMINATOR found - closing encoding
-                break
+        return msg
 
 
-    def __encode_response_std(self):
+    @staticmethod
+    def __coded_row(layouts, the_row):
         """ INTERNAL USAGE
+            Build a TL1row from a R_BODY_OK item ('VALUE', 'PST', 'SST' dictionary).
+            Positional attributes keys are restored as int (JSON keys are strings)
         """
-        f_header = True
-        f_ident  = True
-        f_block  = True
-
-        f_skip_n = 0
-
-        for line in self.__m_plain.split('\n'):
-            if f_skip_n > 0:
-                # Skip one or more lines
-                f_skip_n = f_skip_n - 1
-                continue
-
-            if f_header:
-                if line.strip() == "":
-                    continue
+        if isinstance(the_row, TL1row):
+            return the_row
 
-                self.__m_coded['C_SID']  = " ".join(line.split()[:-2]).replace('"', '')
-                self.__m_coded['C_DATE'] = line.split()[-2]
-                self.__m_coded['C_TIME'] = line.split()[-1]
-                f_header = False
-                continue
-
-            if f_ident:
-                words = line.split()
-                check_event = ( words[0] == '*C' or
-                                words[0] == '**' or
-                                words[0] == '*'  or
-                                words[0] == 'A'  )
-                if check_event:
-                    print("MESSAGGIO MALFORMATO")
-                    return
-
-                self.__m_coded['C_CODE']    = words[0]
-                self.__m_coded['C_TAG']     = words[1]
-                self.__m_coded['R_STATUS']  = words[2]
-                self.__m_coded['R_BODY_OK'] = {}
-                self.__m_coded['R_BODY_KO'] = []
-                self.__m_coded['R_ERROR']   = ""
-                f_ident = False
-                continue
+        value = the_row['VALUE']
+        names = tuple(value)
 
-            if f_block:
-                # Command Response
-                stripped_line = line.strip()
-                if stripped_line == '>':
-                    f_skip_n = 2    # Long response - skip next 2 lines
-                    continue
-                if ( stripped_line.find('/*') != -1                                     and
-                     stripped_line.find("[{:s}]".format(self.__m_coded['C_TAG'])) != -1 and
-                     stripped_line.find('*/') != -1                                     ):
-                    # REMARK found - closing encoding
-                    tmp = stripped_line.replace("/* ","")
-                    tmp = tmp[:tmp.find(":")]
-                    self.__m_coded['R_BODY_CMD'] = tmp
-                    break
-                if self.__m_coded['R_STATUS'] == "COMPLD":
-                    words = stripped_line.replace('"', '').split(':')
-                    row = {}
-
-                    attr_val_list = {}
-                    if words[2] != "":
-                        for elem in words[2].split(','):
-                            attr_val_list[elem.split('=')[0]] = elem.split('=')[1]
-
-                    if words[3].find(',') != -1:
-                        my_pst_list = words[3].split(',')[0].split('&')
-                        my_sst_list = words[3].split(',')[1].split('&')
-                    else:
-                        my_pst_list = words[3].split('&')
-                        my_sst_list = ""
-                    #row[ words[0] ] = {'VALUE' : attr_val_list, 'STATE' : words[3], 'PST' : my_pst_list, 'SST' : my_sst_list}
-                    row[ words[0] ] = {'VALUE' : attr_val_list, 'PST' : my_pst_list, 'SST' : my_sst_list}
-
-                    self.__m_coded['R_BODY_OK'].update(row)
-                elif self.__m_coded['R_STATUS'] == "DENY":
-                    if len(stripped_line) == 4:
-                        self.__m_coded['R_ERROR'] = stripped_line
-                    else:
-                        self.__m_coded['R_BODY_KO'].append(stripped_line)
-                else:
-                    print("[{:s}] NON ANCORA GESTITO".format(self.__m_coded['R_STATUS']))
-                continue
+        if len(names) > 0  and  all(isinstance(name, int) or name.isdigit() for name in names):
+            names = len(names)
 
-            if line == ';':
-                # TERMINATOR found - closing encoding
-                break
+        return TL1row(TL1row.get_layout(layouts, names), tuple(value.values()),
+                      the_row.get('PST'), the_row.get('SST'))
 
 
-    def __encode_response_asap_prof(self):
+    def __encode(self):
         """ INTERNAL USAGE
+            Decompose an ASCII TL1 Message response to structured format.
+            Only header and identifier sections are decoded here (status-only checks
+            don't depend on response size); the body section of a command response is
+            scanned on first access (see __scan_body()) and each row is decoded by
+            the row parser of command verb on first access (see __row())
         """
-        f_header = True
-        f_ident  = True
-        f_block  = True
+        self.__m_coded = {}     # Reset internal coded message
 
-        f_skip_n = 0
+        plain = self.__m_plain
+        start = 0
 
-        pseudo_aid = 1  # Identifier for "emtpy-aid" response rows
+        # Header section (first not empty line)
+        while True:
+            end = plain.find('\n', start)
+            if end == -1:
+                print("UNMANAGED MESSAGE TYPE")
+                return
+            if plain[start:end].strip() != "":
+                break
+            start = end + 1
 
-        for line in self.__m_plain.split('\n'):
-            if f_skip_n > 0:
-                # Skip one or more lines
-                f_skip_n = f_skip_n - 1
-                continue
+        words = plain[start:end].split()
 
-            if f_header:
-                if line.strip() == "":
-                    continue
+        # Identifier section
+        start = end + 1
+        end   = plain.find('\n', start)
+        if end == -1:
+            end = len(plain)
 
-                self.__m_coded['C_SID']  = " ".join(line.split()[:-2]).replace('"', '')
-                self.__m_coded['C_DATE'] = line.split()[-2]
-                self.__m_coded['C_TIME'] = line.split()[-1]
-                f_header = False
-                continue
+        ident = plain[start:end].split()
 
-            if f_ident:
-                words = line.split()
-                check_event = ( words[0] == '*C' or
-                                words[0] == '**' or
-                                words[0] == '*'  or
-                                words[0] == 'A'  )
-                if check_event:
-                    print("MESSAGGIO MALFORMATO")
-                    return
+        if len(ident) == 0  or  (ident[0] != "M"  and  ident[0] not in self.EVENT_CODES):
+            print("UNMANAGED MESSAGE TYPE")
+            return
 
-                self.__m_coded['C_CODE']    = words[0]
-                self.__m_coded['C_TAG']     = words[1]
-                self.__m_coded['R_STATUS']  = words[2]
-                self.__m_coded['R_BODY_OK'] = {}
-                self.__m_coded['R_BODY_KO'] = []
-                self.__m_coded['R_ERROR']   = ""
-                f_ident = False
-                continue
+        coded = self.__m_coded
+
+        coded['C_SID']  = " ".join(words[:-2]).replace('"', '')
+        coded['C_DATE'] = words[-2]
+        coded['C_TIME'] = words[-1]
+        coded['C_CODE'] = ident[0]
+        coded['C_TAG']  = ident[1]
+
+        if ident[0] != "M":
+            # Spontaneous Message - a single block
+            self.__m_event = True
+            coded['S_VMM'] = ident[2:]
+            if end < len(plain):
+                start = end + 1
+                end   = plain.find('\n', start)
+                words = plain[start:end if end != -1 else len(plain)].strip().replace('"', '').split(':')
+                coded['S_AID']  = words[0]
+                coded['S_BODY'] = words[1].split(',')
+            return
 
-            if f_block:
-                # Command Response
-                stripped_line = line.strip()
-                if stripped_line == '>':
-                    f_skip_n = 2    # Long response - skip next 2 lines
-                    continue
-                if ( stripped_line.find('/*') != -1                                     and
-                     stripped_line.find("[{:s}]".format(self.__m_coded['C_TAG'])) != -1 and
-                     stripped_line.find('*/') != -1                                     ):
-                    # REMARK found - closing encoding
-                    tmp = stripped_line.replace("/* ","")
-                    tmp = tmp[:tmp.find(":")]
-                    self.__m_coded['R_BODY_CMD'] = tmp
-                    break
-                if self.__m_coded['R_STATUS'] == "COMPLD":
-                    words = stripped_line.replace('"', '').split(':')
-                    row = {}
-                    if words[0] != "":
-                        attr_val_list = {}
-                        for elem in words[2].split(','):
-                            attr_val_list[elem.split('=')[0]] = elem.split('=')[1]
-                        row[ words[0] ] = {'VALUE' : attr_val_list}
-                    else:
-                        positional = 1
-                        attr_val_list = {}
-                        for elem in words[2].split(','):
-                            attr_val_list[ positional ] = elem
-                            positional = positional + 1
-                        row[ str(pseudo_aid) ] = {'VALUE' : attr_val_list}
-                        pseudo_aid = pseudo_aid + 1
-                    self.__m_coded['R_BODY_OK'].update(row)
-                elif self.__m_coded['R_STATUS'] == "DENY":
-                    if len(stripped_line) == 4:
-                        self.__m_coded['R_ERROR'] = stripped_line
-                    else:
-                        self.__m_coded['R_BODY_KO'].append(stripped_line)
-                else:
-                    print("[{:s}] NON ANCORA GESTITO".format(self.__m_coded['R_STATUS']))
-                continue
+        self.__m_event = False
+        self.__m_body  = end + 1
 
-            if line == ';':
-                # TERMINATOR found - closing encoding
-                break
+        coded['R_STATUS'] = ident[2]
 
 
-    def __encode_response_rtrv_cond(self):
+    def __scan_body(self):
         """ INTERNAL USAGE
+            Split the body section of a command response up to the REMARK line (command
+            echo). Rows of a successful response are indexed by AID but not decoded
         """
-        f_header = True
-        f_ident  = True
-        f_block  = True
+        if self.__m_body is None:
+            return
 
-        f_skip_n = 0
+        coded = self.__m_coded
 
-        pseudo_aid = 1  # Identifier for "emtpy-aid" response rows
+        coded['R_BODY_OK'] = {}
+        coded['R_BODY_KO'] = []
+        coded['R_ERROR']   = ""
 
-        for line in self.__m_plain.split('\n'):
-            if f_skip_n > 0:
-                # Skip one or more lines
-                f_skip_n = f_skip_n - 1
-                continue
+        remark = "[{:s}]".format(coded['C_TAG'])
+        rows   = []
+        skip_n = 0
 
-            if f_header:
-                if line.strip() == "":
-                    continue
+        for line in self.__m_plain[self.__m_body:].split('\n'):
+            if skip_n > 0:
+                # Skip header of a continuation block
+                skip_n = skip_n - 1
+                continue
 
-                self.__m_coded['C_SID']  = " ".join(line.split()[:-2]).replace('"', '')
-                self.__m_coded['C_DATE'] = line.split()[-2]
-                self.__m_coded['C_TIME'] = line.split()[-1]
-                f_header = False
+            stripped_line = line.strip()
+            if stripped_line == '>':
+                skip_n = 2      # Long response - skip next 2 lines
                 continue
 
-            if f_ident:
-                words = line.split()
-                check_event = ( words[0] == '*C' or
-                                words[0] == '**' or
-                                words[0] == '*'  or
-                                words[0] == 'A'  )
-                if check_event:
-                    print("MESSAGGIO MALFORMATO")
-                    return
+            if '/*' in stripped_line  and  remark in stripped_line  and  '*/' in stripped_line:
+                # REMARK found - closing encoding
+                tmp = stripped_line.replace("/* ","")
+                end = tmp.find(":")
+                if end == -1:
+                    end = tmp.find(remark)  # command without parameters: "VERB [CTAG] (...) */"
+                coded['R_BODY_CMD'] = tmp[:end].strip()
+                break
 
-                self.__m_coded['C_CODE']    = words[0]
-                self.__m_coded['C_TAG']     = words[1]
-                self.__m_coded['R_STATUS']  = words[2]
-                self.__m_coded['R_BODY_OK'] = {}
-                self.__m_coded['R_BODY_KO'] = []
-                self.__m_coded['R_ERROR']   = ""
-                f_ident = False
-                continue
+            rows.append(stripped_line)
 
-            if f_block:
-                # Command Response
-                stripped_line = line.strip()
-                if stripped_line == '>':
-                    f_skip_n = 2    # Long response - skip next 2 lines
-                    continue
-                if ( stripped_line.find('/*') != -1                                     and
-                     stripped_line.find("[{:s}]".format(self.__m_coded['C_TAG'])) != -1 and
-                     stripped_line.find('*/') != -1                                     ):
-                    # REMARK found - closing encoding
-                    tmp = stripped_line.replace("/* ","")
-                    tmp = tmp[:tmp.find(":")]
-                    self.__m_coded['R_BODY_CMD'] = tmp
-                    break
-                if self.__m_coded['R_STATUS'] == "COMPLD":
-                    words = stripped_line.replace('"', '').split(':')
-
-                    row = {}
-                    positional = 1
-                    attr_val_list = {}
-                    for elem in words[1].split(','):
-                        attr_val_list[ positional ] = elem
-                        positional = positional + 1
-                    row[ str(pseudo_aid) ] = {'VALUE' : attr_val_list}
+        self.__m_body = None
+
+        if coded['R_STATUS'] == "COMPLD":
+            aid_parser = self.__set_row_type(coded.get('R_BODY_CMD', self.__m_plain))
+
+            body       = coded['R_BODY_OK']
+            pseudo_aid = 1      # Identifier for "emtpy-aid" response rows
+
+            for stripped_line in rows:
+                the_aid = None if aid_parser is None else aid_parser(stripped_line)
+                if the_aid is None:
+                    the_aid = str(pseudo_aid)
                     pseudo_aid = pseudo_aid + 1
-                    self.__m_coded['R_BODY_OK'].update(row)
-                elif self.__m_coded['R_STATUS'] == "DENY":
-                    if len(stripped_line) == 4:
-                        self.__m_coded['R_ERROR'] = stripped_line
-                    else:
-                        self.__m_coded['R_BODY_KO'].append(stripped_line)
+                body[the_aid] = stripped_line
+
+        elif coded['R_STATUS'] == "DENY":
+            for stripped_line in rows:
+                if len(stripped_line) == 4:
+                    coded['R_ERROR'] = stripped_line
                 else:
-                    print("[{:s}] NON ANCORA GESTITO".format(self.__m_coded['R_STATUS']))
-                continue
+                    coded['R_BODY_KO'].append(stripped_line)
 
-            if line == ';':
-                # TERMINATOR found - closing encoding
-                break
+        elif len(rows) > 0:
+            print("[{:s}] NON ANCORA GESTITO".format(coded['R_STATUS']))
 
 
-    def __encode(self):
+    def __set_row_type(self, cmd):
         """ INTERNAL USAGE
-            Decompose an ASCII TL1 Message response to structured format
+            Select the row parser and the row layouts of a command response.
+            Return the AID parser of row format
         """
-        is_event = False
-        response_type = "std"
+        row_type = self.get_row_type(cmd)
 
-        for line in self.__m_plain.split('\n'):
-            if line.strip() == "":
-                continue
+        self.__m_parse, aid_parser = self.ROW_PARSERS.get(row_type, self.ROW_PARSERS["STD"])
+        self.__m_names = self.LAYOUTS.setdefault(row_type, {})
 
-            marker = line.split()[0]
+        return aid_parser
 
-            if marker == "M":
-                if   self.__m_plain.find("RTRV-ASAP-PROF") != -1:
-                    response_type = "ASAP_PROF"
-                elif self.__m_plain.find("RTRV-COND") != -1:
-                    response_type = "RTRV_COND"
-                else:
-                    response_type = "STD"
-                self.__m_event = False
-                break
 
-            if marker == '*C' or marker == '**' or marker == '*' or marker == 'A':
-                is_event = True
-                self.__m_event = True
-                break
+    def __schema(self):
+        """ INTERNAL USAGE
+            Return the schema of command verb (None if not defined), looked up once
+        """
+        if self.__m_typed is None:
+            self.__m_typed = self.get_schema(self.__m_coded.get('R_BODY_CMD', self.__m_plain or "")) or False
 
-        self.__m_coded = {}     # Reset internal coded message
+        return self.__m_typed or None
 
-        if response_type == "STD":
-            self.__encode_response_std()
-            return
 
-        if response_type == "ASAP_PROF":
-            self.__encode_response_asap_prof()
-            return
+    def __row(self, aid):
+        """ INTERNAL USAGE
+            Return the decoded row (TL1row) of specified aid (None if not found).
+            A row is decoded only once: the result replaces the plain row on R_BODY_OK
+        """
+        self.__scan_body()
 
-        if response_type == "RTRV_COND":
-            self.__encode_response_rtrv_cond()
-            return
+        the_row = self.__m_coded['R_BODY_OK'].get(aid)
 
-        if is_event:
-            self.__encode_event()
-            return
+        if isinstance(the_row, str):
+            the_row = self.__m_parse(the_row, self.__m_names)
+            self.__m_coded['R_BODY_OK'][aid] = the_row
 
-        print("UNMANAGED MESSAGE TYPE")
+        return the_row
 
 
     def decode(self, codec="ASCII"):
         """ Format the structured TL1 message to supplied coded
-            codec : "ASCII" / "JSON"
+            codec : "ASCII"  (canonical TL1 text, see __to_ascii())
+                    "JSON" / "JSONL" (compact, single line JSON)
+                    "BINARY" (bytes, see from_binary())
         """
         new_msg = ""
+
+        coded = self.__m_coded
+
+        if not coded:
+            return b"" if codec == "BINARY" else new_msg
+
         if   codec == "ASCII":
-            pass
-        elif codec == "JSON":
-            new_msg = json.dumps(self.__m_coded, indent=4, sort_keys=True, separators=(',',' : '))
+            return self.__to_ascii()
+        elif codec == "BINARY":
+            return self.__to_binary()
+
+        if not self.__m_event:
+            # All rows are needed, on R_BODY_OK format
+            self.__scan_body()
+            coded = dict(coded)
+            coded['R_BODY_OK'] = { the_aid : self.__row(the_aid).to_dict()
+                                       for the_aid in coded['R_BODY_OK'] }
+
+        if   codec == "JSON":
+            new_msg = json.dumps(coded, indent=4, sort_keys=True, separators=(',',' : '))
+        elif codec == "JSONL":
+            new_msg = json.dumps(coded, sort_keys=True, separators=(',',':'))
         else:
             print("Codec not managed")
 
         return new_msg
 
 
+    @classmethod
+    def from_binary(cls, data, offset=0):
+        """ Build a TL1message from its binary format (see decode())
+            data   : bytes (or bytearray / mmap) containing the binary message
+            offset : position of binary message on data
+            Binary format is a header (see BIN_HEAD), the lengths (uint32, in characters)
+            of all message strings and the strings (UTF-8). The first header field is the
+            size of the remaining message, so binary messages could be concatenated on a
+            file or on a stream (see iter_binary()).
+            Rows of a command response are decoded on first access, as for ASCII messages
+        """
+        size, magic, kind, flags, count1, count2 = cls.BIN_HEAD.unpack_from(data, offset)
+
+        if magic != cls.BIN_MAGIC:
+            raise ValueError("not a binary TL1 message")
+
+        if kind == 0:
+            n_strings = 5 + count1 + flags + count2
+        else:
+            n_strings = 7 + flags + count1 + 2 * count2
+
+        start = offset + cls.BIN_HEAD.size
+        lens  = array.array('I')
+        lens.frombytes(data[start:start + 4 * n_strings])
+        if sys.byteorder != "little":
+            lens.byteswap()
+
+        text    = bytes(data[start + 4 * n_strings:offset + 4 + size]).decode()
+        strings = []
+        pos     = 0
+        for length in lens:
+            strings.append(text[pos:pos + length])
+            pos = pos + length
+
+        coded = { 'C_SID'  : strings[0],
+                  'C_DATE' : strings[1],
+                  'C_TIME' : strings[2],
+                  'C_CODE' : strings[3],
+                  'C_TAG'  : strings[4] }
+
+        msg = cls(None)
+
+        msg.__m_coded = coded
+
+        if kind == 0:
+            msg.__m_event  = True
+            coded['S_VMM'] = strings[5:5 + count1]
+            if flags:
+                coded['S_AID']  = strings[5 + count1]
+                coded['S_BODY'] = strings[6 + count1:]
+            return msg
+
+        msg.__m_event = False
+
+        coded['R_STATUS'] = strings[5]
+        coded['R_ERROR']  = strings[6]
+        pos = 7
+        if flags:
+            coded['R_BODY_CMD'] = strings[7]
+            pos = 8
+        coded['R_BODY_KO'] = strings[pos:pos + count1]
+        pos = pos + count1
+        coded['R_BODY_OK'] = dict(zip(strings[pos::2], strings[pos + 1::2]))
+
+        msg.__set_row_type(coded.get('R_BODY_CMD', ""))
+
+        return msg
+
+
+    @classmethod
+    def iter_binary(cls, data):
+        """ Generator of TL1message from concatenated binary messages (see from_binary())
+        """
+        offset = 0
+
+        while offset + cls.BIN_HEAD.size <= len(data):
+            yield cls.from_binary(data, offset)
+            offset = offset + 4 + cls.BIN_HEAD.unpack_from(data, offset)[0]
+
+
+    def __to_ascii(self):
+        """ INTERNAL USAGE
+            Format the message on canonical TL1 framing: a single block, "\r\n" line
+            endings, rows and remark indented by 3 blanks. Not yet decoded rows are
+            copied as they are; decoded rows are formatted by the row writer of
+            command verb (see ROW_WRITERS).
+            Parsing the result gives back the same structured message (items discarded
+            by row parsers, i.e. the AID of RTRV-COND rows, can't be rebuilt)
+        """
+        coded = self.__m_coded
+        sid   = coded['C_SID']
+
+        if " " in sid:
+            sid = '"{:s}"'.format(sid)
+
+        lines = [ "   {:s} {:s} {:s}".format(sid, coded['C_DATE'], coded['C_TIME']) ]
+
+        if self.__m_event:
+            lines.append("{:<2s} {:s} {:s}".format(coded['C_CODE'], coded['C_TAG'], " ".join(coded['S_VMM'])))
+            if 'S_AID' in coded:
+                lines.append('   "{:s}:{:s}"'.format(coded['S_AID'], ",".join(coded['S_BODY'])))
+        else:
+            self.__scan_body()
+            lines.append("{:<2s} {:s} {:s}".format(coded['C_CODE'], coded['C_TAG'], coded['R_STATUS']))
+            if coded['R_ERROR'] != "":
+                lines.append("   " + coded['R_ERROR'])
+            lines.extend("   " + line for line in coded['R_BODY_KO'])
+            lines.extend("   " + line for _,line in self.__row_lines())
+            if 'R_BODY_CMD' in coded:
+                lines.append("   /* {:s}:: [{:s}] */".format(coded['R_BODY_CMD'], coded['C_TAG']))
+
+        lines.append(";")
+
+        return "\r\n\n" + "\r\n".join(lines)
+
+
+    def __to_binary(self):
+        """ INTERNAL USAGE
+            Format the message on binary format (see from_binary())
+        """
+        coded   = self.__m_coded
+        strings = [coded['C_SID'], coded['C_DATE'], coded['C_TIME'], coded['C_CODE'], coded['C_TAG']]
+
+        if self.__m_event:
+            kind   = 0
+            flags  = 1 if 'S_AID' in coded else 0
+            count1 = len(coded['S_VMM'])
+            count2 = len(coded['S_BODY']) if flags else 0
+            strings.extend(coded['S_VMM'])
+            if flags:
+                strings.append(coded['S_AID'])
+                strings.extend(coded['S_BODY'])
+        else:
+            self.__scan_body()
+            kind   = 1
+            flags  = 1 if 'R_BODY_CMD' in coded else 0
+            count1 = len(coded['R_BODY_KO'])
+            count2 = len(coded['R_BODY_OK'])
+            strings.append(coded['R_STATUS'])
+            strings.append(coded['R_ERROR'])
+            if flags:
+                strings.append(coded['R_BODY_CMD'])
+            strings.extend(coded['R_BODY_KO'])
+            for the_aid,line in self.__row_lines():
+                strings.append(the_aid)
+                strings.append(line)
+
+        lens = array.array('I', map(len, strings))
+        if sys.byteorder != "little":
+            lens.byteswap()
+
+        data = "".join(strings).encode()
+        head = self.BIN_HEAD.pack(self.BIN_HEAD.size - 4 + 4 * len(lens) + len(data),
+                                  self.BIN_MAGIC, kind, flags, count1, count2)
+
+        return head + lens.tobytes() + data
+
+
+    def __row_lines(self):
+        """ INTERNAL USAGE
+            Generator of (aid, row text) for each row of R_BODY_OK
+        """
+        row_type = self.get_row_type(self.__m_coded.get('R_BODY_CMD', self.__m_plain or ""))
+        writer   = self.ROW_WRITERS.get(row_type, self.ROW_WRITERS["STD"])
+
+        for the_aid,the_row in self.__m_coded['R_BODY_OK'].items():
+            if isinstance(the_row, str):
+                yield the_aid, the_row
+            else:
+                yield the_aid, writer(the_aid, the_row)
+
+
     def get_sid(self):
         """ Return the SID
         """
@@ -716,6 +2446,8 @@ class TL1message():
         if self.get_cmd_status() != (True, "COMPLD"):
             return None
 
+        self.__scan_body()
+
         return list(self.__m_coded['R_BODY_OK'].keys())
 
 
@@ -729,14 +2461,11 @@ class TL1message():
         if self.get_cmd_status() != (True, "COMPLD"):
             return None
 
-        the_elem = self.__m_coded['R_BODY_OK'].get(aid)
+        the_elem = self.__row(aid)
         if the_elem is None:
             return None
 
-        try:
-            return the_elem['PST']
-        except Exception as eee:
-            return None
+        return the_elem.pst
 
 
     def get_cmd_sst(self, aid):
@@ -749,14 +2478,11 @@ class TL1message():
         if self.get_cmd_status() != (True, "COMPLD"):
             return None
 
-        the_elem = self.__m_coded['R_BODY_OK'].get(aid)
+        the_elem = self.__row(aid)
         if the_elem is None:
             return None
 
-        try:
-            return the_elem['SST']
-        except Exception as eee:
-            return None
+        return the_elem.sst
 
 
     def get_cmd_response_size(self):
@@ -769,6 +2495,8 @@ class TL1message():
         if self.get_cmd_status() != (True, "COMPLD"):
             return None
 
+        self.__scan_body()
+
         return len(self.__m_coded['R_BODY_OK'])
 
 
@@ -784,7 +2512,7 @@ class TL1message():
             return None
 
         try:
-            return self.__m_coded['R_BODY_OK'].get(aid)['VALUE'][attr]
+            return self.__row(aid).get_value(attr)
         except Exception as eee:
             return None
 
@@ -804,11 +2532,100 @@ class TL1message():
             return None
 
         try:
-            return self.__m_coded['R_BODY_OK'].get(aid)['VALUE']
+            return self.__row(aid).get_values()
         except Exception as eee:
             return None
 
 
+    def get_cmd_typed_value(self, aid, field):
+        """ As get_cmd_attr_value(), with the value converted by the schema of command
+            verb (see register_schema()); positional attributes could be identified by
+            their schema name. Without a schema, the value is returned as string
+            None if wrong parameters are supplied
+        """
+        if self.get_cmd_status() != (True, "COMPLD"):
+            return None
+
+        the_row = self.__row(aid)
+        if the_row is None:
+            return None
+
+        schema = self.__schema()
+        if schema is None:
+            index = the_row.layout.get(field)
+            return None if index is None else the_row.values[index]
+
+        return schema.get_value(the_row, field)
+
+
+    def get_cmd_typed_values(self, aid):
+        """ As get_cmd_attr_values(), with values converted by the schema of command verb
+            and positional attributes named by schema (see register_schema())
+            None if wrong parameters are supplied
+        """
+        if self.get_cmd_status() != (True, "COMPLD"):
+            return None
+
+        the_row = self.__row(aid)
+        if the_row is None:
+            return None
+
+        schema = self.__schema()
+        if schema is None:
+            return the_row.get_values()
+
+        return schema.get_values(the_row)
+
+
+    def get_eve_type(self):
+        """ Return the Verb and modifiers of a spontaneous message (i.e. "REPT ALM EQPT")
+            None if the message isn't a spontaneous message
+        """
+        if not self.__m_event:
+            return None
+
+        return " ".join(self.__m_coded['S_VMM'])
+
+
+    def get_eve_aid(self):
+        """ Return the AID of a spontaneous message
+            None if the message isn't a spontaneous message
+        """
+        if not self.__m_event:
+            return None
+
+        return self.__m_coded.get('S_AID')
+
+
+    def get_eve_cond(self):
+        """ Return the Condition Type of a spontaneous message (REPT ALM / REPT EVT)
+            None if the message isn't an alarm or event report
+        """
+        if not self.__m_event:
+            return None
+
+        try:
+            if self.__m_coded['S_VMM'][:2] == ['REPT', 'ALM']:
+                return self.__m_coded['S_BODY'][1]
+
+            if self.__m_coded['S_VMM'][:2] == ['REPT', 'EVT']:
+                return self.__m_coded['S_BODY'][0]
+        except (KeyError, IndexError):
+            pass
+
+        return None
+
+
+    def get_eve_body(self):
+        """ Return the body of a spontaneous message (list of values)
+            None if the message isn't a spontaneous message
+        """
+        if not self.__m_event:
+            return None
+
+        return self.__m_coded.get('S_BODY')
+
+
     def get_cmd_error_frame(self):
         """ Return a tuple (result, str1, str2) for a DENY response message
             'result' is False if the message isn't a command response
@@ -820,9 +2637,283 @@ class TL1message():
         if self.__m_coded['R_STATUS'] != "DENY":
             return False, None, None
 
+        self.__scan_body()
+
         return True, self.__m_coded['R_ERROR'], self.__m_coded['R_BODY_KO']
 
 
+    @classmethod
+    def get_row_type(cls, cmd):
+        """ Return the row format of a command response ("STD" / "ASAP_PROF" / "RTRV_COND" /
+            "RTRV_PM", or a row format added by register_row_type())
+            cmd : the TL1 command (or response) string
+        """
+        for verb,row_type in cls.ROW_TYPES:
+            if cmd.find(verb) != -1:
+                return row_type
+
+        return "STD"
+
+
+    @classmethod
+    def parse_row(cls, line, row_type="STD"):
+        """ Decompose a row of a command response body (i.e. "AID::ATTR=VAL,...:PST,SST")
+            A tuple (aid, attr_val_list, pst_list, sst_list) is returned:
+            - "STD"       : ATTR=VAL items (dictionary), Primary and Secondary State lists
+            - "ASAP_PROF" : ATTR=VAL items, or positional items for rows without AID
+            - "RTRV_COND" : positional items
+            - "RTRV_PM"   : positional items, AID and AID type first
+            positional items are indexed from 1; aid is None for rows without AID
+            (see R_BODY_OK for the pseudo AID assigned by TL1message)
+            line     : the row (with or without quotes and leading blanks)
+            row_type : row format (see get_row_type())
+        """
+        row_parser, aid_parser = cls.ROW_PARSERS.get(row_type, cls.ROW_PARSERS["STD"])
+
+        line    = line.strip()
+        the_row = row_parser(line, cls.LAYOUTS.setdefault(row_type, {}))
+        the_aid = None if aid_parser is None else aid_parser(line)
+
+        if the_row.pst is None:
+            return the_aid, the_row.get_values(), [], []
+
+        return the_aid, the_row.get_values(), the_row.pst, the_row.sst
+
+
+    @classmethod
+    def get_row_aid(cls, line, row_type="STD"):
+        """ Return the AID of a row of a command response body, without decoding the row
+            (None for rows without AID). For row formats without AID parser (i.e.
+            "RTRV_COND", "RTRV_PM") the AID is taken from the "AID,AIDTYPE" section
+            line     : the row (with or without quotes and leading blanks)
+            row_type : row format (see get_row_type())
+        """
+        aid_parser = cls.ROW_PARSERS.get(row_type, cls.ROW_PARSERS["STD"])[1]
+
+        line = line.strip()
+
+        if aid_parser is not None:
+            return aid_parser(line)
+
+        return line.replace('"', '').split(':', 1)[0].split(',', 1)[0] or None
+
+
+    @classmethod
+    def register_row_type(cls, row_type, row_parser, verb=None, aid_parser=None, row_writer=None):
+        """ Add (or replace) a row format of command responses
+            row_type   : row format name
+            row_parser : function(line, layouts) -> row, for a stripped response row;
+                         row is a TL1row, whose layout is taken from 'layouts' table
+                         (see TL1row.get_layout())
+            verb       : responses of commands containing this string use the row format
+                         (checked before the built-in verbs)
+            aid_parser : function(line) -> aid, for a stripped response row. It is used
+                         for indexing rows without decoding them, so it should be cheap.
+                         None (or a None aid) for rows without AID: a pseudo AID is
+                         assigned by position
+            row_writer : function(aid, row) -> line, the quoted row text of a TL1row (used
+                         by decode(), "ASCII" and "BINARY" codecs). Default: "STD" writer
+        """
+        cls.ROW_PARSERS[row_type] = (row_parser, aid_parser)
+
+        if row_writer is not None:
+            cls.ROW_WRITERS[row_type] = row_writer
+
+        if verb is not None:
+            cls.ROW_TYPES.insert(0, (verb, row_type))
+
+
+    @classmethod
+    def get_schema(cls, cmd):
+        """ Return the schema (TL1schema) of a command response, None if not defined
+            cmd : the TL1 command (or response) string
+        """
+        for verb,schema in cls.SCHEMAS:
+            if cmd.find(verb) != -1:
+                return schema
+
+        return None
+
+
+    @classmethod
+    def register_schema(cls, verb, schema):
+        """ Add a schema (TL1schema) for responses of commands containing 'verb'
+            (checked before the schemas already registered)
+        """
+        cls.SCHEMAS.insert(0, (verb, schema))
+
+
+    @staticmethod
+    def __attr_row(text, layouts, pst=None, sst=None):
+        """ INTERNAL USAGE
+            Build a row from a "ATTR=VAL,ATTR=VAL,..." sequence
+        """
+        if text.count('=') == text.count(',') + 1  and  TL1message.ATTR_MULTI.search(text) is None:
+            # a single '=' for each item: split names and values at once
+            words  = text.replace('=', ',').split(',')
+            names  = tuple(words[0::2])
+            values = tuple(words[1::2])
+        else:
+            items  = text.split(',')
+            names  = tuple(elem.split('=')[0] for elem in items)
+            values = tuple(elem.split('=')[1] for elem in items)
+
+        layout = TL1row.get_layout(layouts, names)
+
+        if len(layout) != len(values):
+            # repeated attribute - the last value is kept
+            values = tuple(dict(zip(names, values)).values())
+
+        return TL1row(layout, values, pst, sst)
+
+
+    @staticmethod
+    def __pos_row(text, layouts):
+        """ INTERNAL USAGE
+            Build a row from a positional "VAL,VAL,..." sequence
+        """
+        values = tuple(text.split(','))
+
+        return TL1row(TL1row.get_layout(layouts, len(values)), values)
+
+
+    @staticmethod
+    def __row_std(line, layouts):
+        """ INTERNAL USAGE
+            "AID::ATTR=VAL,...:PST,SST" rows
+        """
+        words = line.replace('"', '').split(':')
+
+        if len(words) < 4:
+            words.extend([""] * (4 - len(words)))
+
+        if words[3].find(',') != -1:
+            states      = words[3].split(',')
+            my_pst_list = states[0].split('&')
+            my_sst_list = states[1].split('&')
+        else:
+            my_pst_list = words[3].split('&')
+            my_sst_list = ""
+
+        if words[2] == "":
+            return TL1row(TL1row.get_layout(layouts, ()), (), my_pst_list, my_sst_list)
+
+        return TL1message.__attr_row(words[2], layouts, my_pst_list, my_sst_list)
+
+
+    @staticmethod
+    def __row_asap_prof(line, layouts):
+        """ INTERNAL USAGE
+            "PROFILE::ATTR=VAL,..." rows, or positional rows without AID
+        """
+        words = line.replace('"', '').split(':')
+
+        if words[0] != "":
+            return TL1message.__attr_row(words[2], layouts)
+
+        return TL1message.__pos_row(words[2], layouts)
+
+
+    @staticmethod
+    def __row_rtrv_cond(line, layouts):
+        """ INTERNAL USAGE
+            "AID,TYPE:NTFCNCDE,CONDTYPE,..." rows (positional)
+        """
+        words = line.replace('"', '').split(':')
+
+        return TL1message.__pos_row(words[1], layouts)
+
+
+    @staticmethod
+    def __row_rtrv_pm(line, layouts):
+        """ INTERNAL USAGE
+            "AID,AIDTYPE:MONTYPE,MONVAL,..." rows (positional, AID and AIDTYPE first)
+        """
+        words = line.replace('"', '').split(':')
+        head  = words[0].split(',', 1)
+
+        if len(head) < 2:
+            head.append("")
+
+        if len(words) > 1:
+            head.extend(words[1].split(','))
+
+        values = tuple(head)
+
+        return TL1row(TL1row.get_layout(layouts, len(values)), values)
+
+
+    @staticmethod
+    def __aid_std(line):
+        """ INTERNAL USAGE
+            AID of "AID:..." rows
+        """
+        return line.split(':', 1)[0].replace('"', '')
+
+
+    @staticmethod
+    def __aid_asap_prof(line):
+        """ INTERNAL USAGE
+            Profile name of "PROFILE:..." rows, None for positional rows
+        """
+        return line.split(':', 1)[0].replace('"', '') or None
+
+
+    @staticmethod
+    def __line_std(aid, row):
+        """ INTERNAL USAGE
+            "AID::ATTR=VAL,...:PST,SST" rows
+        """
+        line = '"{:s}::{:s}'.format(aid, ",".join([name + "=" + value
+                                                   for name,value in zip(row.layout, row.values)]))
+
+        if isinstance(row.sst, list):
+            return '{:s}:{:s},{:s}"'.format(line, "&".join(row.pst), "&".join(row.sst))
+
+        if row.pst is not None  and  row.pst != [""]:
+            return '{:s}:{:s}"'.format(line, "&".join(row.pst))
+
+        return line + '"'
+
+
+    @staticmethod
+    def __line_asap_prof(aid, row):
+        """ INTERNAL USAGE
+            "PROFILE::ATTR=VAL,..." rows, or positional rows without AID
+        """
+        if len(row.layout) > 0  and  isinstance(next(iter(row.layout)), int):
+            return '"::{:s}"'.format(",".join(row.values))
+
+        return TL1message.__line_std(aid, row)
+
+
+    @staticmethod
+    def __line_rtrv_pm(aid, row):
+        """ INTERNAL USAGE
+            "AID,AIDTYPE:MONTYPE,MONVAL,..." rows
+        """
+        return '"{:s},{:s}:{:s}"'.format(row.values[0], row.values[1], ",".join(row.values[2:]))
+
+
+    @staticmethod
+    def __line_rtrv_cond(aid, row):
+        """ INTERNAL USAGE
+            Positional rows (the "AID,TYPE" section isn't kept by row parser)
+        """
+        return '":{:s}"'.format(",".join(row.values))
+
+
+    ROW_PARSERS = { "STD"       : (__row_std.__func__,       __aid_std.__func__),  # row format ->
+                    "ASAP_PROF" : (__row_asap_prof.__func__, __aid_asap_prof.__func__), # row parser,
+                    "RTRV_COND" : (__row_rtrv_cond.__func__, None),                     # AID parser
+                    "RTRV_PM"   : (__row_rtrv_pm.__func__,   None) }
+
+    ROW_WRITERS = { "STD"       : __line_std.__func__,          # row format -> row writer
+                    "ASAP_PROF" : __line_asap_prof.__func__,
+                    "RTRV_COND" : __line_rtrv_cond.__func__,
+                    "RTRV_PM"   : __line_rtrv_pm.__func__ }
+
+
 
 
 
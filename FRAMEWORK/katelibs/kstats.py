@@ -0,0 +1,291 @@
+#!/usr/bin/env python
+"""
+###############################################################################
+# MODULE: kstats.py
+#         Low overhead statistics for K@TE equipment interfaces.
+#         Latencies and sizes of commands are aggregated, for each command verb,
+#         on HDR-style (log-linear) histograms
+#
+# AUTHOR: C.Ghelfi
+# DATE  : 25/01/2016
+#
+###############################################################################
+"""
+
+import threading
+import time
+
+
+
+class KHistogram():
+    """
+    Log-linear histogram of non-negative integer values (HDR-style).
+    Values below 2*SUB_COUNT are counted exactly; above, each power of two is split in
+    SUB_COUNT buckets, so the relative error of a percentile is below 1/SUB_COUNT
+    whatever the magnitude. Recording is O(1) and memory is bounded by the value range.
+    """
+    SUB_BITS  = 4
+    SUB_COUNT = 1 << SUB_BITS     # buckets for each power of two
+
+    def __init__(self):
+        self.__buckets = {}     # bucket index -> counter
+        self.count     = 0      # number of recorded values
+        self.total     = 0      # sum of recorded values
+        self.min       = None   # lowest recorded value
+        self.max       = None   # highest recorded value
+
+
+    def record(self, value, count=1):
+        """ Record a value (negative values are stored as 0)
+            count : number of occurrences
+        """
+        value = max(int(value), 0)
+
+        shift = max(value.bit_length() - self.SUB_BITS - 1, 0)
+        index = (shift << self.SUB_BITS) + (value >> shift)
+
+        self.__buckets[index] = self.__buckets.get(index, 0) + count
+
+        self.count = self.count + count
+        self.total = self.total + value * count
+
+        if self.min is None  or  value < self.min:
+            self.min = value
+        if self.max is None  or  value > self.max:
+            self.max = value
+
+
+    def merge(self, other):
+        """ Add all values recorded on another histogram
+        """
+        for index,count in other.__buckets.items():
+            self.__buckets[index] = self.__buckets.get(index, 0) + count
+
+        self.count = self.count + other.count
+        self.total = self.total + other.total
+
+        for value in (other.min, other.max):
+            if value is not None:
+                if self.min is None  or  value < self.min:
+                    self.min = value
+                if self.max is None  or  value > self.max:
+                    self.max = value
+
+
+    def mean(self):
+        """ Return the mean value (None if empty)
+        """
+        if self.count == 0:
+            return None
+
+        return self.total / self.count
+
+
+    def percentile(self, perc):
+        """ Return the value below which 'perc' percent of values fall (None if empty)
+        """
+        if self.count == 0:
+            return None
+
+        threshold = self.count * perc / 100.0
+        seen      = 0
+
+        for index in sorted(self.__buckets):
+            seen = seen + self.__buckets[index]
+            if seen >= threshold:
+                return min(max(self.__bucket_value(index), self.min), self.max)
+
+        return self.max
+
+
+    def get_summary(self, scale=1):
+        """ Return a dictionary with count, min, max, mean and main percentiles.
+            scale : divisor applied to values (i.e. 1e6 for microseconds -> seconds)
+        """
+        if self.count == 0:
+            return {"count": 0}
+
+        return { "count" : self.count,
+                 "min"   : self.min / scale,
+                 "max"   : self.max / scale,
+                 "mean"  : self.mean() / scale,
+                 "p50"   : self.percentile(50) / scale,
+                 "p90"   : self.percentile(90) / scale,
+                 "p99"   : self.percentile(99) / scale }
+
+
+    def __bucket_value(self, index):
+        """ INTERNAL USAGE
+            Middle value of a bucket
+        """
+        shift    = max((index >> self.SUB_BITS) - 1, 0)
+        mantissa = index - (shift << self.SUB_BITS)
+
+        return (mantissa << shift) + ((1 << shift) - 1) // 2
+
+
+
+class KCommandStats():
+    """
+    Per-verb statistics of commands sent on an equipment interface.
+    For each verb are kept: queue wait, time to first byte, total time (seconds, with
+    microsecond resolution), response size (bytes) and number of keep alive messages
+    received while waiting for the response.
+    Thread safe: commands could be recorded by several threads.
+    """
+    TIMES = ("wait", "ttfb", "total")       # histograms of times (microseconds)
+
+    def __init__(self, name=""):
+        """
+        name : interface name (i.e. "TL1"), used for report title
+        """
+        self.__name  = name
+        self.__lock  = threading.Lock()
+        self.__verbs = {}           # verb -> {"wait"/"ttfb"/"total"/"size": KHistogram, "keepalive": int}
+        self.__first = None         # time of first recorded command
+        self.__last  = None         # time of latest recorded command
+        self.__count = 0            # recorded commands
+        self.__bytes = 0            # total size of responses
+
+
+    def record(self, verb, total, wait=0.0, ttfb=None, size=0, keepalive=0):
+        """ Record a completed command
+            verb      : command verb (i.e. "RTRV-EQPT")
+            total     : (seconds) time from request to completed response
+            wait      : (seconds) time spent waiting for the interface (session, window, ...)
+            ttfb      : (seconds) time from sending to first received byte (None: unknown)
+            size      : (bytes) response size
+            keepalive : number of keep alive messages received while waiting
+        """
+        now = time.time()
+
+        with self.__lock:
+            entry = self.__verbs.get(verb)
+            if entry is None:
+                entry = { "wait"      : KHistogram(),
+                          "ttfb"      : KHistogram(),
+                          "total"     : KHistogram(),
+                          "size"      : KHistogram(),
+                          "keepalive" : 0 }
+                self.__verbs[verb] = entry
+
+            entry["wait"].record(wait * 1e6)
+            entry["total"].record(total * 1e6)
+            entry["size"].record(size)
+            entry["keepalive"] = entry["keepalive"] + keepalive
+            if ttfb is not None:
+                entry["ttfb"].record(ttfb * 1e6)
+
+            if self.__first is None:
+                self.__first = now - total
+            self.__last  = now
+            self.__count = self.__count + 1
+            self.__bytes = self.__bytes + size
+
+
+    def reset(self):
+        """ Discard all recorded commands
+        """
+        with self.__lock:
+            self.__verbs = {}
+            self.__first = None
+            self.__last  = None
+            self.__count = 0
+            self.__bytes = 0
+
+
+    def get_verbs(self):
+        """ Return the list of recorded verbs, sorted by total time (highest first)
+        """
+        with self.__lock:
+            return sorted(self.__verbs, key=lambda verb: -self.__verbs[verb]["total"].total)
+
+
+    def get_stats(self, verb=None):
+        """ Return the statistics of a verb, or of all verbs (verb=None) as a dictionary
+            verb -> statistics. Statistics of a verb are a dictionary with keys:
+            "count", "time" (seconds spent on verb), "keepalive" and, for "wait",
+            "ttfb", "total" (seconds) and "size" (bytes), a dictionary with count,
+            min, max, mean, p50, p90, p99 (see KHistogram.get_summary())
+        """
+        if verb is None:
+            return { the_verb : self.get_stats(the_verb) for the_verb in self.get_verbs() }
+
+        with self.__lock:
+            entry = self.__verbs.get(verb)
+            if entry is None:
+                return None
+
+            stats = { "count"     : entry["total"].count,
+                      "time"      : entry["total"].total / 1e6,
+                      "keepalive" : entry["keepalive"],
+                      "size"      : entry["size"].get_summary() }
+
+            for key in self.TIMES:
+                stats[key] = entry[key].get_summary(1e6)
+
+        return stats
+
+
+    def get_throughput(self):
+        """ Return a dictionary with number of commands, response bytes, elapsed time
+            from first to latest command and the corresponding rates (per second)
+        """
+        with self.__lock:
+            if self.__count == 0:
+                return {"commands": 0, "bytes": 0, "elapsed": 0.0, "cmd_rate": 0.0, "byte_rate": 0.0}
+
+            elapsed = max(self.__last - self.__first, 1e-6)
+
+            return { "commands"  : self.__count,
+                     "bytes"     : self.__bytes,
+                     "elapsed"   : elapsed,
+                     "cmd_rate"  : self.__count / elapsed,
+                     "byte_rate" : self.__bytes / elapsed }
+
+
+    def get_report(self):
+        """ Return a text table of statistics (one row for each verb, most expensive first)
+        """
+        thr = self.get_throughput()
+
+        lines = [ "{:s} COMMAND STATISTICS".format(self.__name).strip(),
+                  "commands: {:d}  bytes: {:d}  elapsed: {:.3f}s  rate: {:.2f} cmd/s {:.0f} B/s".format(
+                        thr["commands"], thr["bytes"], thr["elapsed"], thr["cmd_rate"], thr["byte_rate"]),
+                  "{:<24s} {:>6s} {:>10s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>5s}".format(
+                        "VERB", "COUNT", "TIME(s)", "WAIT.p50", "TTFB.p50",
+                        "TOT.p50", "TOT.p99", "TOT.max", "SIZE.p50", "KEEPA") ]
+
+        def fmt(summary, key, fmt_str="{:.4f}"):
+            value = summary.get(key)
+            if value is None:
+                return "-"
+            return fmt_str.format(value)
+
+        for verb,stats in self.get_stats().items():
+            lines.append("{:<24s} {:>6d} {:>10.3f} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s} {:>5d}".format(
+                            verb, stats["count"], stats["time"],
+                            fmt(stats["wait"],  "p50"),
+                            fmt(stats["ttfb"],  "p50"),
+                            fmt(stats["total"], "p50"),
+                            fmt(stats["total"], "p99"),
+                            fmt(stats["total"], "max"),
+                            fmt(stats["size"],  "p50", "{:.0f}"),
+                            stats["keepalive"]))
+
+        return "\n".join(lines)
+
+
+
+if __name__ == "__main__":
+    print("DEBUG")
+
+    stats = KCommandStats("TL1")
+    for idx in range(1000):
+        stats.record("RTRV-EQPT", total=0.010 + idx / 100000.0, wait=0.001, ttfb=0.008, size=300)
+    stats.record("ENT-EQPT", total=2.5, size=120, keepalive=2)
+
+    print(stats.get_stats("RTRV-EQPT"))
+    print(stats.get_report())
+
+    print("FINE")
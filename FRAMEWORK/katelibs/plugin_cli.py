@@ -16,6 +16,8 @@ import threading
 import time
 import socket
 
+from katelibs.kstats import KCommandStats
+
 
 ########################################## CLASS Plugin1850CLI ####################
 
@@ -48,6 +50,7 @@ class Plugin1850CLI():
         self.__last_cmd = "UNSET"         # last CLI command
         self.__last_output = ""           # last CLI command output
         self.__last_status = "NONE"       # last CLI command status)
+        self.__stats = KCommandStats("CLI")   # per-verb command statistics
         # Semaphore for CLI Keep Alive Threading area
         #self.__thread_lock = threading.Lock()
 
@@ -72,6 +75,16 @@ class Plugin1850CLI():
         return self.__last_status
 
 
+    def get_stats(self):
+        """
+            Return the per-verb statistics of CLI commands (a KCommandStats instance).
+            The verb is the first word of command; keep alive newlines aren't recorded,
+            while the "other CLI command in progress" messages are counted as keep alive.
+            The CLI channel has no queue nor lock, so the wait time is always zero
+        """
+        return self.__stats
+
+
     def connect(self, timeout=None, user="admin", password="Alcatel1"):
         """
             Connection to CLI port of selected equipment.
@@ -371,6 +384,8 @@ class Plugin1850CLI():
         #self.__trc_inf(keepalive)
         #self.__trc_inf("++++++++++++++++++++++++")
 
+        start_time = time.time()
+
         if cmd != "logout" and not keepalive:
             # Trash all trailing characters from stream
             while str(self.__if_cmd.read_very_eager().strip(), 'utf-8') != "":
@@ -415,7 +430,15 @@ class Plugin1850CLI():
                 self.__last_status = "FAILURE"
                 return False
             skip = ".. message: waiting - other CLI command in progress\r"
-            self.__last_output = buf.decode().replace(skip,"")
+            text = buf.decode()
+            self.__last_output = text.replace(skip,"")
+
+            if not keepalive:
+                # No queue nor lock on CLI channel: draining and writing are service time
+                self.__stats.record(cmd.split()[0] if cmd.strip() else "<NEWLINE>",
+                                    time.time() - start_time,
+                                    size=len(buf),
+                                    keepalive=text.count(skip))
         if not keepalive:
             #with self.__thread_lock:
             self.__KeepaliveEnb = True
@@ -10,14 +10,130 @@
 """
 
 import telnetlib
+import select
 import re
 import threading
+import itertools
+import queue
 import time
-import os
+
+from concurrent.futures import Future
+from concurrent.futures import InvalidStateError
 
 from katelibs.kexception    import KFrameException
 from katelibs.facility_tl1  import TL1check
 from katelibs.facility_tl1  import TL1message
+from katelibs.facility_tl1  import TL1EventStore
+from katelibs.facility_tl1  import TL1EventLog
+from katelibs.facility_tl1  import TL1Framer
+from katelibs.facility_tl1  import TL1ResponseCache
+from katelibs.facility_tl1  import TL1Transcript
+from katelibs.facility_tl1  import TL1AlarmMirror
+from katelibs.plugin_tl1_async  import AsyncTL1Client, TL1AsyncLoop
+from katelibs.plugin_tl1_reactor  import TL1EventReactor, TL1Backoff
+from katelibs.plugin_tl1_replay   import TL1ReplayServer
+from katelibs.kstats        import KCommandStats
+
+
+
+class TL1Future(Future):
+    """
+    Pending TL1 command sent in pipelined mode (see Plugin1850TL1.do_async())
+    The result is the TL1 response (multi-line string)
+    """
+
+    def __init__(self, cmd):
+        """ cmd : the TL1 command string
+        """
+        super().__init__()
+        self.cmd      = cmd          # original TL1 command
+        self.ctag     = None         # CTAG assigned to command
+        self.wait     = 0.0          # time (seconds) spent waiting for pipeline window
+        self.first_rx = None         # receiving time of first response block
+        self.__start = time.time()   # sending time
+        self.__end   = None          # response time
+        self.add_done_callback(self.__mark_end)
+
+
+    def get_elapsed(self):
+        """ Return the elapsed time (seconds) from sending to response
+        """
+        if self.__end is None:
+            return time.time() - self.__start
+
+        return self.__end - self.__start
+
+
+    def get_ttfb(self):
+        """ Return the time (seconds) from sending to first response block (None if unknown)
+        """
+        if self.first_rx is None:
+            return None
+
+        return self.first_rx - self.__start
+
+
+    def __mark_end(self, _):
+        """ INTERNAL USAGE
+        """
+        self.__end = time.time()
+
+
+
+class TL1Session():
+    """
+    A TL1 CMD session (telnet connection, framer and login state)
+    """
+
+    def __init__(self):
+        self.if_cmd  = None                 # telnet connection
+        self.framer  = TL1Framer()          # framer for received data
+        self.logged  = False                # True after a successful ACT-USER
+        self.lock    = threading.RLock()    # held while a command is in progress
+        self.last_rx = 0                    # time of latest received data
+
+
+
+class TL1RecTelnet(telnetlib.Telnet):
+    """
+    Telnet connection recording all sent and received data on a TL1Transcript
+    """
+
+    def __init__(self, transcript, channel, host, port, timeout):
+        """
+        transcript : TL1Transcript instance
+        channel    : transcript stream ("CMD"; EVE channel is recorded by reactor callback)
+        """
+        super().__init__(host, port, timeout)
+        self.__transcript = transcript
+        self.__stream     = transcript.open_stream(channel)
+
+
+    def write(self, buffer):
+        """ Send data (see telnetlib.Telnet.write())
+        """
+        self.__transcript.write(self.__stream, "S", buffer)
+        super().write(buffer)
+
+
+    def read_very_eager(self):
+        """ Read all available data (see telnetlib.Telnet.read_very_eager())
+        """
+        data = super().read_very_eager()
+        self.__transcript.write(self.__stream, "R", data)
+        return data
+
+
+
+class TL1ThreadState(threading.local):
+    """
+    State of latest TL1 interaction, kept for each calling thread
+    """
+    last_cmd    = ""        # store the latest tl1 command sent
+    last_output = ""        # store the output of latest TL1 command sent
+    time_mark   = None      # Time mark to aborting a TL1 interaction
+    session     = None      # TL1Session of pool bound to thread (None: main session)
+    queued      = None      # request time of command in progress (see get_stats())
 
 
 
@@ -26,9 +142,36 @@ class Plugin1850TL1():
     TL1 plugin for 1850TSS Equipment
     """
     TL1_TIMEOUT = 1200   # default timeout for TL1 command interaction
-
-
-    def __init__(self, IP, PORT=3083, krepo=None, eRef=None, collector=None, ktrc=None):
+    PIPE_WINDOW = 8      # default number of outstanding commands in pipelined mode
+    EVE_STORE   = 10000  # default max number of events kept in memory
+    CACHE_TTL   = 10     # default time-to-live (seconds) of cached RTRV responses
+    CACHE_SIZE  = 256    # default max number of cached RTRV responses
+    BATCH_SIZE  = 32     # default max number of AIDs on a coalesced command (see do_batch())
+    HEALTH_TIME = 60     # default idle time (seconds) before a heartbeat (see health_start())
+    HEALTH_WAIT = 10     # max waiting time (seconds) for heartbeat/login responses
+    HEALTH_CMD  = "RTRV-HDR;"   # heartbeat command (any response proves a live session)
+    RETRY_TIME  = 1      # (seconds) delay after first failed connection attempt
+    RETRY_MAX   = 30     # (seconds) max delay between two connection attempts
+    ALARM_TIME  = 300    # default interval (seconds) of alarm mirror reconciliation
+    ALARM_CMD   = "RTRV-COND-ALL;"  # command for seeding the alarm mirror
+
+    # Single AID, suitable for coalescing (see do_batch())
+    BATCH_AID   = re.compile(r"^\s*[A-Za-z0-9]+(-[A-Za-z0-9]+)*-\d+\s*$")
+
+    # Verbs whose response could have no rows for an existing AID (see do_batch())
+    BATCH_EMPTY = ("RTRV-COND", "RTRV-ALM", "RTRV-PM")
+
+    # Verbs invalidating the cached responses of overlapping AIDs
+    CACHE_WRITE = ("ent-", "ed-", "dlt-", "rmv-", "rst-")
+
+    # Verb/modifiers and AID of an autonomous message (raw text)
+    EVE_PEEK    = re.compile(r'^(?:\*C|\*\*|\*|A)\s+\S+\s+([^\r\n]+)\r?\n\s*"?([^:,"\r\n]*)',
+                             re.MULTILINE)
+
+
+    def __init__(self, IP, PORT=3083, krepo=None, eRef=None, collector=None, ktrc=None,
+                 transport="telnet", collector_size=0, collector_gzip=False, echo=False,
+                 transcript=None, replay_speed=1.0):
         """
         Costructor for generic TL1 interface
         IP        : equipment's IP Address
@@ -37,6 +180,21 @@ class Plugin1850TL1():
         eRef      : reference to equipment (for label)
         collector : file name for event collector
         ktrc      : reference to Kate Tracer
+        transport : "telnet"  -> blocking telnet connection for commands; event channel
+                                 served by the shared reactor (see plugin_tl1_reactor.py)
+                    "asyncio" -> CMD and EVE channels served by the shared asyncio loop
+                                 (see plugin_tl1_async.py); no thread per equipment
+                    "replay"  -> as "telnet", but IP/PORT are ignored and the TL1 sessions
+                                 recorded on 'transcript' are served back by a local
+                                 replay server (see plugin_tl1_replay.py)
+        collector_size : (bytes) collector file size for rotation (0: no rotation)
+        collector_gzip : True for gzip rotated collector files
+        echo      : True for printing collected events on stdout
+        transcript: transcript file (see TL1Transcript). For transport="telnet", all data
+                    sent and received on CMD and EVE channels is recorded on it; for
+                    transport="replay", the transcript to serve back
+        replay_speed : replay speed for transport="replay" (1.0: recorded timing;
+                       0: as fast as possible)
         """
 
         self.__the_ip      = IP
@@ -44,34 +202,88 @@ class Plugin1850TL1():
         self.__krepo       = krepo  # result report (Kunit class instance)
         self.__eqpt_ref    = eRef   # equipment reference
         self.__ktrc        = ktrc   # Tracer object
-        self.__if_cmd      = None   # main TL1 interface (used for sending usr command)
-        self.__if_eve      = None   # secondary TL1 interface (used for capturing events)
-        self.__last_cmd    = ""     # store the latest tl1 command sent
-        self.__last_output = ""     # store the output of latest TL1 command sent
-        self.__time_mark   = None   # Time mark to aborting a TL1 interaction
+        self.__main        = TL1Session()   # main TL1 interface (used for sending usr command)
+        self.__tls         = TL1ThreadState()   # latest command/output, per calling thread
+        self.__pool        = None   # Queue of additional CMD sessions (see pool_start())
+        self.__pool_list   = []     # all sessions of pool
+        self.__login_cmd   = "ACT-USER::admin:MYTAG::Alcatel1;"     # latest login command
+        self.__async       = None   # asyncio TL1 client (only for transport="asyncio")
+        self.__eve_channel = None   # EVE channel on shared reactor (only for transport="telnet")
+        self.__collected   = 0      # number of collected events
+        self.__received    = 0      # number of autonomous messages received
+        self.__dropped     = 0      # number of autonomous messages discarded by filters
+        self.__eve_filters = []     # subscription filters (TL1check instances)
+        self.__eve_verbs   = None   # prefilter on event Verb (i.e. "REPT ALM")
+        self.__eve_aids    = None   # prefilter on event AID
+        self.__echo        = echo   # print collected events on stdout
+        self.__eve_lock    = threading.Lock()   # protect event waiters area
+        self.__eve_waiters = []     # list of [TL1check, threading.Event] waiting for events
+        self.__eve_store   = TL1EventStore(self.EVE_STORE)  # collected events (see events())
+        self.__cache       = None   # RTRV responses cache (see cache_enable())
+        self.__transcript  = None   # TL1Transcript for recorded sessions
+        self.__replay      = None   # TL1ReplayServer (only for transport="replay")
+        self.__eve_stream  = None   # transcript stream of current EVE connection
+        self.ready         = threading.Event()  # set while main CMD session is usable
+        self.__stats       = KCommandStats("TL1")   # per-verb command statistics
+
+        # Mirror of active conditions (see alarm_mirror_start())
+        self.__alarms       = None                  # TL1AlarmMirror instance
+        self.__alarm_cmd    = self.ALARM_CMD        # seed command
+        self.__alarm_time   = self.ALARM_TIME       # reconciliation interval
+        self.__alarm_thread = None                  # reconciliation Thread
+        self.__alarm_wake   = threading.Event()     # wake up reconciliation (stop request)
+
+        # Health monitor of main CMD session (see health_start())
+        self.__health_thread = None                 # monitor Thread
+        self.__health_time   = self.HEALTH_TIME     # idle time before a heartbeat
+        self.__health_wake   = threading.Event()    # wake up monitor (stop or recovery request)
 
         # File for Event collector
         if collector is None:
             collector_fn = "collector.log"
         else:
             collector_fn = collector
-        
-        if os.path.isfile(collector_fn):os.remove(collector_fn)
-        self.__f = open(collector_fn, "w")
-        os.chmod(collector_fn, 0o666)
 
-        # Semaphore for TL1 Event Collector info area
-        self.__thread_lock    = threading.Lock()
+        # Compact JSON lines, buffered and rotated (see TL1EventLog)
+        self.__f = TL1EventLog(collector_fn, max_size=collector_size, compress=collector_gzip)
+
+        # Pipelined command execution (see pipeline_start())
+        self.__ctag_seq     = itertools.count(1)   # CTAG generator (shared with asyncio client)
+        self.__pipe_lock    = threading.Lock()     # protect pending commands area
+        self.__pipe_pending = {}                   # CTAG -> [Future, partial response blocks, on_block]
+        self.__pipe_window  = None                 # Semaphore for outstanding commands
+        self.__pipe_thread  = None                 # CMD channel reader Thread
+        self.__pipe_active  = False                # Status of pipelined mode
 
         # Flags for TL1 Event Collector
-        self.__do_event_loop  = True  # Thread termination flag
         self.__enable_collect = False # Status of Event Collector
 
-        # TL1 Event Collector Thread Initialization and Starting
-        self.__thread = threading.Thread(target=self.__thr_manager,
-                                         name="TL1_Event_Collector")
-        self.__thread.daemon = False
-        self.__thread.start()
+        if transport == "replay":
+            # Recorded sessions served back by a local server
+            self.__replay = TL1ReplayServer(transcript, speed=replay_speed, ktrc=ktrc)
+            self.__replay.start()
+            self.__the_ip   = "127.0.0.1"
+            self.__the_port = self.__replay.get_port()
+        elif transport == "telnet"  and  transcript is not None:
+            self.__transcript = TL1Transcript(transcript)
+
+        if transport == "asyncio":
+            # TL1 Event Collector served by shared asyncio loop
+            self.__async = AsyncTL1Client(IP, PORT, ktrc=ktrc, ctag_seq=self.__ctag_seq)
+            self.__async.start_events("ACT-USER::admin:MYTAG::Alcatel1;",
+                                      self.__eve_wanted,
+                                      self.__event_ingest)
+        else:
+            # TL1 Event Collector served by shared reactor thread
+            reactor = TL1EventReactor.get_reactor()
+            self.__eve_channel = reactor.attach(self.__the_ip, self.__the_port,
+                                                "ACT-USER::admin:MYTAG::Alcatel1;",
+                                                self.__eve_wanted,
+                                                self.__event_ingest,
+                                                on_idle=self.__f.flush,
+                                                ktrc=ktrc,
+                                                on_trace=None if self.__transcript is None
+                                                         else self.__eve_trace)
 
         self.__trc_inf("Plugin BM available")
 
@@ -79,44 +291,74 @@ class Plugin1850TL1():
     def get_last_outcome(self):
         """ Return the latest TL1 command output (multi-line string)
         """
-        return self.__last_output
+        return self.__tls.last_output
+
+
+    def get_stats(self):
+        """ Return the per-verb statistics of TL1 commands (a KCommandStats instance):
+            queue wait, time to first byte, total time, response size and keep alive
+            messages (see kstats.py)
+        """
+        return self.__stats
 
 
-    def do_until(self, cmd, cond, timeout=TL1_TIMEOUT):
+    def do_until(self, cmd, cond, timeout=TL1_TIMEOUT, mode="POLL", fallback=30):
         """ Send the specified TL1 command to equipment until almost one of conditions will be
             reached.
-            cmd     : the TL1 command string
-            timeout : (secons) timeout to terminate loop
-            cond    : instance of TL1check class (see for details).
+            cmd      : the TL1 command string
+            timeout  : (secons) timeout to terminate loop
+            cond     : instance of TL1check class (see for details).
+            mode     : "POLL"  -> the command is re-sent every second (default behaviour)
+                       "EVENT" -> the command is re-sent only for confirmation, as soon as an
+                                  autonomous message for a matching AID is received on EVE
+                                  channel, or every 'fallback' seconds.
+                                  The AID filters of 'cond' are used for matching events; if
+                                  not specified, the AID of 'cmd' is used.
+            fallback : (seconds) max interval between two commands (only for mode="EVENT")
         """
-        self.__last_cmd = cmd
-        self.__time_mark = time.time() + timeout
+        self.__tls.last_cmd = cmd
+        self.__tls.time_mark = time.time() + timeout
 
         if self.__krepo:
             self.__krepo.start_time()
 
         error_msg = ""
 
-        while True:
-            result = self.__do("CMD", cmd, "COMPLD")
+        waiter = None
+        if mode == "EVENT":
+            waiter = self.__eve_waiter_add(self.__wake_check(cmd, cond))
 
-            if int(time.time()) <= self.__time_mark:
-                msg_coded = TL1message(self.__last_output)
-                # Evaluation of result conditions
-                match_cond = cond.evaluate_msg(msg_coded)
-                self.__trc_dbg("TL1 Condition Evaluated := {}".format(match_cond))
+        try:
+            while True:
+                if waiter is not None:
+                    waiter[1].clear()
 
-                if match_cond[0]:
-                    result = True
-                    break
+                result = self.__do("CMD", cmd, "COMPLD")
 
-                time.sleep(1)
-            else:
-                error_msg = "TIMEOUT ({:d}s) DETECTED ON SENDING '{:s}'".format(timeout, cmd)
-                self.__trc_error(error_msg)
-                result = False
-                raise KFrameException(error_msg)
-                break
+                if int(time.time()) <= self.__tls.time_mark:
+                    msg_coded = TL1message(self.__tls.last_output)
+                    # Evaluation of result conditions
+                    match_cond = cond.evaluate_msg(msg_coded)
+                    self.__trc_dbg("TL1 Condition Evaluated := {}".format(match_cond))
+
+                    if match_cond[0]:
+                        result = True
+                        break
+
+                    if waiter is None:
+                        time.sleep(1)
+                    else:
+                        waiter[1].wait(max(min(fallback, self.__tls.time_mark - time.time()), 0))
+
+                if time.time() >= self.__tls.time_mark:
+                    error_msg = "TIMEOUT ({:d}s) DETECTED ON SENDING '{:s}'".format(timeout, cmd)
+                    self.__trc_error(error_msg)
+                    result = False
+                    raise KFrameException(error_msg)
+                    break
+        finally:
+            if waiter is not None:
+                self.__eve_waiter_del(waiter)
 
         self.__trc_dbg("DEBUG: result := {:s} - errmsg := [{:s}]\n".format(str(result), error_msg))
 
@@ -128,6 +370,55 @@ class Plugin1850TL1():
         return result
 
 
+    @staticmethod
+    def __wake_check(cmd, cond):
+        """ INTERNAL USAGE
+            Build the AID filter for events able to wake up an event driven do_until()
+        """
+        if len(cond.get_aid_list()) > 0:
+            return cond
+
+        wake_check = TL1check()
+
+        fields = cmd.replace(";", "").split(":")
+        if len(fields) > 2  and  fields[2].find("&&") == -1:
+            for aid in fields[2].split("&"):
+                if aid.strip() != ""  and  not aid.startswith("-"):
+                    wake_check.add_aid(aid.strip())
+
+        return wake_check
+
+
+    def __eve_waiter_add(self, check):
+        """ INTERNAL USAGE
+            Register a waiter for autonomous messages matching the AID filters of 'check'
+        """
+        waiter = [check, threading.Event()]
+
+        with self.__eve_lock:
+            self.__eve_waiters.append(waiter)
+
+        return waiter
+
+
+    def __eve_waiter_del(self, waiter):
+        """ INTERNAL USAGE
+        """
+        with self.__eve_lock:
+            self.__eve_waiters.remove(waiter)
+
+
+    def __eve_wanted(self):
+        """ INTERNAL USAGE
+            True if EVE channel has to be active (event collection, waiting callers,
+            response cache invalidation or alarm mirror)
+        """
+        return ( self.__enable_collect           or
+                 len(self.__eve_waiters) > 0     or
+                 self.__cache is not None        or
+                 self.__alarms is not None       )
+
+
     def do(self, cmd, policy="COMPLD", timeout=TL1_TIMEOUT, cond=None):
         """ Send the specified TL1 command to equipment.
             It is possible specify an error behaviour and/or a matching string
@@ -144,8 +435,8 @@ class Plugin1850TL1():
             self.__trc_error("An instance of TL1check is mandatory for policy=='COND'")
             return False
 
-        self.__last_cmd = cmd
-        self.__time_mark = time.time() + timeout
+        self.__tls.last_cmd = cmd
+        self.__tls.time_mark = time.time() + timeout
 
         if self.__krepo:
             self.__krepo.start_time()
@@ -153,12 +444,12 @@ class Plugin1850TL1():
         error_msg = ""
 
         if policy == "COND":
-            result = self.__do("CMD", cmd, "COMPLD")
+            result = self.__do_cached(cmd, "COMPLD")
         else:
-            result = self.__do("CMD", cmd, policy)
+            result = self.__do_cached(cmd, policy)
 
         if result  and  policy == "COND":
-            msg_coded = TL1message(self.__last_output)
+            msg_coded = TL1message(self.__tls.last_output)
 
             # Evaluation of result conditions
             print("APPLING FILTER")
@@ -179,351 +470,1759 @@ class Plugin1850TL1():
         return result
 
 
-    def __do(self, channel, cmd, policy):
-        """ INTERNAL USAGE
+    def do_stream(self, cmd, policy="COMPLD", timeout=TL1_TIMEOUT):
+        """ Send the specified TL1 command (i.e. a RTRV-xxx-ALL) and yield the rows of
+            response as soon as each block is received, without keeping the whole
+            response in memory. For each row, a tuple (aid, attr_val_list, pst_list, sst_list)
+            is yielded (see TL1message.parse_row()). Rows without AID get a pseudo AID.
+            The caller could stop the iteration at any time: the rest of response is discarded.
+            The outcome is reported only for completed responses; get_last_outcome() returns
+            the latest response block
+            cmd     : the TL1 command string
+            policy  : "COMPLD" / "DENY" (see do())
+            timeout : (seconds) max waiting time for response
         """
-        self.__last_cmd = cmd   # added for internal running invocation
+        self.__tls.last_cmd = cmd
+        self.__tls.time_mark = time.time() + timeout
 
-        if channel == "CMD":
-            self.__trc_dbg("sending [{:s}]".format(cmd))
+        if self.__krepo:
+            self.__krepo.start_time()
+
+        start_time = time.time()
+        first_time = None
+        size       = 0
+
+        self.__cache_write(cmd)
+
+        if self.__pipe_active  or  self.__async is not None:
+            blocks = self.__stream_queued(cmd)
         else:
-            self.__trc_dbg("sending [{:s}] (EVENT INTERFACE)".format(cmd))
+            blocks = self.__stream_direct(cmd)
 
-        tl1_verb = cmd.replace(";", "").split(":")[0].lower().replace("\r", "").replace("\n", "")
+        row_type   = TL1message.get_row_type(cmd)
+        pseudo_aid = 1
+        tl1_block  = ""
 
-        # Trash all trailing characters from stream
-        if self.__read_all(channel) == False:
-            self.__trc_error("error [1] sending TL1 command [{:s}]".format(cmd))
-            self.__last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
-            raise KFrameException(self.__last_output)
-            return False
+        try:
+            for tl1_block in blocks:
+                if first_time is None:
+                    first_time = time.time()
+                size = size + len(tl1_block)
+
+                is_body = False
+                is_rows = False
+
+                for line in tl1_block.split("\n"):
+                    stripped_line = line.strip()
+
+                    if not is_body:
+                        # Skip block header, up to 'M' line
+                        if stripped_line.startswith("M "):
+                            is_body = True
+                            is_rows = stripped_line.split()[2] == "COMPLD"
+                        continue
 
-        # Sending command to interface
-        if self.__write(channel, cmd) == False:
-            self.__trc_error("error [2] sending TL1 command [{:s}]".format(cmd))
-            self.__last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
-            raise KFrameException(self.__last_output)
-            return False
+                    if not is_rows  or  not stripped_line.startswith('"'):
+                        continue
 
+                    the_aid, attr_val_list, pst_list, sst_list = TL1message.parse_row(stripped_line,
+                                                                                       row_type)
+                    if the_aid is None:
+                        the_aid = str(pseudo_aid)
+                        pseudo_aid = pseudo_aid + 1
 
-        if cmd.lower() == "canc-user;":
-            tl1_response = " COMPLD "
-        else:
-            tl1_response  = ""
+                    yield the_aid, attr_val_list, pst_list, sst_list
+        finally:
+            blocks.close()
 
-            keepalive_count_max = 100
-            keepalive_count = 0
+        self.__tls.last_output = tl1_block
 
-            while True:
-                result_list = self.__expect(channel, [b"\n\>", b"\n\;"])
+        self.__stats.record(self.__stat_verb(cmd), time.time() - start_time, size=size,
+                            ttfb=None if first_time is None else first_time - start_time)
 
-                if result_list == ([],[],[]):
-                    self.__trc_error("error [3] sending TL1 command [{:s}]".format(cmd))
-                    self.__last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
-                    raise KFrameException(self.__last_output)
-                    return False
+        if self.__check_policy(tl1_block, policy):
+            self.__t_success(cmd, None, self.get_last_outcome())
+        else:
+            self.__t_failure(cmd, None, self.get_last_outcome(), "")
 
-                msg_tmp = str(result_list[2], 'utf-8')
 
-                if msg_tmp.find("\r\n\n") == -1:
-                    continue
+    def __stream_direct(self, cmd):
+        """ INTERNAL USAGE
+            Send a command on CMD channel and yield each response block (decoded)
+            On early closing, the rest of response is read and discarded
+        """
+        self.__trc_dbg("sending [{:s}] (stream)".format(cmd))
 
-                response_partial_list = msg_tmp.split("\r\n\n")
-                msg_tmp = "\r\n\n".join(response_partial_list[1:])
+        with self.__session().lock:
+            if not self.__read_all("CMD")  or  not self.__write("CMD", cmd):
+                self.__trc_error("error [2] sending TL1 command [{:s}]".format(cmd))
+                self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+                raise KFrameException(self.__tls.last_output)
 
-                if result_list[0] ==  1:
-                    if msg_tmp.find(" REPT ") != -1:
+            completed = False
+
+            try:
+                while not completed:
+                    block = self.__session().framer.next_block()
+
+                    if block is None:
+                        if not self.__read_chunk("CMD"):
+                            self.__trc_error("error [3] sending TL1 command [{:s}]".format(cmd))
+                            self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+                            raise KFrameException(self.__tls.last_output)
                         continue
 
-                    elif msg_tmp.find("KEEP ALIVE MESSAGE") != -1:
-                        keepalive_count = keepalive_count + 1
-                        if keepalive_count == keepalive_count_max:
-                            self.__trc_error("error [4] sending TL1 command [{:s}]".format(cmd))
-                            self.__last_output = "MAXIMUM KEEPALIVE ON TL1 RESPONSE REACHED"
-                            raise KFrameException(self.__last_output)
-                            return False
+                    marker, payload = block
+
+                    if payload is None:
                         continue
 
-                    else:
-                        tl1_response = tl1_response + re.sub('(\r\n)+', "\r\n", msg_tmp, 0)
-                        if tl1_verb != "ed-pid"  and  tl1_verb != "act-user":
-                            if tl1_response.count(";") > 1:
-                                self.__trc_error("error [5] sending TL1 command [{:s}]".format(cmd))
-                                self.__last_output = "INVALID TL1 TERMINATION"
-                                raise KFrameException(self.__last_output)
-                                return False
-                        if tl1_response.strip() == ";":
+                    if marker == TL1Framer.MARK_TERM:
+                        if payload.find(b" REPT ") != -1  or  payload.find(b"KEEP ALIVE MESSAGE") != -1:
                             continue
-                        break
+                        completed = True
+
+                    yield TL1Framer.join([payload])
+            finally:
+                while not completed:
+                    # Discard the rest of response
+                    block = self.__session().framer.next_block()
+                    if block is None:
+                        if not self.__read_chunk("CMD"):
+                            break
+                        continue
+                    marker, payload = block
+                    if marker == TL1Framer.MARK_TERM  and  payload is not None:
+                        completed = ( payload.find(b" REPT ") == -1  and
+                                      payload.find(b"KEEP ALIVE MESSAGE") == -1 )
 
-                elif result_list[0] ==  0:
-                    tl1_response = tl1_response + msg_tmp + "\n"
-                    continue
 
-            tl1_response = re.sub('(\r\n)+', "\r\n", tl1_response, 0)
+    def __stream_queued(self, cmd):
+        """ INTERNAL USAGE
+            Send a command on pipeline (or asyncio client) and yield each response block
+        """
+        blocks    = queue.Queue()
+        is_active = [True]
 
+        def on_block(marker, payload):
+            if is_active[0]:
+                blocks.put((marker, payload))
 
-        if  (tl1_response.find(" COMPLD") != -1  or
-             tl1_response.find(" DELAY")  != -1  ):
-            # Positive TL1 response
-            result = (policy == "COMPLD")
+        if self.__pipe_active:
+            future = self.__pipe_submit(cmd, max(self.__tls.time_mark - time.time(), 0), on_block)
         else:
-            # Negative TL1 response
-            result = (policy == "DENY")
+            future = TL1AsyncLoop.submit(self.__async.do(cmd,
+                                                         timeout=max(self.__tls.time_mark - time.time(), 0),
+                                                         on_block=on_block))
 
-        self.__last_output = tl1_response
+        # All blocks are queued before command completion
+        future.add_done_callback(lambda _: blocks.put(None))
 
-        return result
+        try:
+            while True:
+                try:
+                    block = blocks.get(timeout=max(self.__tls.time_mark - time.time(), 0))
+                except queue.Empty:
+                    block = False
 
+                if block is None  and  future.exception() is None:
+                    break   # i.e. CANC-USER, no response expected
 
-    def __read_all(self, channel):
-        """ INTERNAL USAGE
+                if not block:
+                    self.__trc_error("error [3] sending TL1 command [{:s}]".format(cmd))
+                    self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+                    raise KFrameException(self.__tls.last_output)
+
+                yield TL1Framer.join([block[1]])
+
+                if block[0] == TL1Framer.MARK_TERM:
+                    break
+        finally:
+            is_active[0] = False
+            if self.__pipe_active  and  not future.done():
+                self.__pipe_abandon(future)
+
+
+    def cache_enable(self, ttl=CACHE_TTL, size=CACHE_SIZE):
+        """ Enable the cache of RTRV-xxx responses for do().
+            A cached response is invalidated by ENT/ED/DLT/RMV/RST commands and by
+            autonomous messages on an overlapping AID (see TL1ResponseCache)
+            ttl  : (seconds) max age of a cached response
+            size : max number of cached responses
         """
-        if channel == "CMD":
-            tl1_interface = self.__if_cmd
-        else:
-            tl1_interface = self.__if_eve
+        self.__cache = TL1ResponseCache(ttl, size)
 
-        for _ in (1,2):
-            try:
-                while str(tl1_interface.read_very_eager().strip(), 'utf-8') != "":
-                    pass
-                return True
-            except Exception:
-                tl1_interface = self.__connect(channel)     # renewing interface
 
-        return False
+    def cache_disable(self):
+        """ Disable (and clear) the cache of RTRV-xxx responses
+        """
+        self.__cache = None
 
 
-    def __write(self, channel, cmd):
+    def cache_stats(self):
+        """ Return a dictionary with cache counters (see TL1ResponseCache.stats())
+            None if cache is disabled
+        """
+        if self.__cache is None:
+            return None
+
+        return self.__cache.stats()
+
+
+    def __do_cached(self, cmd, policy):
         """ INTERNAL USAGE
+            Send a command on CMD channel, using the response cache (if enabled)
         """
-        if channel == "CMD":
-            tl1_interface = self.__if_cmd
-        else:
-            tl1_interface = self.__if_eve
+        cache = self.__cache
 
-        for _ in (1,2):
-            try:
-                tl1_interface.write(cmd.encode())
-                return True
-            except Exception:
-                tl1_interface = self.__connect(channel)     # renewing interface
+        if cache is None:
+            return self.__do("CMD", cmd, policy)
 
-        return False
+        tl1_verb = cmd.replace(";", "").split(":")[0].lower().strip()
+
+        if tl1_verb.startswith("rtrv-"):
+            tl1_response = cache.get(cmd)
+            if tl1_response is not None:
+                self.__trc_dbg("sending [{:s}] (cached response)".format(cmd))
+                self.__tls.last_output = tl1_response
+                return self.__check_policy(tl1_response, policy)
+
+            result = self.__do("CMD", cmd, policy)
+
+            if self.__check_policy(self.__tls.last_output, "COMPLD"):
+                cache.put(cmd, self.__tls.last_output)
+
+            return result
+
+        self.__cache_write(cmd)
 
+        return self.__do("CMD", cmd, policy)
 
-    def __expect(self, channel, key_list):
+
+    def __cache_write(self, cmd):
         """ INTERNAL USAGE
+            Invalidate the cached responses changed by a command (if cache is enabled).
+            It is called by all the commands sent on CMD channel (do(), do_async(),
+            do_stream()...)
         """
-        if channel == "CMD":
-            tl1_interface = self.__if_cmd
-        else:
-            tl1_interface = self.__if_eve
+        cache = self.__cache
 
-        for _ in (1,2):
-            try:
-                result_list = tl1_interface.expect(key_list)
-                return result_list
-            except Exception:
-                tl1_interface = self.__connect(channel)     # renewing interface
+        if cache is None:
+            return
 
-        return [],[],[]
+        tl1_verb = cmd.replace(";", "").split(":")[0].lower().strip()
 
+        if tl1_verb.startswith(self.CACHE_WRITE):
+            cache.invalidate(TL1ResponseCache.get_aid(cmd))
+        elif tl1_verb.startswith("init-"):
+            cache.invalidate()
 
-    def __connect(self, channel):
-        """ INTERNAL USAGE
+
+    def pool_start(self, size=2, timeout=TL1_TIMEOUT):
+        """ Open a pool of additional CMD sessions, each one logged with the latest
+            ACT-USER command sent (see do()). While the pool is active, commands sent by
+            different threads are served concurrently, each one on a free session;
+            the latest output (see get_last_outcome()) is kept for each thread.
+            The pipelined mode, if active, takes precedence over the pool.
+            It has no effect for transport="asyncio" (commands are already concurrent)
+            size    : number of sessions (check the equipment MAXSESSION value)
+            timeout : (seconds) max time for opening all sessions
         """
-        is_connected = False
+        if self.__async is not None  or  self.__pool is not None:
+            return
 
-        if channel == "CMD":
-            self.__trc_dbg("(re)CONNECTING TL1...")
+        self.__tls.time_mark = time.time() + timeout
 
-            while int(time.time()) <= self.__time_mark:
-                try:
-                    self.__if_cmd = telnetlib.Telnet(self.__the_ip, self.__the_port, 5)
-                    self.__trc_dbg("... TL1 INTERFACE for commands ready.")
-                    is_connected = True
-                    break
-                except Exception as eee:
-                    self.__trc_dbg("TL1: error connecting CMD channel - {:s}".format(str(eee)))
-                    self.__trc_dbg("... retrying in 1s ...")
-                    time.sleep(1)
+        pool = queue.Queue()
 
-            if not is_connected:
-                self.__trc_error("TL1: Timeout on connection")
-                raise KFrameException("TL1: Timeout on connection")
+        for _ in range(size):
+            session = TL1Session()
+            self.__tls.session = session
+            try:
+                self.__connect("CMD")
+                session.logged = self.__do("CMD", self.__login_cmd, "COMPLD")
+            finally:
+                self.__tls.session = None
+            self.__pool_list.append(session)
+            pool.put(session)
 
-            return self.__if_cmd
+        self.__pool = pool
 
-        else:
-            self.__trc_dbg("(re)CONNECTING TL1 (Event channel)...")
+        self.__trc_dbg("TL1 session pool enabled (size={:d})".format(size))
 
-            end_timeout = time.time() + self.TL1_TIMEOUT
 
-            while int(time.time()) <= end_timeout:
-                try:
-                    self.__if_eve = telnetlib.Telnet(self.__the_ip, self.__the_port, 5)
-                    self.__trc_dbg("... TL1 INTERFACE for events ready.")
-                    is_connected = True
-                    break
-                except Exception as eee:
-                    self.__trc_dbg("TL1: error connecting EVE channel - {:s}".format(str(eee)))
-                    self.__trc_dbg("... retrying in 1s ...")
-                    time.sleep(1)
+    def pool_stop(self):
+        """ Logout and close all sessions of pool. The commands in progress are completed
+        """
+        pool = self.__pool
+        if pool is None:
+            return
 
-            if not is_connected:
-                self.__trc_error("TL1: Timeout on connection")
-                raise KFrameException("TL1: Timeout on connection")
+        self.__pool = None
 
-            return self.__if_eve
+        for _ in range(len(self.__pool_list)):
+            session = pool.get()
+            self.__tls.session = session
+            try:
+                if session.logged:
+                    self.__do("CMD", "CANC-USER;", "COMPLD")
+            except KFrameException:
+                pass
+            finally:
+                self.__tls.session = None
+            session.if_cmd.close()
 
+        self.__pool_list = []
 
-    def __disconnect(self):
+        self.__trc_dbg("TL1 session pool disabled")
+
+
+    def __do_pooled(self, cmd, policy):
         """ INTERNAL USAGE
+            Send a command on a free session of pool (login is repeated if needed)
         """
         try:
-            self.__do("EVE", "CANC-USER;", "COMPLD")
-        except Exception as eee:
-            msg = "Error in disconnection - {:s}".format(str(eee))
-            self.__trc_error(msg)
-            raise KFrameException(msg)
+            session = self.__pool.get(timeout=max(self.__tls.time_mark - time.time(), 0))
+        except queue.Empty:
+            self.__trc_error("error [1] sending TL1 command [{:s}]".format(cmd))
+            self.__tls.last_output = "TIMEOUT WAITING FOR A FREE TL1 SESSION"
+            raise KFrameException(self.__tls.last_output)
 
-        self.__if_eve = None
+        self.__tls.session = session
 
         try:
-            self.__do("CMD", "CANC-USER;", "COMPLD")
-        except Exception as eee:
-            msg = "Error in disconnection - {:s}".format(str(eee))
-            self.__trc_error(msg)
-            raise KFrameException(msg)
+            tl1_verb = cmd.replace(";", "").split(":")[0].lower().strip()
 
-        self.__if_cmd = None
+            if not session.logged  and  tl1_verb != "act-user":
+                self.__do("CMD", self.__login_cmd, "COMPLD")
 
+            return self.__do("CMD", cmd, policy)
+        finally:
+            self.__tls.session = None
+            self.__pool.put(session)
 
-    def event_collection_start(self):
-        """ Start TL1 event collection
+
+    def __session(self):
+        """ INTERNAL USAGE
+            Return the CMD session for calling thread
         """
-        self.__enable_collect = True
+        session = self.__tls.session
+        if session is None:
+            return self.__main
+
+        return session
+
+
+    def health_start(self, interval=HEALTH_TIME):
+        """ Start the health monitor of main CMD session (a daemon thread).
+            When the session is idle for 'interval' seconds, a heartbeat (HEALTH_CMD) is
+            sent: a missing response, as well as any connection error detected by callers,
+            closes the session, which is reopened with jittered exponential backoff
+            (RETRY_TIME .. RETRY_MAX) and logged again with the latest ACT-USER command.
+            The 'ready' event is cleared during the recovery: commands sent in the meantime
+            wait for it (up to their timeout) instead of retrying on their own.
+            It has no effect for transport="asyncio"
+            interval : (seconds) idle time before a heartbeat
+        """
+        if self.__async is not None  or  self.__health_thread is not None:
+            return
 
+        self.__health_time = interval
 
-    def event_collection_stop(self):
-        """ Stop TL1 event collection
-        """
-        self.__enable_collect = False
+        if self.__main.if_cmd is None:
+            self.ready.clear()
+        else:
+            self.ready.set()
 
+        self.__health_wake.clear()
+        self.__health_thread = threading.Thread(target=self.__health_loop,
+                                                name="TL1_Health_Monitor")
+        self.__health_thread.daemon = True
+        self.__health_thread.start()
 
-    def thr_event_terminate(self):
-        """ TODO
+        self.__trc_dbg("TL1 health monitor enabled (interval={}s)".format(interval))
+
+
+    def health_stop(self):
+        """ Stop the health monitor of main CMD session
         """
-        with self.__thread_lock:
-            self.__do_event_loop = False
+        thread = self.__health_thread
+        if thread is None:
+            return
+
+        self.__health_thread = None
+        self.__health_wake.set()
+        thread.join()
 
+        self.__trc_dbg("TL1 health monitor disabled")
 
-    def __thr_manager(self):
+
+    def __health_loop(self):
         """ INTERNAL USAGE
+            Heartbeat on idle main CMD session, recovery with backoff on failures
         """
-        # thread main
+        backoff = TL1Backoff(self.RETRY_TIME, self.RETRY_MAX)
+        delay   = 0
+
         while True:
-            with self.__thread_lock:
-                do_repeat = self.__do_event_loop
+            self.__health_wake.wait(delay)
+            self.__health_wake.clear()
 
-            if do_repeat:
-                self.__thr_init()
-                self.__thr_event_loop()
-            else:
+            if self.__health_thread is not threading.current_thread():
                 break
 
+            if self.ready.is_set():
+                if self.__heartbeat():
+                    delay = self.__health_time
+                    continue
+                self.__trc_dbg("TL1: no response to heartbeat on CMD channel")
+                self.ready.clear()
+
+            if self.__recover():
+                backoff.reset()
+                self.ready.set()
+                delay = self.__health_time
+            else:
+                delay = backoff.next_delay()
+                self.__trc_dbg("... retrying in {:.1f}s ...".format(delay))
+
 
-    def __thr_init(self):
+    def __heartbeat(self):
         """ INTERNAL USAGE
+            Send HEALTH_CMD on idle main session. Return False for a dead session
         """
-        connected = False
+        session = self.__main
 
-        while not connected:
-            with self.__thread_lock:
-                do_repeat = self.__do_event_loop
+        if self.__pipe_active  or  time.time() - session.last_rx < self.__health_time:
+            # Session in use (the pipeline reader detects the failures on its own)
+            return True
 
-            if not do_repeat:
-                break
+        if not session.lock.acquire(blocking=False):
+            return True
 
-            if self.__enable_collect:
-                connected = self.__do("EVE", "ACT-USER::admin:MYTAG::Alcatel1;", policy="COMPLD")
-            time.sleep(1)
+        try:
+            return self.__raw_command(session.if_cmd, session.framer, self.HEALTH_CMD) is not None
+        except Exception:
+            return False
+        finally:
+            session.lock.release()
 
 
-    def __thr_event_loop(self):
+    def __recover(self):
         """ INTERNAL USAGE
+            Replace the connection of main session, repeating the login if the session
+            was logged. Return True on success
         """
-        collected_items = 0
+        session = self.__main
 
-        while True:
-            with self.__thread_lock:
-                do_repeat = self.__do_event_loop
+        self.__trc_dbg("(re)CONNECTING TL1 (health monitor)...")
 
-            if not do_repeat:
-                break
+        if session.if_cmd is not None:
+            try:
+                session.if_cmd.close()
+            except Exception:
+                pass
 
-            tl1_response  = ""
+        tl1_interface = None
+        try:
+            tl1_interface = self.__new_telnet("CMD")
 
-            while True:
-                result_list = self.__if_eve.expect([b"\n\>", b"\n\;"], timeout=100)
+            if session.logged:
+                tl1_response = self.__raw_command(tl1_interface, session.framer, self.__login_cmd)
+                if tl1_response is None  or  not self.__check_policy(tl1_response, "COMPLD"):
+                    raise EOFError("login refused")
 
-                if result_list[0] == -1:
-                    # Timeout Detected
-                    print("timeout durante evento")
-                    continue
+        except Exception as eee:
+            self.__trc_dbg("TL1: error recovering CMD channel - {:s}".format(str(eee)))
+            if tl1_interface is not None:
+                tl1_interface.close()
+            return False
 
-                msg_tmp = str(result_list[2], 'utf-8')
-                print("[{}]".format(msg_tmp))
+        session.framer.reset()
+        session.last_rx = time.time()
+        session.if_cmd  = tl1_interface
 
-                if msg_tmp.find("\r\n\n") == -1:
-                    continue
+        self.__trc_dbg("... TL1 INTERFACE for commands ready.")
 
-                response_partial_list = msg_tmp.split("\r\n\n")
-                msg_tmp = "\r\n\n".join(response_partial_list[1:])
+        return True
 
-                if   result_list[0] ==  1:
-                    # Ending block detected (';' at begin of line)
-                    tl1_response = tl1_response + re.sub('(\r\n)+', "\r\n", msg_tmp, 0)
-                    if tl1_response.strip() == ";":
-                        continue
-                    break
 
-                elif result_list[0] ==  0:
-                    # Continuoing mark detected ('>' at begin of line)
-                    tl1_response = tl1_response + msg_tmp + "\n"
-                    continue
+    def __raw_command(self, tl1_interface, framer, cmd):
+        """ INTERNAL USAGE
+            Send a command on a CMD connection, out of user's interactions (health monitor).
+            The terminating response block is returned (None after HEALTH_WAIT seconds)
+        """
+        end_time = time.time() + self.HEALTH_WAIT
 
-            tl1_response = re.sub('(\r\n)+', "\r\n", tl1_response, 0)
+        tl1_interface.read_very_eager()
+        framer.reset()
+        tl1_interface.write(cmd.encode())
 
-            if self.__enable_collect:
-                collected_items = collected_items + 1
-                print("EVENTO COLLEZIONATO #{}".format(collected_items))
-                print(tl1_response)
-                msg_coded = TL1message(tl1_response)
-                self.__f.writelines("{:s}\n".format(msg_coded.decode("JSON")))
+        while True:
+            block = framer.next_block()
+
+            if block is None:
+                remaining = end_time - time.time()
+                if remaining <= 0  or  not select.select([tl1_interface], [], [], remaining)[0]:
+                    return None
+                framer.feed(tl1_interface.read_very_eager())
+                continue
+
+            marker, payload = block
+
+            if marker == TL1Framer.MARK_TERM  and  payload is not None:
+                if payload.find(b" REPT ") == -1  and  payload.find(b"KEEP ALIVE MESSAGE") == -1:
+                    self.__main.last_rx = time.time()
+                    return TL1Framer.join([payload])
+
+
+    def __wait_ready(self, failed_interface):
+        """ INTERNAL USAGE
+            Ask the health monitor for recovering the main session (if the failed
+            connection is still in use) and wait for it, up to the time mark
+        """
+        if self.__main.if_cmd is failed_interface  and  self.ready.is_set():
+            self.ready.clear()
+            self.__health_wake.set()
+
+        if not self.ready.wait(max(self.__tls.time_mark - time.time(), 0)):
+            self.__trc_error("TL1: Timeout on connection")
+            raise KFrameException("TL1: Timeout on connection")
+
+        return self.__main.if_cmd
+
+
+    def pipeline_start(self, window=PIPE_WINDOW):
+        """ Enable the pipelined mode on CMD channel.
+            Each command is sent with an unique CTAG and up to 'window' commands could be
+            outstanding at the same time; responses are routed back to callers by CTAG.
+            While active, also do() and do_until() are served by the pipeline.
+            window : max number of outstanding commands
+        """
+        if self.__pipe_active:
+            return
+
+        self.__tls.time_mark = time.time() + self.TL1_TIMEOUT
+
+        self.__pipe_window = threading.BoundedSemaphore(window)
+
+        if self.__async is not None:
+            # Responses routed by asyncio client
+            self.__pipe_active = True
+            self.__trc_dbg("TL1 pipelined mode enabled (window={:d})".format(window))
+            return
+
+        if self.__main.if_cmd is None:
+            self.__connect("CMD")
+
+        self.__main.framer.reset()
+        self.__pipe_active = True
+
+        self.__pipe_thread = threading.Thread(target=self.__pipe_reader,
+                                              name="TL1_Pipeline_Reader")
+        self.__pipe_thread.daemon = True
+        self.__pipe_thread.start()
+
+        self.__trc_dbg("TL1 pipelined mode enabled (window={:d})".format(window))
+
+
+    def pipeline_stop(self, timeout=TL1_TIMEOUT):
+        """ Disable the pipelined mode, waiting for all outstanding commands
+            timeout : (seconds) max waiting time for outstanding commands
+        """
+        if not self.__pipe_active:
+            return
+
+        end_time = time.time() + timeout
+        while time.time() < end_time:
+            with self.__pipe_lock:
+                if len(self.__pipe_pending) == 0:
+                    break
+            time.sleep(0.01)
+
+        self.__pipe_active = False
+
+        if self.__pipe_thread is not None:
+            self.__pipe_thread.join()
+            self.__pipe_thread = None
+
+        self.__pipe_fail_all("TL1 PIPELINE STOPPED")
+
+        self.__trc_dbg("TL1 pipelined mode disabled")
+
+
+    def do_async(self, cmd, timeout=TL1_TIMEOUT):
+        """ Send the specified TL1 command without waiting for its response.
+            A TL1Future is returned; its result() is the TL1 response (multi-line string).
+            The pipelined mode is enabled with default window, if not already active.
+            The call blocks while the pipeline window is full.
+            cmd     : the TL1 command string
+            timeout : (seconds) max waiting time for a free slot on pipeline window
+        """
+        if not self.__pipe_active:
+            self.pipeline_start()
+
+        self.__cache_write(cmd)
+
+        return self.__pipe_submit(cmd, timeout)
+
+
+    def do_many(self, cmd_list, policy="COMPLD", timeout=TL1_TIMEOUT, window=None):
+        """ Send a list of TL1 commands in pipelined mode.
+            A list of result (True/False), one for each command, is returned.
+            Each command is reported separately on KUnit
+            cmd_list : list of TL1 command strings
+            policy   : "COMPLD" / "DENY" - see do()
+            timeout  : (seconds) timeout for the whole list
+            window   : max number of outstanding commands (only if pipeline not already active)
+        """
+        was_active = self.__pipe_active
+
+        if not was_active:
+            if window is None:
+                self.pipeline_start()
+            else:
+                self.pipeline_start(window)
+
+        end_time = time.time() + timeout
+
+        future_list = []
+        window_err  = None
+        try:
+            for cmd in cmd_list:
+                future_list.append(self.do_async(cmd, max(end_time - time.time(), 0)))
+        except KFrameException as eee:
+            # Pipeline window still full: the commands already sent are reported anyway
+            window_err = eee
+            self.__trc_error("error on pipelined command '{:s}' - {}".format(cmd, eee))
+
+        result_list = []
+        for future in future_list:
+            error_msg = ""
+            try:
+                tl1_response = future.result(timeout=max(end_time - time.time(), 0))
+                result = self.__check_policy(tl1_response, policy)
+            except Exception as eee:
+                self.__pipe_abandon(future)
+                tl1_response = "TIMEOUT DETECTED ON TL1 INTERFACE"
+                error_msg = "error on pipelined command '{:s}' - {}".format(future.cmd, eee)
+                self.__trc_error(error_msg)
+                result = False
+
+            self.__tls.last_cmd    = future.cmd
+            self.__tls.last_output = tl1_response
+
+            if result:
+                self.__t_success(future.cmd, future.get_elapsed(), tl1_response)
+            else:
+                self.__t_failure(future.cmd, future.get_elapsed(), tl1_response, error_msg)
+
+            result_list.append(result)
+
+        if not was_active:
+            self.pipeline_stop()
+
+        if window_err is not None:
+            raise window_err
+
+        return result_list
+
+
+    def do_batch(self, cmd_list, policy="COMPLD", timeout=TL1_TIMEOUT, size=BATCH_SIZE):
+        """ Send a list of TL1 commands, coalescing consecutive RTRV-xxx commands with same
+            verb and parameters into a single command on an AID list/range
+            (i.e. "RTRV-EQPT::PP1GE-1-1-1&&-4&PP1GE-1-1-18;" for five commands).
+            A list of result (True/False), one for each command, is returned.
+            Each command is reported separately on KUnit, with only the rows of command AID
+            (an empty output for AIDs without rows) and an equal share of the coalesced
+            command time; command statistics (see get_stats()) count the coalesced command
+            once. A missing AID is a failure, except for verbs allowing AIDs without rows
+            (see BATCH_EMPTY, i.e. RTRV-COND-xxx on an AID without alarms).
+            When a coalesced command fails, its commands are sent one by one.
+            Provisioning commands (ENT/ED/DLT...) are sent as they are: a failed coalesced
+            command could be partially applied, and its response doesn't tell which AIDs.
+            Commands without a single AID (i.e. "ALL", lists) are sent as they are.
+            cmd_list : list of TL1 command strings
+            policy   : "COMPLD" / "DENY" - see do() (with "DENY", commands aren't coalesced)
+            timeout  : (seconds) timeout for the whole list
+            size     : max number of AIDs on a coalesced command
+        """
+        self.__tls.time_mark = time.time() + timeout
+
+        # Split list on sequences of commands with same verb/parameters
+        batch_list = []     # list of (key, [(index, fields), ...])
+        for idx,cmd in enumerate(cmd_list):
+            fields = cmd.strip().rstrip(";").split(":")
+
+            if policy == "COMPLD"  and  len(fields) > 2  and  self.BATCH_AID.match(fields[2])  and  \
+               fields[0].strip().upper().startswith("RTRV-"):
+                key = (fields[0].strip().upper(), fields[1], tuple(fields[4:]))
+            else:
+                key = None
+
+            if key is not None  and  len(batch_list) > 0  and  batch_list[-1][0] == key  and  \
+               len(batch_list[-1][1]) < size:
+                batch_list[-1][1].append((idx, fields))
+            else:
+                batch_list.append((key, [(idx, fields)]))
+
+        result_list = [False] * len(cmd_list)
+
+        for key,items in batch_list:
+            if len(items) == 1:
+                result_list[items[0][0]] = self.__do_batch_item(cmd_list[items[0][0]], policy)
+                continue
+
+            fields = list(items[0][1])
+            fields[2] = self.__batch_aid([elem[2] for _,elem in items])
+            if len(fields) > 3:
+                fields[3] = ""
+            batch_cmd = "{:s};".format(":".join(fields))
+
+            if self.__krepo:
+                self.__krepo.start_time()
+
+            start_time = time.time()
+            try:
+                result = self.__do_cached(batch_cmd, "COMPLD")
+            except KFrameException:
+                result = False
+            elapsed = (time.time() - start_time) / len(items)
+
+            tl1_response = self.__tls.last_output
+
+            if not result:
+                self.__trc_dbg("coalesced command failed [{:s}] - sending one by one".format(batch_cmd))
+                for idx,_ in items:
+                    result_list[idx] = self.__do_batch_item(cmd_list[idx], policy)
+                continue
+
+            # Response rows, by AID
+            row_type = TL1message.get_row_type(batch_cmd)
+            row_list = {}
+            for line in tl1_response.split("\n"):
+                if line.strip().startswith('"'):
+                    row_list.setdefault(TL1message.get_row_aid(line, row_type), []).append(line)
+
+            # The coalesced command is COMPLD: a missing AID fails only if rows are required
+            rows_required = not key[0].startswith(self.BATCH_EMPTY)
+
+            for idx,elem in items:
+                # Only rows of this AID
+                out_text = "\n".join(row_list.get(elem[2].strip(), []))
+                result   = out_text != ""  or  not rows_required
+
+                self.__tls.last_cmd    = cmd_list[idx]
+                self.__tls.last_output = out_text
+
+                if result:
+                    self.__t_success(cmd_list[idx], elapsed, out_text)
+                else:
+                    self.__t_failure(cmd_list[idx], elapsed, out_text, "AID not found on response")
+
+                result_list[idx] = result
+
+        return result_list
+
+
+    def __do_batch_item(self, cmd, policy):
+        """ INTERNAL USAGE
+            Send a command of do_batch() list, as it is
+        """
+        self.__tls.last_cmd = cmd
+
+        if self.__krepo:
+            self.__krepo.start_time()
+
+        error_msg = ""
+        try:
+            result = self.__do_cached(cmd, policy)
+        except KFrameException as eee:
+            error_msg = str(eee)
+            result = False
+
+        if result:
+            self.__t_success(cmd, None, self.get_last_outcome())
+        else:
+            self.__t_failure(cmd, None, self.get_last_outcome(), error_msg)
+
+        return result
+
+
+    @staticmethod
+    def __batch_aid(aid_list):
+        """ INTERNAL USAGE
+            Build an AID list, with ranges for consecutive indexes
+            (i.e. ["MDL-1-1-1", "MDL-1-1-2", "MDL-1-1-3", "MDL-1-1-7"] -> "MDL-1-1-1&&-3&MDL-1-1-7")
+            Indexes are kept as text (i.e. "PP1GE-1-1-01&&-03"): a range doesn't join
+            zero-padded indexes of different width
+        """
+        index_list = {}     # AID prefix -> list of indexes (ordered by first occurrence)
+        for aid in aid_list:
+            prefix,index = aid.strip().rsplit("-", 1)
+            index_list.setdefault(prefix, []).append(index)
+
+        item_list = []
+        for prefix,indexes in index_list.items():
+            indexes = sorted(set(indexes), key=lambda index: (int(index), len(index)))
+            first = last = indexes[0]
+            for index in indexes[1:] + [None]:
+                if index is not None  and  int(index) == int(last) + 1  and  \
+                   (len(index) == len(last)  or  index[0] != "0"  and  last[0] != "0"):
+                    last = index
+                    continue
+                if first == last:
+                    item_list.append("{:s}-{:s}".format(prefix, first))
+                else:
+                    item_list.append("{:s}-{:s}&&-{:s}".format(prefix, first, last))
+                first = last = index
+
+        return "&".join(item_list)
+
+
+    def __pipe_submit(self, cmd, timeout, on_block=None):
+        """ INTERNAL USAGE
+            Send a command on pipeline, assigning an unique CTAG
+            on_block : callable invoked with each response block (see do_stream())
+        """
+        queued = self.__tls.queued or time.time()
+
+        if not self.__pipe_window.acquire(timeout=timeout):
+            raise KFrameException("TL1: TIMEOUT WAITING FOR PIPELINE WINDOW")
+
+        future = TL1Future(cmd)
+        future.wait = time.time() - queued
+
+        if on_block is None:
+            # Streamed responses are recorded by do_stream()
+            future.add_done_callback(self.__pipe_stat)
+
+        tl1_verb = cmd.replace(";", "").split(":")[0].lower().strip()
+
+        with self.__pipe_lock:
+            ctag = self.__new_ctag()
+            future.ctag = ctag
+            self.__pipe_pending[ctag] = [future, [], on_block]
+            future.add_done_callback(self.__pipe_cancelled)
+
+            self.__trc_dbg("sending [{:s}] (CTAG {:s})".format(cmd, ctag))
+
+            if self.__async is None:
+                if not self.__write("CMD", TL1Framer.tag_cmd(cmd, ctag)):
+                    self.__pipe_pending.pop(ctag)
+                    self.__pipe_window.release()
+                    raise KFrameException("TIMEOUT DETECTED ON TL1 INTERFACE")
+
+                if tl1_verb == "canc-user":
+                    # No response expected
+                    self.__pipe_pending.pop(ctag)
+                    self.__pipe_window.release()
+                    self.__pipe_resolve(future, " COMPLD ")
+
+                return future
+
+        # Outside of pipeline lock: the command could be completed immediately
+        self.__async_submit(future, on_block)
+
+        return future
+
+
+    def __pipe_stat(self, future):
+        """ INTERNAL USAGE
+            Record statistics of a completed pipelined command
+        """
+        if future.cancelled()  or  future.exception() is not None:
+            return
+
+        self.__stats.record(self.__stat_verb(future.cmd),
+                            future.wait + future.get_elapsed(),
+                            wait=future.wait,
+                            ttfb=future.get_ttfb(),
+                            size=len(future.result()))
+
+
+    def __stat_record(self, cmd, sent_time, first_time, tl1_response, keepalive=0):
+        """ INTERNAL USAGE
+            Record statistics of a completed command (see get_stats())
+            sent_time  : sending time of command
+            first_time : receiving time of first response data (None: unknown)
+        """
+        start_time = self.__tls.queued or sent_time
+
+        ttfb = None
+        if first_time is not None:
+            ttfb = first_time - sent_time
+
+        self.__stats.record(self.__stat_verb(cmd),
+                            time.time() - start_time,
+                            wait=sent_time - start_time,
+                            ttfb=ttfb,
+                            size=len(tl1_response),
+                            keepalive=keepalive)
+
+
+    @staticmethod
+    def __stat_verb(cmd):
+        """ INTERNAL USAGE
+        """
+        return cmd.replace(";", "").split(":")[0].strip().upper()
+
+
+    def __async_submit(self, future, on_block=None):
+        """ INTERNAL USAGE
+            Send a pipelined command through asyncio client
+        """
+        def on_done(async_future):
+            with self.__pipe_lock:
+                if self.__pipe_pending.pop(future.ctag, None) is None:
+                    return      # abandoned command
+                self.__pipe_window.release()
+
+            if async_future.exception() is not None:
+                self.__pipe_resolve(future, error=KFrameException(str(async_future.exception())))
+            else:
+                self.__pipe_resolve(future, async_future.result())
+
+        TL1AsyncLoop.submit(self.__async.do(future.cmd, ctag=future.ctag,
+                                            on_block=on_block)).add_done_callback(on_done)
+
+
+    def __pipe_abandon(self, future):
+        """ INTERNAL USAGE
+            Forget an outstanding command (i.e. on timeout)
+        """
+        with self.__pipe_lock:
+            entry = self.__pipe_pending.get(future.ctag)
+            if entry is not None  and  entry[0] is future:
+                self.__pipe_pending.pop(future.ctag)
+                self.__pipe_window.release()
+
+
+    def __pipe_cancelled(self, future):
+        """ INTERNAL USAGE
+            Done callback of pipelined commands: a command cancelled by caller
+            is forgotten and its pipeline window slot released
+        """
+        if future.cancelled():
+            self.__pipe_abandon(future)
+
+
+    @staticmethod
+    def __pipe_resolve(future, result=None, error=None):
+        """ INTERNAL USAGE
+            Complete a pipelined command; a command already cancelled by caller is ignored
+        """
+        try:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            pass
+
+
+    def __pipe_fail_all(self, error_msg):
+        """ INTERNAL USAGE
+            Abort all outstanding commands
+        """
+        with self.__pipe_lock:
+            entry_list = list(self.__pipe_pending.values())
+            for _ in entry_list:
+                self.__pipe_window.release()
+            self.__pipe_pending = {}
+
+        for future,_,_ in entry_list:
+            self.__pipe_resolve(future, error=KFrameException(error_msg))
+
+
+    def __pipe_reader(self):
+        """ INTERNAL USAGE
+            Collect responses from CMD channel and route them to callers by CTAG
+        """
+        while self.__pipe_active:
+            block = self.__main.framer.next_block()
+
+            if block is None:
+                try:
+                    if len(select.select([self.__main.if_cmd], [], [], 1)[0]) > 0:
+                        self.__main.framer.feed(self.__main.if_cmd.read_very_eager())
+                except Exception as eee:
+                    self.__trc_error("TL1: error on CMD channel - {}".format(eee))
+                    self.__pipe_fail_all("TIMEOUT DETECTED ON TL1 INTERFACE")
+                    self.__main.framer.reset()
+                    if not self.__pipe_reconnect():
+                        # Pipeline closed: callers fall back on direct mode (see __do_dispatch())
+                        self.__pipe_active = False
+                        self.__pipe_fail_all("TIMEOUT DETECTED ON TL1 INTERFACE")
+                        return
+                continue
+
+            marker, payload = block
+
+            if payload is None:
+                continue
+
+            ctag = TL1Framer.get_ctag(payload)
+
+            with self.__pipe_lock:
+                entry = self.__pipe_pending.get(ctag)
+                if entry is None:
+                    # Spontaneous message, keep alive or abandoned command
+                    continue
+
+                if entry[0].first_rx is None:
+                    entry[0].first_rx = time.time()
+
+                if entry[2] is not None:
+                    # Streamed response (see do_stream())
+                    entry[2](marker, payload)
+                    entry[1] = []
+
+                entry[1].append(payload)
+
+                if marker == TL1Framer.MARK_CONT:
+                    # Continuoing mark detected ('>' at begin of line)
+                    entry[1].append(b"\n")
+                    continue
+
+                self.__pipe_pending.pop(ctag)
+                self.__pipe_window.release()
+
+            self.__pipe_resolve(entry[0], TL1Framer.join(entry[1]))
+
+
+    def __pipe_reconnect(self):
+        """ INTERNAL USAGE
+            Reopen the CMD channel for the pipeline reader, repeating the login if the
+            session was logged (as __recover() does). Return True on success
+        """
+        session    = self.__main
+        was_logged = session.logged
+
+        self.__tls.time_mark = time.time() + self.TL1_TIMEOUT
+
+        try:
+            tl1_interface = self.__connect("CMD")
+
+            if was_logged  and  not session.logged:
+                tl1_response = self.__raw_command(tl1_interface, session.framer, self.__login_cmd)
+                if tl1_response is None  or  not self.__check_policy(tl1_response, "COMPLD"):
+                    raise EOFError("login refused")
+                session.logged = True
+
+        except Exception as eee:
+            self.__trc_error("TL1: pipeline reader stopped - {:s}".format(str(eee)))
+            return False
+
+        session.framer.reset()
+
+        return True
+
+
+    def __new_ctag(self):
+        """ INTERNAL USAGE
+            Return an unused CTAG (TL1 allows up to 6 characters)
+        """
+        while True:
+            ctag = str(next(self.__ctag_seq) % 1000000)
+            if ctag not in self.__pipe_pending:
+                return ctag
+
+
+    @staticmethod
+    def __check_policy(tl1_response, policy):
+        """ INTERNAL USAGE
+            Evaluate a TL1 response against expected policy ("COMPLD"/"DENY")
+        """
+        if  (tl1_response.find(" COMPLD") != -1  or
+             tl1_response.find(" DELAY")  != -1  ):
+            # Positive TL1 response
+            return (policy == "COMPLD")
+
+        # Negative TL1 response
+        return (policy == "DENY")
+
+
+    def __do_pipelined(self, cmd, policy):
+        """ INTERNAL USAGE
+            Send a command on pipeline and wait for its response
+        """
+        future = self.__pipe_submit(cmd, max(self.__tls.time_mark - time.time(), 0))
+
+        try:
+            tl1_response = future.result(timeout=max(self.__tls.time_mark - time.time(), 0))
+        except Exception as eee:
+            self.__pipe_abandon(future)
+            self.__trc_error("error [3] sending TL1 command [{:s}] - {}".format(cmd, eee))
+            self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+            raise KFrameException(self.__tls.last_output)
+
+        self.__tls.last_output = tl1_response
+
+        return self.__check_policy(tl1_response, policy)
+
+
+    def __do_asyncio(self, cmd, policy):
+        """ INTERNAL USAGE
+            Send a command through asyncio client and wait for its response
+        """
+        self.__trc_dbg("sending [{:s}]".format(cmd))
+
+        sent_time = time.time()
+
+        try:
+            remaining = max(self.__tls.time_mark - time.time(), 0)
+            tl1_response = TL1AsyncLoop.run(self.__async.do(cmd, timeout=remaining), remaining + 1)
+        except Exception as eee:
+            self.__trc_error("error [3] sending TL1 command [{:s}] - {}".format(cmd, eee))
+            self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+            raise KFrameException(self.__tls.last_output)
+
+        self.__stat_record(cmd, sent_time, None, tl1_response)
+
+        self.__tls.last_output = tl1_response
+
+        return self.__check_policy(tl1_response, policy)
+
+
+    def __do(self, channel, cmd, policy):
+        """ INTERNAL USAGE
+        """
+        self.__tls.last_cmd = cmd   # added for internal running invocation
+
+        if self.__tls.queued is not None:
+            return self.__do_dispatch(channel, cmd, policy)
+
+        # Outermost invocation - waiting time is counted from here (see get_stats())
+        self.__tls.queued = time.time()
+        try:
+            return self.__do_dispatch(channel, cmd, policy)
+        finally:
+            self.__tls.queued = None
+
+
+    def __do_dispatch(self, channel, cmd, policy):
+        """ INTERNAL USAGE
+            Send a command according to current mode (pipelined, asyncio, pool, direct)
+        """
+        if channel == "CMD"  and  self.__pipe_active:
+            return self.__do_pipelined(cmd, policy)
+
+        if channel == "CMD"  and  self.__async is not None:
+            return self.__do_asyncio(cmd, policy)
+
+        if channel == "CMD"  and  self.__pool is not None  and  self.__tls.session is None:
+            return self.__do_pooled(cmd, policy)
+
+        with self.__session().lock:
+            return self.__do_direct(channel, cmd, policy)
+
+
+    def __do_direct(self, channel, cmd, policy):
+        """ INTERNAL USAGE
+            Send a command on current telnet session and wait for its response
+        """
+        if channel == "CMD":
+            self.__trc_dbg("sending [{:s}]".format(cmd))
+        else:
+            self.__trc_dbg("sending [{:s}] (EVENT INTERFACE)".format(cmd))
+
+        tl1_verb = cmd.replace(";", "").split(":")[0].lower().replace("\r", "").replace("\n", "")
+
+        # Trash all trailing characters from stream
+        if self.__read_all(channel) == False:
+            self.__trc_error("error [1] sending TL1 command [{:s}]".format(cmd))
+            self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+            raise KFrameException(self.__tls.last_output)
+            return False
+
+        # Sending command to interface
+        if self.__write(channel, cmd) == False:
+            self.__trc_error("error [2] sending TL1 command [{:s}]".format(cmd))
+            self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+            raise KFrameException(self.__tls.last_output)
+            return False
+
+        sent_time       = time.time()
+        first_time      = None
+        keepalive_count = 0
+
+        if cmd.lower() == "canc-user;":
+            tl1_response = " COMPLD "
+        else:
+            response_parts = []
+
+            keepalive_count_max = 100
+
+            while True:
+                block = self.__session().framer.next_block()
+
+                if block is None:
+                    if not self.__read_chunk(channel):
+                        self.__trc_error("error [3] sending TL1 command [{:s}]".format(cmd))
+                        self.__tls.last_output = "TIMEOUT DETECTED ON TL1 INTERFACE"
+                        raise KFrameException(self.__tls.last_output)
+                        return False
+                    if first_time is None:
+                        first_time = self.__session().last_rx
+                    continue
+
+                marker, payload = block
+
+                if payload is None:
+                    continue
+
+                if marker == TL1Framer.MARK_TERM:
+                    if payload.find(b" REPT ") != -1:
+                        continue
+
+                    elif payload.find(b"KEEP ALIVE MESSAGE") != -1:
+                        keepalive_count = keepalive_count + 1
+                        if keepalive_count == keepalive_count_max:
+                            self.__trc_error("error [4] sending TL1 command [{:s}]".format(cmd))
+                            self.__tls.last_output = "MAXIMUM KEEPALIVE ON TL1 RESPONSE REACHED"
+                            raise KFrameException(self.__tls.last_output)
+                            return False
+                        continue
+
+                    else:
+                        response_parts.append(payload)
+                        if tl1_verb != "ed-pid"  and  tl1_verb != "act-user":
+                            if sum([part.count(b";") for part in response_parts]) > 1:
+                                self.__trc_error("error [5] sending TL1 command [{:s}]".format(cmd))
+                                self.__tls.last_output = "INVALID TL1 TERMINATION"
+                                raise KFrameException(self.__tls.last_output)
+                                return False
+                        if len(response_parts) == 1  and  payload.strip() == b";":
+                            response_parts = []
+                            continue
+                        break
+
+                elif marker == TL1Framer.MARK_CONT:
+                    response_parts.append(payload)
+                    response_parts.append(b"\n")
+                    continue
+
+            tl1_response = TL1Framer.join(response_parts)
+
+        if channel == "CMD":
+            self.__stat_record(cmd, sent_time, first_time, tl1_response, keepalive_count)
+
+        result = self.__check_policy(tl1_response, policy)
+
+        self.__tls.last_output = tl1_response
+
+        if channel == "CMD":
+            self.__track_login(tl1_verb, cmd, tl1_response)
+
+        return result
+
+
+    def __track_login(self, tl1_verb, cmd, tl1_response):
+        """ INTERNAL USAGE
+            Update the login state of current CMD session
+        """
+        if tl1_verb == "act-user":
+            if self.__check_policy(tl1_response, "COMPLD"):
+                self.__session().logged = True
+                self.__login_cmd = cmd
+        elif tl1_verb == "canc-user":
+            self.__session().logged = False
+
+
+    def __read_all(self, channel):
+        """ INTERNAL USAGE
+        """
+        tl1_interface = self.__session().if_cmd
+
+        for _ in (1,2):
+            try:
+                while str(tl1_interface.read_very_eager().strip(), 'utf-8') != "":
+                    pass
+                self.__session().framer.reset()
+                return True
+            except Exception:
+                tl1_interface = self.__connect(channel, tl1_interface)  # renewing interface
+
+        return False
+
+
+    def __write(self, channel, cmd):
+        """ INTERNAL USAGE
+        """
+        tl1_interface = self.__session().if_cmd
+
+        for _ in (1,2):
+            try:
+                tl1_interface.write(cmd.encode())
+                return True
+            except Exception:
+                tl1_interface = self.__connect(channel, tl1_interface)  # renewing interface
+
+        return False
+
+
+    def __read_chunk(self, channel):
+        """ INTERNAL USAGE
+            Wait for data on interface and feed the framer
+        """
+        tl1_interface = self.__session().if_cmd
+
+        for _ in (1,2):
+            try:
+                remaining = max(self.__tls.time_mark - time.time(), 0)
+                if not select.select([tl1_interface], [], [], remaining)[0]:
+                    return False
+                self.__session().framer.feed(tl1_interface.read_very_eager())
+                self.__session().last_rx = time.time()
+                return True
+            except Exception:
+                self.__session().framer.reset()
+                tl1_interface = self.__connect(channel, tl1_interface)  # renewing interface
+
+        return False
+
+
+    def __connect(self, channel, failed_interface=None):
+        """ INTERNAL USAGE
+            Open a new CMD connection for the session of calling thread, retrying with
+            jittered exponential backoff (the EVE channel is served by TL1EventReactor).
+            While the health monitor is active, the main CMD session is recovered by the
+            monitor and the caller just waits for it (see health_start())
+        """
+        session = self.__session()
+
+        if session is self.__main  and  self.__health_thread is not None:
+            return self.__wait_ready(failed_interface)
+
+        self.__trc_dbg("(re)CONNECTING TL1...")
+        session.logged = False
+        if session is self.__main:
+            self.ready.clear()
+        end_time = self.__tls.time_mark
+
+        backoff = TL1Backoff(self.RETRY_TIME, self.RETRY_MAX)
+
+        while True:
+            try:
+                tl1_interface = self.__new_telnet(channel)
+                break
+            except Exception as eee:
+                self.__trc_dbg("TL1: error connecting {:s} channel - {:s}".format(channel, str(eee)))
+                remaining = end_time - time.time()
+                if remaining <= 0:
+                    self.__trc_error("TL1: Timeout on connection")
+                    raise KFrameException("TL1: Timeout on connection")
+                delay = min(backoff.next_delay(), remaining)
+                self.__trc_dbg("... retrying in {:.1f}s ...".format(delay))
+                time.sleep(delay)
+
+        self.__trc_dbg("... TL1 INTERFACE for commands ready.")
+        session.if_cmd  = tl1_interface
+        session.last_rx = time.time()
+        if session is self.__main:
+            self.ready.set()
+
+        return tl1_interface
+
+
+    def __new_telnet(self, channel):
+        """ INTERNAL USAGE
+            Open a telnet connection (recorded on transcript, if any)
+        """
+        if self.__transcript is None:
+            tl1_interface = telnetlib.Telnet(self.__the_ip, self.__the_port, 5)
+        else:
+            tl1_interface = TL1RecTelnet(self.__transcript, channel, self.__the_ip, self.__the_port, 5)
+
+        TL1EventReactor.set_keepalive(tl1_interface.get_socket())
+
+        return tl1_interface
+
+
+    def __disconnect(self):
+        """ INTERNAL USAGE
+        """
+        if self.__eve_channel is not None:
+            TL1EventReactor.get_reactor().detach(self.__eve_channel)
+            self.__eve_channel = None
+
+        try:
+            self.__do("CMD", "CANC-USER;", "COMPLD")
+        except Exception as eee:
+            msg = "Error in disconnection - {:s}".format(str(eee))
+            self.__trc_error(msg)
+            raise KFrameException(msg)
+
+        self.__main.if_cmd = None
+
+
+    def alarm_mirror_start(self, reconcile=ALARM_TIME, cmd=ALARM_CMD):
+        """ Start the mirror of active conditions of equipment (see TL1AlarmMirror).
+            The mirror is seeded by 'cmd' (on CMD channel) and kept current by REPT ALM /
+            REPT EVT messages received on EVE channel; it is seeded again every
+            'reconcile' seconds (on a daemon thread), fixing any drift (i.e. events lost
+            during an EVE channel reconnection).
+            Then is_active(), wait_raise(), wait_clear() and alarms() are local lookups.
+            A logged CMD session is needed. False is returned if the first seed fails
+            reconcile : (seconds) reconciliation interval (0: never)
+            cmd       : seed command (a RTRV-COND-xxx)
+        """
+        if self.__alarms is not None:
+            return True
+
+        self.__alarm_cmd  = cmd
+        self.__alarm_time = reconcile
+        self.__alarms     = TL1AlarmMirror()
+
+        if not self.__alarm_seed():
+            self.__alarms = None
+            return False
+
+        if reconcile > 0:
+            self.__alarm_wake.clear()
+            self.__alarm_thread = threading.Thread(target=self.__alarm_loop,
+                                                   name="TL1_Alarm_Mirror")
+            self.__alarm_thread.daemon = True
+            self.__alarm_thread.start()
+
+        self.__trc_dbg("TL1 alarm mirror enabled (reconcile={}s)".format(reconcile))
+
+        return True
+
+
+    def alarm_mirror_stop(self):
+        """ Stop (and discard) the mirror of active conditions
+        """
+        thread = self.__alarm_thread
+        if thread is not None:
+            self.__alarm_thread = None
+            self.__alarm_wake.set()
+            thread.join()
+
+        if self.__alarms is not None:
+            self.__alarms = None
+            self.__trc_dbg("TL1 alarm mirror disabled")
+
+
+    def alarm_mirror_stats(self):
+        """ Return a dictionary with alarm mirror counters (see TL1AlarmMirror.stats())
+            None if alarm mirror is disabled
+        """
+        if self.__alarms is None:
+            return None
+
+        return self.__alarms.stats()
+
+
+    def is_active(self, aid, cond=None):
+        """ True if the condition is active on AID, on alarm mirror (see alarm_mirror_start())
+            aid  : the AID (i.e. "MDL-1-1-18")
+            cond : Condition Type (i.e. "ABNORMAL" - None: any condition)
+        """
+        return self.__alarm_mirror().is_active(aid, cond)
+
+
+    def wait_raise(self, aid, cond=None, timeout=TL1_TIMEOUT):
+        """ Wait until the condition is active on AID (see is_active())
+            False is returned on timeout
+        """
+        return self.__alarm_mirror().wait(aid, cond, True, timeout)
+
+
+    def wait_clear(self, aid, cond=None, timeout=TL1_TIMEOUT):
+        """ Wait until the condition isn't active on AID (see is_active())
+            False is returned on timeout
+        """
+        return self.__alarm_mirror().wait(aid, cond, False, timeout)
+
+
+    def alarms(self, aid=None):
+        """ Return the active conditions on alarm mirror (on specified AID, if any), as
+            tuples (AID, Condition Type, notification code, service effect)
+        """
+        return self.__alarm_mirror().get_active(aid)
+
+
+    def __alarm_mirror(self):
+        """ INTERNAL USAGE
+        """
+        alarms = self.__alarms
+
+        if alarms is None:
+            raise KFrameException("TL1: alarm mirror not active (see alarm_mirror_start())")
+
+        return alarms
+
+
+    def __alarm_seed(self):
+        """ INTERNAL USAGE
+            Seed the alarm mirror with the response of seed command
+        """
+        alarms = self.__alarms
+        if alarms is None:
+            return False
+
+        since = time.time()
+
+        self.__tls.time_mark = since + self.TL1_TIMEOUT
+
+        if not self.__do("CMD", self.__alarm_cmd, "COMPLD"):
+            self.__trc_dbg("TL1 alarm mirror: [{:s}] failed".format(self.__alarm_cmd))
+            return False
+
+        drift = alarms.seed(self.__tls.last_output, since)
+        if drift > 0:
+            self.__trc_dbg("TL1 alarm mirror: {:d} conditions fixed by reconciliation".format(drift))
+
+        return True
+
+
+    def __alarm_loop(self):
+        """ INTERNAL USAGE
+            Periodic reconciliation of alarm mirror
+        """
+        while True:
+            self.__alarm_wake.wait(self.__alarm_time)
+            self.__alarm_wake.clear()
+
+            if self.__alarm_thread is not threading.current_thread():
+                break
+
+            try:
+                self.__alarm_seed()
+            except Exception as eee:
+                self.__trc_dbg("TL1 alarm mirror: reconciliation failed ({})".format(eee))
+
+
+    def event_collection_start(self, *filters, verbs=None, aids=None):
+        """ Start TL1 event collection
+            Without filters, all autonomous messages are collected.
+            filters : one or more TL1check instances; an event is collected if it
+                      satisfies at least one of them (see TL1check.evaluate_event())
+            verbs   : list of Verb prefixes (i.e. ["REPT ALM", "REPT EVT"])
+            aids    : list of AIDs
+            The verbs/aids prefilter is applied on raw message, before decoding;
+            the discarded messages are only counted (see event_collection_stats())
+        """
+        self.__eve_filters = list(filters)
+        self.__eve_verbs   = None if verbs is None else tuple(verbs)
+        self.__eve_aids    = None if aids  is None else frozenset(aids)
+        self.__enable_collect = True
+
+
+    def event_collection_stop(self):
+        """ Stop TL1 event collection
+        """
+        self.__enable_collect = False
+        self.__f.flush()
+
+
+    def event_collection_stats(self):
+        """ Return a dictionary with counters of autonomous messages:
+            "received"  : messages received on EVE channel
+            "dropped"   : messages discarded by collection filters
+            "collected" : messages written on collector file
+        """
+        return { "received"  : self.__received,
+                 "dropped"   : self.__dropped,
+                 "collected" : self.__collected }
+
+
+    def events(self, since=None, aid=None, cond=None, code=None, until=None):
+        """ Return the list of collected events (TL1message instances) matching all
+            specified criteria, ordered by receiving time.
+            Only the latest EVE_STORE events are kept in memory.
+            since : receiving time lower bound (seconds since epoch, i.e. time.time())
+            aid   : AID of event
+            cond  : Condition Type of event (i.e. "ABNORMAL")
+            code  : Message code ("*C" / "**" / "*" / "A")
+            until : receiving time upper bound (seconds since epoch)
+        """
+        return self.__eve_store.events(since=since, until=until, aid=aid, cond=cond, code=code)
+
+
+    def wait_event(self, check, timeout=TL1_TIMEOUT, since=None):
+        """ Wait for an event matching the specified filter.
+            The matching event (TL1message instance) is returned, or None on timeout.
+            check   : instance of TL1check class (see TL1check.evaluate_event())
+            timeout : (seconds) max waiting time
+            since   : also events received after this time are evaluated (default: now)
+        """
+        if since is None:
+            since = time.time()
+
+        end_time = time.time() + timeout
+
+        waiter = self.__eve_waiter_add(check)
+
+        try:
+            while True:
+                waiter[1].clear()
+
+                for msg in self.__eve_store.events(since=since):
+                    if check.evaluate_event(msg)[0]:
+                        return msg
+
+                if time.time() >= end_time:
+                    return None
+
+                waiter[1].wait(end_time - time.time())
+        finally:
+            self.__eve_waiter_del(waiter)
+
+
+    def thr_event_terminate(self):
+        """ Terminate the TL1 Event Collector (and the health monitor and the alarm mirror,
+            if active)
+        """
+        self.health_stop()
+        self.alarm_mirror_stop()
+
+        if self.__eve_channel is not None:
+            TL1EventReactor.get_reactor().detach(self.__eve_channel)
+            self.__eve_channel = None
+
+        if self.__async is not None:
+            self.__async.stop_events()
+            TL1AsyncLoop.run(self.__async.close())
+
+        self.__f.close()
+
+        if self.__transcript is not None:
+            self.__transcript.close()
+
+        if self.__replay is not None:
+            self.__replay.stop()
+
+
+    def __eve_trace(self, kind, data):
+        """ INTERNAL USAGE
+            Record the data of EVE channel on transcript (on reactor thread)
+        """
+        if kind == "O":
+            self.__eve_stream = self.__transcript.open_stream("EVE")
+        else:
+            self.__transcript.write(self.__eve_stream, kind, data)
+
+
+    def __event_ingest(self, tl1_response):
+        """ INTERNAL USAGE
+            Process an autonomous message received on EVE channel
+        """
+        with self.__eve_lock:
+            waiters = list(self.__eve_waiters)
+
+        self.__received = self.__received + 1
+
+        if self.__cache is not None:
+            match = self.EVE_PEEK.search(tl1_response)
+            if match is not None:
+                self.__cache.invalidate(match.group(2))
+
+        wanted = self.__enable_collect  and  self.__eve_prefilter(tl1_response)
+        alarms = self.__alarms
+
+        if not wanted  and  len(waiters) == 0  and  alarms is None:
+            if self.__enable_collect:
+                self.__dropped = self.__dropped + 1
+            return
+
+        recv_time = time.time()
+
+        msg_coded = TL1message(tl1_response)
+
+        if alarms is not None:
+            alarms.apply(msg_coded, recv_time)
+
+        if not wanted  and  len(waiters) == 0:
+            if self.__enable_collect:
+                self.__dropped = self.__dropped + 1
+            return
+
+        if msg_coded.get_eve_type() is not None:
+            self.__eve_store.add(msg_coded, recv_time)
+
+        # Wake up callers waiting for this AID
+        the_aid = msg_coded.get_eve_aid()
+        if the_aid is not None:
+            for check,flag in waiters:
+                if check.match_aid(the_aid):
+                    flag.set()
+
+        if wanted  and  len(self.__eve_filters) > 0:
+            wanted = False
+            for check in self.__eve_filters:
+                if check.evaluate_event(msg_coded)[0]:
+                    wanted = True
+                    break
+
+        if not wanted:
+            if self.__enable_collect:
+                self.__dropped = self.__dropped + 1
+            return
+
+        if self.__enable_collect:
+            self.__collected = self.__collected + 1
+            if self.__echo:
+                print("EVENTO COLLEZIONATO #{}".format(self.__collected))
+                print(tl1_response)
+            self.__f.write(msg_coded, recv_time)
+
+
+    def __eve_prefilter(self, tl1_response):
+        """ INTERNAL USAGE
+            Evaluate Verb and AID of an autonomous message, without decoding it
+        """
+        if self.__eve_verbs is None  and  self.__eve_aids is None:
+            return True
+
+        match = self.EVE_PEEK.search(tl1_response)
+        if match is None:
+            return False
+
+        if self.__eve_verbs is not None:
+            the_verb = " ".join(match.group(1).split())
+            if not the_verb.startswith(self.__eve_verbs):
+                return False
+
+        if self.__eve_aids is not None:
+            if match.group(2) not in self.__eve_aids:
+                return False
+
+        return True
 
 
     def __t_success(self, title, elapsed_time, out_text):
         """ INTERNAL USAGE
+            elapsed_time : None (see KUnit.start_time()) or seconds
         """
         if self.__krepo:
-            self.__krepo.add_success(self.__eqpt_ref, title, elapsed_time, out_text)
+            self.__krepo.add_success(self.__eqpt_ref, title, self.__t_elapsed(elapsed_time), out_text)
 
 
     def __t_failure(self, title, e_time, out_text, err_text, log_text=None):
         """ INTERNAL USAGE
         """
         if self.__krepo:
-            self.__krepo.add_failure(self.__eqpt_ref, title, e_time, out_text, err_text, log_text)
+            self.__krepo.add_failure(self.__eqpt_ref, title, self.__t_elapsed(e_time), out_text,
+                                     err_text, log_text)
 
 
     def __t_skipped(self, title, e_time, out_text, err_text, skip_text=None):
         """ INTERNAL USAGE
         """
         if self.__krepo:
-            self.__krepo.add_skipped(self.__eqpt_ref, title, e_time, out_text, err_text, skip_text)
+            self.__krepo.add_skipped(self.__eqpt_ref, title, self.__t_elapsed(e_time), out_text,
+                                     err_text, skip_text)
+
+
+    @staticmethod
+    def __t_elapsed(e_time):
+        """ INTERNAL USAGE
+            KUnit format of an elapsed time (seconds)
+        """
+        return None if e_time is None else str(e_time)
 
 
     def __trc_dbg(self, msg, level=None):
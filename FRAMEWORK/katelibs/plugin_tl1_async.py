@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+"""
+###############################################################################
+# MODULE: plugin_tl1_async.py
+#         asyncio based TL1 transport for 1850TSS Equipments.
+#         All TL1 connections (commands and events) of all equipments
+#         running in a process share a single event loop thread
+#
+# AUTHOR: C.Ghelfi
+# DATE  : 14/01/2016
+#
+###############################################################################
+"""
+
+import asyncio
+import itertools
+import threading
+
+from katelibs.facility_tl1  import TL1Framer
+
+
+class TL1AsyncLoop():
+    """
+    Process-wide asyncio event loop, running on a dedicated thread
+    """
+    __loop   = None
+    __thread = None
+    __lock   = threading.Lock()
+
+
+    @classmethod
+    def get_loop(cls):
+        """ Return the shared event loop (started on first call)
+        """
+        with cls.__lock:
+            if cls.__loop is None:
+                cls.__loop = asyncio.new_event_loop()
+                cls.__thread = threading.Thread(target=cls.__loop.run_forever,
+                                                name="TL1_Async_Loop")
+                cls.__thread.daemon = True
+                cls.__thread.start()
+
+        return cls.__loop
+
+
+    @classmethod
+    def submit(cls, coro):
+        """ Schedule a coroutine on shared event loop.
+            A concurrent.futures.Future is returned
+        """
+        return asyncio.run_coroutine_threadsafe(coro, cls.get_loop())
+
+
+    @classmethod
+    def run(cls, coro, timeout=None):
+        """ Run a coroutine on shared event loop and wait for its result
+            timeout : (seconds) max waiting time (None: no limit)
+        """
+        return cls.submit(coro).result(timeout)
+
+
+
+class AsyncTL1Client():
+    """
+    asyncio TL1 client for a 1850TSS Equipment.
+    Commands are sent on CMD channel with an unique CTAG and responses are routed back
+    by CTAG, so many commands could be outstanding at the same time.
+    Autonomous messages are collected on a separate EVE channel.
+    """
+
+    def __init__(self, IP, PORT=3083, ktrc=None, ctag_seq=None):
+        """
+        IP       : equipment's IP Address
+        PORT     : TL1 interface Port
+        ktrc     : reference to Kate Tracer
+        ctag_seq : CTAG generator shared with caller (default: a private one), so
+                   that CTAGs chosen by caller never clash with the ones of client
+        """
+        self.__the_ip    = IP
+        self.__the_port  = PORT
+        self.__ktrc      = ktrc
+        self.__ctag_seq  = ctag_seq             # CTAG generator
+        self.__reader    = None                 # CMD channel - stream reader
+        self.__writer    = None                 # CMD channel - stream writer
+        self.__rd_task   = None                 # CMD channel - response dispatcher
+        self.__pending   = {}                   # CTAG -> [Future, partial response blocks, on_block]
+        self.__conn_lock = None                 # serialize CMD channel (re)connection
+        self.__ev_task   = None                 # EVE channel - event reader
+
+        if self.__ctag_seq is None:
+            self.__ctag_seq = itertools.count(1)
+
+
+    async def open(self, timeout=5):
+        """ Open the CMD channel
+            timeout : (seconds) connection timeout
+        """
+        if self.__conn_lock is None:
+            self.__conn_lock = asyncio.Lock()
+
+        async with self.__conn_lock:
+            if self.__writer is not None:
+                return
+
+            self.__trc_dbg("(re)CONNECTING TL1 (asyncio)...")
+
+            self.__reader, self.__writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.__the_ip, self.__the_port), timeout)
+
+            self.__rd_task = asyncio.ensure_future(self.__cmd_dispatcher())
+
+            self.__trc_dbg("... TL1 INTERFACE for commands ready.")
+
+
+    async def close(self):
+        """ Close CMD and EVE channels
+        """
+        if self.__ev_task is not None:
+            self.__ev_task.cancel()
+            self.__ev_task = None
+
+        if self.__rd_task is not None:
+            self.__rd_task.cancel()
+            self.__rd_task = None
+
+        if self.__writer is not None:
+            self.__writer.close()
+            self.__writer = None
+
+        self.__fail_all(EOFError("TL1 CHANNEL CLOSED"))
+
+
+    async def do(self, cmd, timeout=None, ctag=None, on_block=None):
+        """ Send a TL1 command and return its response (multi-line string)
+            cmd      : the TL1 command string
+            timeout  : (seconds) max waiting time for response (None: no limit)
+            ctag     : CTAG to use for command (default: an unique CTAG)
+            on_block : callable invoked (on event loop thread) with (marker, payload) of each
+                       response block (see TL1Framer.next_block()). The blocks aren't
+                       accumulated and only the last one is returned
+        """
+        await self.open()
+
+        if ctag is None:
+            ctag = self.__new_ctag()
+
+        future = asyncio.get_running_loop().create_future()
+        self.__pending[ctag] = [future, [], on_block]
+
+        self.__writer.write(TL1Framer.tag_cmd(cmd, ctag).encode())
+        await self.__writer.drain()
+
+        if cmd.replace(";", "").split(":")[0].lower().strip() == "canc-user":
+            # No response expected
+            self.__pending.pop(ctag, None)
+            return " COMPLD "
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.__pending.pop(ctag, None)
+
+
+    def start_events(self, login_cmd, is_enabled, on_event):
+        """ Start the EVE channel reader on shared event loop.
+            login_cmd  : ACT-USER command for EVE channel
+            is_enabled : callable returning True when events have to be collected
+            on_event   : callable invoked (on event loop thread) with each autonomous message
+        """
+        async def start():
+            self.__ev_task = asyncio.ensure_future(self.__event_reader(login_cmd,
+                                                                       is_enabled,
+                                                                       on_event))
+        TL1AsyncLoop.run(start())
+
+
+    def stop_events(self):
+        """ Stop the EVE channel reader
+        """
+        async def stop():
+            if self.__ev_task is not None:
+                self.__ev_task.cancel()
+                self.__ev_task = None
+        TL1AsyncLoop.run(stop())
+
+
+    async def __cmd_dispatcher(self):
+        """ INTERNAL USAGE
+            Route responses of CMD channel to waiting commands by CTAG
+        """
+        framer = TL1Framer()
+        writer = self.__writer
+        error  = EOFError("TL1 CHANNEL CLOSED")
+
+        try:
+            while True:
+                marker, payload = await self.read_block(self.__reader, framer)
+                if payload is None:
+                    continue
+
+                ctag  = TL1Framer.get_ctag(payload)
+                entry = self.__pending.get(ctag)
+                if entry is None:
+                    # Spontaneous message, keep alive or abandoned command
+                    continue
+
+                if entry[2] is not None:
+                    try:
+                        entry[2](marker, payload)
+                    except Exception as eee:
+                        # Only this command fails
+                        self.__pending.pop(ctag)
+                        if not entry[0].done():
+                            entry[0].set_exception(eee)
+                        continue
+                    entry[1] = []
+
+                entry[1].append(payload)
+
+                if marker == TL1Framer.MARK_CONT:
+                    # Continuoing mark detected ('>' at begin of line)
+                    entry[1].append(b"\n")
+                    continue
+
+                self.__pending.pop(ctag)
+                if not entry[0].done():
+                    entry[0].set_result(TL1Framer.join(entry[1]))
+
+        except (OSError, EOFError) as eee:
+            self.__trc_dbg("TL1: CMD channel closed - {}".format(eee))
+            error = eee
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as eee:
+            self.__trc_dbg("TL1: error on CMD channel - {}".format(eee))
+            error = eee
+
+        finally:
+            # The channel is reopened by next command (unless already replaced)
+            if self.__writer is writer:
+                self.__writer = None
+                writer.close()
+                self.__fail_all(error)
+
+
+    async def __event_reader(self, login_cmd, is_enabled, on_event):
+        """ INTERNAL USAGE
+            Login on EVE channel and dispatch all autonomous messages
+        """
+        while True:
+            if not is_enabled():
+                await asyncio.sleep(1)
+                continue
+
+            writer = None
+            try:
+                reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.__the_ip, self.__the_port), 5)
+                self.__trc_dbg("... TL1 INTERFACE for events ready.")
+
+                login_ctag = self.__new_ctag()
+                writer.write(TL1Framer.tag_cmd(login_cmd, login_ctag).encode())
+                await writer.drain()
+
+                framer = TL1Framer()
+
+                while True:
+                    tl1_response = framer.next_message()
+                    if tl1_response is None:
+                        data = await reader.read(65536)
+                        if not data:
+                            raise EOFError("connection closed by peer")
+                        framer.feed(data)
+                        continue
+
+                    if TL1Framer.get_ctag(tl1_response) == login_ctag:
+                        if tl1_response.find(" COMPLD") == -1:
+                            raise EOFError("login refused")
+                        continue
+
+                    try:
+                        on_event(tl1_response)
+                    except Exception as eee:
+                        self.__trc_dbg("TL1: error on EVE channel callback - {}".format(eee))
+
+            except (OSError, EOFError, asyncio.TimeoutError) as eee:
+                self.__trc_dbg("TL1: error on EVE channel - {}".format(eee))
+                await asyncio.sleep(1)
+
+            except asyncio.CancelledError:
+                raise
+
+            except Exception as eee:
+                self.__trc_dbg("TL1: error on EVE channel - {}".format(eee))
+                await asyncio.sleep(1)
+
+            finally:
+                if writer is not None:
+                    writer.close()
+
+
+    def __fail_all(self, eee):
+        """ INTERNAL USAGE
+        """
+        for future,_,_ in self.__pending.values():
+            if not future.done():
+                future.set_exception(eee)
+        self.__pending = {}
+
+
+    def __new_ctag(self):
+        """ INTERNAL USAGE
+        """
+        while True:
+            ctag = str(next(self.__ctag_seq) % 1000000)
+            if ctag not in self.__pending:
+                return ctag
+
+
+    @staticmethod
+    async def read_block(reader, framer):
+        """ Read a TL1 block, terminated by '>' (continuation) or ';' (termination)
+            A tuple (marker, payload) is returned (see TL1Framer.next_block())
+            reader : asyncio.StreamReader
+            framer : TL1Framer for unprocessed data (kept between invocations)
+        """
+        while True:
+            block = framer.next_block()
+            if block is not None:
+                return block
+
+            data = await reader.read(65536)
+            if not data:
+                raise EOFError("connection closed by peer")
+            framer.feed(data)
+
+
+    def __trc_dbg(self, msg, level=None):
+        """ INTERNAL USAGE
+        """
+        if self.__ktrc is not None:
+            self.__ktrc.k_tracer_debug(msg, level)
+
+
+
+if __name__ == "__main__":
+    print("DEBUG")
+
+    async def main():
+        client = AsyncTL1Client("135.221.125.79")
+        print(await client.do("ACT-USER::admin:MYTAG::Alcatel1;", timeout=10))
+        responses = await asyncio.gather(*[client.do("RTRV-EQPT::MDL-1-1-{:d};".format(slot))
+                                           for slot in range(1, 21)])
+        for res in responses:
+            print(res)
+        await client.do("CANC-USER;")
+        await client.close()
+
+    TL1AsyncLoop.run(main())
+
+    print("FINE")
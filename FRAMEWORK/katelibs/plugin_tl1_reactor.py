@@ -0,0 +1,459 @@
+#!/usr/bin/env python
+"""
+###############################################################################
+# MODULE: plugin_tl1_reactor.py
+#         Selector based reader of TL1 autonomous messages.
+#         A single thread owns the EVE channels of all equipments running
+#         in a process and dispatches the events to per-equipment sinks
+#
+# AUTHOR: C.Ghelfi
+# DATE  : 18/01/2016
+#
+###############################################################################
+"""
+
+import selectors
+import socket
+import threading
+import atexit
+import itertools
+import random
+import time
+
+from katelibs.facility_tl1  import TL1Framer
+
+
+class TL1Backoff():
+    """
+    Jittered exponential backoff for TL1 (re)connection attempts.
+    The n-th consecutive delay is min(base * 2^n, limit), randomly spread on +/-50%
+    so that many equipments rebooted together don't reconnect in lockstep
+    """
+
+    def __init__(self, base=1, limit=30):
+        """
+        base  : (seconds) delay after first failure
+        limit : (seconds) max delay
+        """
+        self.base     = base
+        self.limit    = limit
+        self.failures = 0       # consecutive failures
+
+
+    def next_delay(self):
+        """ Register a failure and return the delay (seconds) before next attempt
+        """
+        delay = min(self.base * 2 ** self.failures, self.limit)
+
+        if delay < self.limit:
+            self.failures = self.failures + 1
+
+        return delay * random.uniform(0.5, 1.5)
+
+
+    def reset(self):
+        """ Register a success
+        """
+        self.failures = 0
+
+
+
+class TL1EventChannel():
+    """
+    EVE channel of an equipment, served by TL1EventReactor.
+    Instances are created by TL1EventReactor.attach()
+    """
+
+    def __init__(self, IP, PORT, login_cmd, is_enabled, on_event, on_idle=None, ktrc=None,
+                 on_trace=None):
+        """
+        IP         : equipment's IP Address
+        PORT       : TL1 interface Port
+        login_cmd  : ACT-USER command for EVE channel
+        is_enabled : callable returning True when events have to be collected
+        on_event   : callable invoked (on reactor thread) with each autonomous message
+        on_idle    : callable invoked (on reactor thread) when no data is received for a while,
+                     and a last time when the reactor is stopped (i.e. at process exit)
+        ktrc       : reference to Kate Tracer
+        on_trace   : callable invoked (on reactor thread) with (kind, data) for each new
+                     connection ('O'), sent ('S') and received ('R') data (see TL1Transcript)
+        """
+        self.ip         = IP
+        self.port       = PORT
+        self.login_cmd  = login_cmd
+        self.is_enabled = is_enabled
+        self.on_event   = on_event
+        self.on_idle    = on_idle
+        self.ktrc       = ktrc
+        self.on_trace   = on_trace
+        self.sock       = None          # non-blocking socket (None: not connected)
+        self.state      = "IDLE"        # IDLE / CONNECTING / LOGIN / READY
+        self.login_ctag = None          # CTAG of ACT-USER command
+        self.deadline   = 0             # max time for connection and login (see LOGIN_TIME)
+        self.out_buf    = b""           # data not yet sent (the socket is non-blocking)
+        self.framer     = TL1Framer()   # received data, not yet framed
+        self.retry_time = 0             # earliest time for next connection attempt
+        self.backoff    = TL1Backoff(TL1EventReactor.RETRY_TIME, TL1EventReactor.RETRY_MAX)
+        self.last_rx    = 0             # time of latest received data
+        self.detached   = False
+
+
+
+class TL1EventReactor():
+    """
+    Process-wide reactor for TL1 EVE channels.
+    Thread count is constant, whatever is the number of equipments:
+    connection, login, framing ('>' / ';' blocks) and dispatching of autonomous
+    messages are performed on a single thread, driven by a selector (epoll on Linux).
+    Errors raised by owner callbacks (on_event, on_idle) are traced and don't affect
+    the connection. The reactor is stopped at process exit (see stop())
+    """
+    SELECT_TIME = 1      # (seconds) max blocking time on selector
+    RETRY_TIME  = 1      # (seconds) delay after first failed connection attempt
+    RETRY_MAX   = 30     # (seconds) max delay between two connection attempts
+    LOGIN_TIME  = 10     # (seconds) max time for connection and login of a channel
+    KEEP_IDLE   = 30     # (seconds) TCP keepalive - idle time before first probe
+    KEEP_INTVL  = 10     # (seconds) TCP keepalive - interval between probes
+    KEEP_CNT    = 3      # TCP keepalive - unanswered probes for a dead connection
+
+    __instance = None
+    __lock     = threading.Lock()
+
+
+    @classmethod
+    def get_reactor(cls):
+        """ Return the shared reactor (started on first call)
+        """
+        with cls.__lock:
+            if cls.__instance is None:
+                cls.__instance = cls()
+                atexit.register(cls.__instance.stop)
+
+        return cls.__instance
+
+
+    def __init__(self):
+        """ INTERNAL USAGE - use get_reactor()
+        """
+        self.__selector  = selectors.DefaultSelector()
+        self.__channels  = []                       # served TL1EventChannel instances
+        self.__requests  = []                       # attach/detach requests
+        self.__req_lock  = threading.Lock()         # protect requests area
+        self.__ctag_seq  = itertools.count(1)       # CTAG generator for login commands
+        self.__last_mnt  = 0                        # time of latest channels maintenance
+        self.__running   = True                     # False after stop()
+
+        # Wake up of selector for attach/detach requests
+        self.__wake_r, self.__wake_w = socket.socketpair()
+        self.__wake_r.setblocking(False)
+        self.__selector.register(self.__wake_r, selectors.EVENT_READ, None)
+
+        self.__thread = threading.Thread(target=self.__reactor_loop, name="TL1_Event_Reactor")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+
+    def attach(self, IP, PORT, login_cmd, is_enabled, on_event, on_idle=None, ktrc=None,
+               on_trace=None):
+        """ Serve the EVE channel of an equipment. A TL1EventChannel instance is returned
+            (see TL1EventChannel for parameters)
+        """
+        channel = TL1EventChannel(IP, PORT, login_cmd, is_enabled, on_event, on_idle, ktrc,
+                                  on_trace)
+
+        self.__request("ATTACH", channel)
+
+        return channel
+
+
+    def detach(self, channel):
+        """ Stop serving an EVE channel. The connection is closed
+        """
+        channel.detached = True
+
+        self.__request("DETACH", channel)
+
+
+    def stop(self, timeout=5):
+        """ Stop the reactor thread: on_idle of each channel is invoked a last time
+            (i.e. flushing buffered events) and all connections are closed.
+            It is registered at process exit, as the reactor thread is a daemon
+            timeout : (seconds) max waiting time for reactor thread
+        """
+        with TL1EventReactor.__lock:
+            if TL1EventReactor.__instance is self:
+                TL1EventReactor.__instance = None
+
+        if not self.__thread.is_alive():
+            return
+
+        self.__request("STOP", None)
+
+        if self.__thread is not threading.current_thread():
+            self.__thread.join(timeout)
+
+
+    @classmethod
+    def set_keepalive(cls, sock):
+        """ Enable TCP keepalive on a TL1 socket: a dead peer (i.e. a rebooted equipment)
+            is detected within KEEP_IDLE + KEEP_INTVL * KEEP_CNT seconds of silence
+        """
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+        for option,value in (("TCP_KEEPIDLE",  cls.KEEP_IDLE),
+                             ("TCP_KEEPINTVL", cls.KEEP_INTVL),
+                             ("TCP_KEEPCNT",   cls.KEEP_CNT)):
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+
+    def __request(self, action, channel):
+        """ INTERNAL USAGE
+        """
+        with self.__req_lock:
+            self.__requests.append((action, channel))
+
+        try:
+            self.__wake_w.send(b"\0")
+        except OSError:
+            pass
+
+
+    def __reactor_loop(self):
+        """ INTERNAL USAGE
+        """
+        while self.__running:
+            ready_list = self.__selector.select(self.SELECT_TIME)
+
+            for key,mask in ready_list:
+                channel = key.data
+
+                if channel is None:
+                    self.__serve_requests()
+                    continue
+
+                try:
+                    if channel.state == "CONNECTING":
+                        self.__on_connected(channel)
+                        continue
+                    if mask & selectors.EVENT_WRITE:
+                        self.__flush(channel)
+                    if mask & selectors.EVENT_READ:
+                        self.__on_readable(channel)
+                except Exception as eee:
+                    self.__close(channel, "error on EVE channel - {}".format(eee))
+
+            now = time.time()
+
+            if now - self.__last_mnt >= self.SELECT_TIME:
+                self.__last_mnt = now
+                self.__maintenance(now)
+
+
+    def __maintenance(self, now):
+        """ INTERNAL USAGE
+            (re)connect the enabled channels, close the ones not logged in time,
+            notify the idle ones
+        """
+        for channel in list(self.__channels):
+            try:
+                if channel.state == "IDLE":
+                    if now >= channel.retry_time  and  channel.is_enabled():
+                        self.__open(channel)
+                elif channel.state != "READY"  and  now >= channel.deadline:
+                    self.__close(channel, "timeout on EVE channel {}".format(channel.state))
+                elif now - channel.last_rx >= self.SELECT_TIME  and  channel.on_idle is not None:
+                    self.__notify(channel, channel.on_idle)
+            except Exception as eee:
+                self.__close(channel, "error on EVE channel - {}".format(eee))
+
+
+    def __serve_requests(self):
+        """ INTERNAL USAGE
+        """
+        try:
+            while self.__wake_r.recv(4096):
+                pass
+        except OSError:
+            pass
+
+        with self.__req_lock:
+            requests = self.__requests
+            self.__requests = []
+
+        for action,channel in requests:
+            if action == "STOP":
+                for channel in self.__channels:
+                    if channel.on_idle is not None:
+                        self.__notify(channel, channel.on_idle)
+                    self.__logout(channel)
+                self.__channels = []
+                self.__running  = False
+            elif action == "ATTACH":
+                if not channel.detached:
+                    self.__channels.append(channel)
+            else:
+                if channel in self.__channels:
+                    self.__channels.remove(channel)
+                self.__logout(channel)
+
+
+    def __logout(self, channel):
+        """ INTERNAL USAGE
+            Close a channel, logging out a logged one
+        """
+        if channel.state == "READY":
+            try:
+                self.__send(channel, b"CANC-USER;")
+            except OSError:
+                pass
+
+        self.__close(channel, None)
+
+
+    def __open(self, channel):
+        """ INTERNAL USAGE
+            Start a non-blocking connection
+        """
+        self.__trc_dbg(channel, "(re)CONNECTING TL1 (Event channel)...")
+
+        channel.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        channel.sock.setblocking(False)
+        self.set_keepalive(channel.sock)
+        channel.sock.connect_ex((channel.ip, channel.port))
+        channel.state    = "CONNECTING"
+        channel.deadline = time.time() + self.LOGIN_TIME
+
+        if channel.on_trace is not None:
+            channel.on_trace("O", b"")
+
+        self.__selector.register(channel.sock, selectors.EVENT_WRITE, channel)
+
+
+    def __on_connected(self, channel):
+        """ INTERNAL USAGE
+            Connection completed - send login command
+        """
+        error = channel.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error != 0:
+            raise OSError(error, "connection failed")
+
+        channel.login_ctag = str(next(self.__ctag_seq) % 1000000)
+        channel.state      = "LOGIN"
+
+        self.__send(channel, TL1Framer.tag_cmd(channel.login_cmd, channel.login_ctag).encode())
+
+
+    def __on_readable(self, channel):
+        """ INTERNAL USAGE
+            Frame received data and dispatch complete messages
+        """
+        data = channel.sock.recv(65536)
+        if not data:
+            raise EOFError("connection closed by peer")
+
+        if channel.on_trace is not None:
+            channel.on_trace("R", data)
+
+        channel.framer.feed(data)
+        channel.last_rx = time.time()
+
+        while True:
+            tl1_response = channel.framer.next_message()
+            if tl1_response is None:
+                break
+
+            if channel.state == "LOGIN"  and  TL1Framer.get_ctag(tl1_response) == channel.login_ctag:
+                if tl1_response.find(" COMPLD") == -1:
+                    raise EOFError("login refused")
+                channel.state = "READY"
+                channel.backoff.reset()
+                self.__trc_dbg(channel, "... TL1 INTERFACE for events ready.")
+                continue
+
+            self.__notify(channel, channel.on_event, tl1_response)
+
+
+    def __notify(self, channel, callback, *args):
+        """ INTERNAL USAGE
+            Invoke an owner callback: its errors are traced, the connection is kept open
+        """
+        try:
+            callback(*args)
+        except Exception as eee:
+            self.__trc_dbg(channel, "TL1: error on EVE channel callback - {}".format(eee))
+
+
+    def __close(self, channel, reason):
+        """ INTERNAL USAGE
+        """
+        if reason is not None:
+            self.__trc_dbg(channel, "TL1: {}".format(reason))
+
+        if channel.sock is not None:
+            try:
+                self.__selector.unregister(channel.sock)
+            except (KeyError, ValueError):
+                pass
+            channel.sock.close()
+
+        channel.sock       = None
+        channel.state      = "IDLE"
+        channel.out_buf    = b""
+        channel.framer.reset()
+        channel.retry_time = time.time() + channel.backoff.next_delay()
+
+
+    def __send(self, channel, data):
+        """ INTERNAL USAGE
+            Queue data on a channel and send as much as possible: the remainder is sent
+            when the socket is writable again (see __flush())
+        """
+        if channel.on_trace is not None:
+            channel.on_trace("S", data)
+
+        channel.out_buf = channel.out_buf + data
+
+        self.__flush(channel)
+
+
+    def __flush(self, channel):
+        """ INTERNAL USAGE
+            Send pending data of a channel, without blocking
+        """
+        try:
+            while channel.out_buf != b"":
+                sent = channel.sock.send(channel.out_buf)
+                channel.out_buf = channel.out_buf[sent:]
+        except BlockingIOError:
+            pass
+
+        events = selectors.EVENT_READ
+        if channel.out_buf != b"":
+            events = events | selectors.EVENT_WRITE
+
+        self.__selector.modify(channel.sock, events, channel)
+
+
+    @staticmethod
+    def __trc_dbg(channel, msg, level=None):
+        """ INTERNAL USAGE
+        """
+        if channel.ktrc is not None:
+            channel.ktrc.k_tracer_debug(msg, level)
+
+
+
+if __name__ == "__main__":
+    print("DEBUG")
+
+    def show(tl1_msg):
+        print(tl1_msg)
+
+    reactor = TL1EventReactor.get_reactor()
+    chan = reactor.attach("135.221.125.79", 3083, "ACT-USER::admin:MYTAG::Alcatel1;",
+                          lambda: True, show)
+    time.sleep(60)
+    reactor.detach(chan)
+
+    print("FINE")
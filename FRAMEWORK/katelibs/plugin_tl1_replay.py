@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+"""
+###############################################################################
+# MODULE: plugin_tl1_replay.py
+#         Replay transport for TL1 plugin: a local TCP server serving back the
+#         TL1 conversations recorded on a transcript (see TL1Transcript), at
+#         recorded speed or as fast as possible
+#
+# AUTHOR: C.Ghelfi
+# DATE  : 29/01/2016
+#
+###############################################################################
+"""
+
+import socketserver
+import threading
+import time
+import re
+
+from katelibs.facility_tl1  import TL1Transcript
+
+
+
+class TL1ReplaySession(socketserver.BaseRequestHandler):
+    """
+    A connection to replay server, bound to a recorded stream on its first command
+    """
+
+    def handle(self):
+        """ INTERNAL USAGE
+            Split the received data on ';' and replay the response of each command
+        """
+        server  = self.server.replay
+        records = None      # records of bound stream
+        pos     = 0         # next record to replay
+        buf     = b""
+
+        while True:
+            try:
+                data = self.request.recv(4096)
+            except OSError:
+                return
+
+            if not data:
+                return
+
+            buf = buf + data
+
+            while b";" in buf:
+                cmd, buf = buf.split(b";", 1)
+                cmd = cmd.strip() + b";"
+
+                if records is None:
+                    records = server.bind(cmd)
+
+                idx = None if records is None else server.find_sent(records, pos, cmd)
+
+                if idx is None:
+                    server.mismatch(cmd)
+                    self.request.sendall(server.deny(cmd))
+                    continue
+
+                pos = server.replay(self.request, records, idx, cmd)
+
+
+
+class TL1ReplayServer():
+    """
+    Local TL1 agent serving back a transcript of a TL1 plugin session.
+    Each new connection is bound, on its first command, to the first unused recorded
+    stream starting with the same command (CTAG excluded). Then each received command
+    is searched forward on bound stream and the data received after it (up to the next
+    sent command) is replayed, rewriting the CTAG if changed. Autonomous messages
+    recorded on EVE channel are replayed after its login, with recorded timing.
+    Unknown commands are refused (DENY IICM).
+    """
+    CMD_CTAG  = re.compile(rb"^([^:]*:[^:]*:[^:]*:)([^:;]*)")
+
+    def __init__(self, transcript_file, speed=1.0, host="127.0.0.1", port=0, ktrc=None):
+        """
+        transcript_file : transcript recorded by TL1 plugin (see TL1Transcript)
+        speed           : replay speed (1.0: recorded timing; 0: as fast as possible)
+        host            : listening address
+        port            : listening port (0: any free port, see get_port())
+        ktrc            : reference to Kate Tracer
+        """
+        self.__speed      = speed
+        self.__host       = host
+        self.__port       = port
+        self.__ktrc       = ktrc
+        self.__lock       = threading.Lock()
+        self.__streams    = [records for _,records in TL1Transcript.load(transcript_file)]
+        self.__bound      = [False] * len(self.__streams)
+        self.__mismatches = 0
+        self.__server     = None
+        self.__thread     = None
+
+
+    def start(self):
+        """ Start serving connections (on a daemon thread)
+        """
+        if self.__server is not None:
+            return
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.__server = socketserver.ThreadingTCPServer((self.__host, self.__port), TL1ReplaySession)
+        self.__server.daemon_threads = True
+        self.__server.replay = self
+
+        self.__thread = threading.Thread(target=self.__server.serve_forever, name="TL1_Replay")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+
+    def stop(self):
+        """ Stop serving connections
+        """
+        if self.__server is None:
+            return
+
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__server = None
+        self.__thread.join()
+        self.__thread = None
+
+
+    def get_port(self):
+        """ Return the listening port
+        """
+        if self.__server is None:
+            return self.__port
+
+        return self.__server.server_address[1]
+
+
+    def get_mismatches(self):
+        """ Return the number of received commands not found on transcript
+        """
+        return self.__mismatches
+
+
+    def bind(self, cmd):
+        """ INTERNAL USAGE
+            Return the records of first unused stream starting with supplied command
+        """
+        with self.__lock:
+            for idx,records in enumerate(self.__streams):
+                if self.__bound[idx]:
+                    continue
+                first = self.find_sent(records, 0, cmd)
+                if first is not None  and  all(kind != "S" for kind,_,_ in records[:first]):
+                    self.__bound[idx] = True
+                    return records
+
+        return None
+
+
+    def find_sent(self, records, pos, cmd):
+        """ INTERNAL USAGE
+            Index of next sent record (from pos) equal to command, CTAG excluded
+        """
+        key = self.__strip_ctag(cmd)
+
+        for idx in range(pos, len(records)):
+            kind, _, data = records[idx]
+            if kind == "S"  and  self.__strip_ctag(data) == key:
+                return idx
+
+        return None
+
+
+    def replay(self, sock, records, idx, cmd):
+        """ INTERNAL USAGE
+            Send the data received after sent record 'idx', up to the next sent record.
+            Return the index of next record to replay
+        """
+        old_ctag = self.__get_ctag(records[idx][2])
+        new_ctag = self.__get_ctag(cmd)
+        anchor   = time.monotonic()
+        base     = records[idx][1]
+
+        idx = idx + 1
+
+        while idx < len(records)  and  records[idx][0] != "S":
+            _, rec_time, data = records[idx]
+
+            if self.__speed > 0:
+                delay = anchor + (rec_time - base) / self.__speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if old_ctag != new_ctag  and  old_ctag != b"":
+                data = re.sub(rb"(\nM\s+)" + re.escape(old_ctag) + rb"(\s)",
+                              rb"\g<1>" + new_ctag + rb"\g<2>", data)
+
+            try:
+                sock.sendall(data)
+            except OSError:
+                return len(records)
+
+            idx = idx + 1
+
+        return idx
+
+
+    def mismatch(self, cmd):
+        """ INTERNAL USAGE
+        """
+        with self.__lock:
+            self.__mismatches = self.__mismatches + 1
+
+        self.__trc_dbg("TL1 replay: command not in transcript [{}]".format(cmd.decode(errors="replace")))
+
+
+    def deny(self, cmd):
+        """ INTERNAL USAGE
+            DENY response for a command not found on transcript
+        """
+        ctag = self.__get_ctag(cmd) or b"0"
+
+        return ( b"\r\n\n   REPLAY " + time.strftime("%y-%m-%d %H:%M:%S").encode() +
+                 b"\r\nM  " + ctag + b" DENY\r\n   IICM\r\n   /* command not in transcript */\r\n;" )
+
+
+    @classmethod
+    def __strip_ctag(cls, cmd):
+        """ INTERNAL USAGE
+        """
+        return cls.CMD_CTAG.sub(rb"\g<1>", cmd.strip(), count=1)
+
+
+    @classmethod
+    def __get_ctag(cls, cmd):
+        """ INTERNAL USAGE
+        """
+        match = cls.CMD_CTAG.match(cmd.strip())
+        if match is None:
+            return b""
+
+        return match.group(2)
+
+
+    def __trc_dbg(self, msg, level=None):
+        """ INTERNAL USAGE
+        """
+        if self.__ktrc is not None:
+            self.__ktrc.k_tracer_debug(msg, level)
+
+
+
+if __name__ == "__main__":
+    print("DEBUG")
+
+    import sys
+
+    server = TL1ReplayServer(sys.argv[1], speed=float(sys.argv[2]) if len(sys.argv) > 2 else 1.0,
+                             port=3083)
+    server.start()
+
+    try:
+        while True:
+            time.sleep(10)
+    except KeyboardInterrupt:
+        server.stop()
+
+    print("FINE")
@@ -0,0 +1,444 @@
+#!/usr/bin/env python
+"""
+###############################################################################
+# MODULE: sim1850tl1.py
+#         Local stand-in of a 1850TSS TL1 agent (TCP server), speaking the same
+#         framing of a real equipment: header, 'M tag COMPLD', '>' continuation
+#         blocks and ';' terminator. Used for offline load and regression
+#         benchmarking of TL1 plugin and facilities (see scripts/bench_tl1.py)
+#
+# AUTHOR: C.Ghelfi
+# DATE  : 27/01/2016
+#
+###############################################################################
+"""
+
+import socketserver
+import threading
+import socket
+import heapq
+import time
+
+
+
+class TL1SimSession(socketserver.BaseRequestHandler):
+    """
+    A TL1 session of simulator (one for each TCP connection)
+    """
+
+    def setup(self):
+        """ INTERNAL USAGE
+        """
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)     # no Nagle delay on responses
+        self.sim     = self.server.sim
+        self.logged  = False
+        self.lock    = threading.Lock()         # serialize responses and autonomous messages
+        self.delayed = []                       # heap of (due time, sequence, text) responses
+        self.seq     = 0                        # sequence of delayed responses (FIFO on same time)
+        self.wake    = threading.Condition()    # protect delayed responses
+        self.sender  = threading.Thread(target=self.__send_delayed, name="TL1_Simulator_Sender")
+        self.sender.daemon = True
+        self.sender.start()
+        self.sim.session_add(self)
+
+
+    def handle(self):
+        """ INTERNAL USAGE
+            Split the received stream on ';' and serve each command
+        """
+        buf = ""
+
+        while True:
+            try:
+                data = self.request.recv(4096)
+            except OSError:
+                return
+
+            if not data:
+                return
+
+            buf = buf + data.decode(errors="replace")
+
+            while ";" in buf:
+                cmd, buf = buf.split(";", 1)
+                cmd = cmd.strip()
+                if cmd != "":
+                    if not self.sim.serve(self, cmd):
+                        return
+
+
+    def finish(self):
+        """ INTERNAL USAGE
+        """
+        with self.wake:
+            self.delayed = None
+            self.wake.notify()
+
+        self.sim.session_del(self)
+
+
+    def send(self, text):
+        """ Send a text on session (errors are ignored: the peer could be gone)
+        """
+        with self.lock:
+            try:
+                self.request.sendall(text.encode())
+                return True
+            except OSError:
+                return False
+
+
+    def send_at(self, due_time, text):
+        """ Send a text on session at 'due_time' (seconds since epoch), without blocking
+            the commands received in the meantime (they are served concurrently, as on a
+            real equipment)
+        """
+        with self.wake:
+            if self.delayed is None:
+                return
+            self.seq = self.seq + 1
+            heapq.heappush(self.delayed, (due_time, self.seq, text))
+            self.wake.notify()
+
+
+    def __send_delayed(self):
+        """ INTERNAL USAGE
+            Send the delayed responses on due time. While a response is pending, a
+            KEEP ALIVE MESSAGE is sent every 'keepalive' seconds (if configured)
+        """
+        alive_time = None       # time of next KEEP ALIVE message
+
+        while True:
+            with self.wake:
+                while self.delayed is not None  and  len(self.delayed) == 0:
+                    alive_time = None
+                    self.wake.wait()
+
+                if self.delayed is None:
+                    return
+
+                now      = time.time()
+                due_time = self.delayed[0][0]
+
+                if alive_time is None  and  self.sim.get_keepalive() > 0:
+                    alive_time = now + self.sim.get_keepalive()
+
+                if due_time <= now:
+                    text = heapq.heappop(self.delayed)[2]
+                    alive_time = None
+                elif alive_time is not None  and  alive_time <= now:
+                    text = self.sim.keepalive_message()
+                    alive_time = None
+                else:
+                    self.wake.wait(min(due_time, alive_time or due_time) - now)
+                    continue
+
+            if not self.send(text):
+                try:
+                    self.request.shutdown(socket.SHUT_RDWR)     # handle() is woken up
+                except OSError:
+                    pass
+                return
+
+
+
+class TL1Simulator():
+    """
+    Local TL1 agent for a simulated 1850TSS equipment.
+    - ACT-USER / CANC-USER are checked against configured user and password;
+      other commands are refused (DENY PLNA) until login
+    - RTRV-xxx commands return a configurable number of rows, split in '>' blocks
+    - other commands are completed without rows
+    - each response is delayed by a configurable latency, without blocking the
+      following commands of session (pipelined commands are served concurrently);
+      during long commands a KEEP ALIVE MESSAGE is sent every 'keepalive' seconds
+    - REPT ALM storms could be injected on all logged sessions (see alarm_storm())
+    """
+    ROW_TEMPLATE  = ( "{aid}::AINSTH=0-1,PTFTYPE=MODVC4,PTFRATE=VC4,RDITYPE=1BIT,SDSFMODE=POISSON,"
+                      "BRSTINTVL=7,BRSTTH=1000,SDTH=6,SFTH=3,TRC=X000000000000000000000000000000,"
+                      "TRCEXPECTED=X000000000000000000000000000000,TRCMON=N,TRCCONSACT=Y,"
+                      "ALMPROF=LBL-ASAPVC4-SYSDFLT,TCAPROF=LBL-THPVC4-SYSDFLT,LOSTRUCT=3xTU3,"
+                      "MGRACD=<null>:OOS-AU,PMD&SGEO" )
+    COND_TEMPLATE = "{aid},EQPT:MN,ABNORMAL,NSA,10-04,17-01-56,NEND"
+    ROW_AID       = "MVC4-1-1-36-{:d}"
+
+
+    def __init__(self, port=3083, host="127.0.0.1", sid="SIM-1850TSS", user="admin",
+                 password="Alcatel1", latency=0.0, rows=1, block_rows=9, keepalive=0, ktrc=None):
+        """
+        port       : TL1 interface port (0: any free port, see get_port())
+        host       : listening address
+        sid        : equipment's SID, reported on message header
+        user       : accepted user (ACT-USER)
+        password   : accepted password (ACT-USER)
+        latency    : (seconds) default delay before each response
+        rows       : default number of rows of RTRV responses (without a specific AID)
+        block_rows : max rows for each response block ('>' continuation)
+        keepalive  : (seconds) interval of KEEP ALIVE messages during a command (0: none)
+        ktrc       : reference to Kate Tracer
+        """
+        self.__host       = host
+        self.__port       = port
+        self.__sid        = sid
+        self.__user       = user
+        self.__password   = password
+        self.__latency    = latency
+        self.__rows       = rows
+        self.__block_rows = block_rows
+        self.__keepalive  = keepalive
+        self.__ktrc       = ktrc
+        self.__responses  = {}                  # verb -> (rows, latency, status) overrides
+        self.__lock       = threading.Lock()    # protect sessions and counters
+        self.__sessions   = []                  # connected TL1SimSession instances
+        self.__atag       = 0                   # ATAG of autonomous messages
+        self.__commands   = 0                   # served commands
+        self.__events     = 0                   # sent autonomous messages
+        self.__server     = None                # TCP server
+        self.__thread     = None                # TCP server thread
+
+
+    def start(self):
+        """ Start serving TL1 connections (on a daemon thread)
+        """
+        if self.__server is not None:
+            return
+
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.__server = socketserver.ThreadingTCPServer((self.__host, self.__port), TL1SimSession)
+        self.__server.daemon_threads = True
+        self.__server.sim = self
+
+        self.__thread = threading.Thread(target=self.__server.serve_forever,
+                                         name="TL1_Simulator")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+        self.__trc_dbg("TL1 simulator listening on {}:{}".format(self.__host, self.get_port()))
+
+
+    def stop(self):
+        """ Stop the simulator, closing all sessions
+        """
+        if self.__server is None:
+            return
+
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__server = None
+        self.__thread.join()
+        self.__thread = None
+
+        with self.__lock:
+            sessions = list(self.__sessions)
+
+        for session in sessions:
+            try:
+                session.request.close()
+            except OSError:
+                pass
+
+
+    def get_port(self):
+        """ Return the listening port
+        """
+        if self.__server is None:
+            return self.__port
+
+        return self.__server.server_address[1]
+
+
+    def set_response(self, verb, rows=None, latency=None, status="COMPLD"):
+        """ Customize the response of a verb
+            verb    : TL1 verb (i.e. "RTRV-EQPT")
+            rows    : number of rows, or a list of row texts (without quotes)
+            latency : (seconds) delay before response (None: default latency)
+            status  : "COMPLD" or a DENY error code (i.e. "IIAC")
+        """
+        self.__responses[verb.upper()] = (rows, latency, status)
+
+
+    def get_counters(self):
+        """ Return a dictionary with number of connected and logged sessions,
+            served commands and sent autonomous messages
+        """
+        with self.__lock:
+            return { "sessions" : len(self.__sessions),
+                     "logged"   : len([s for s in self.__sessions if s.logged]),
+                     "commands" : self.__commands,
+                     "events"   : self.__events }
+
+
+    def alarm_storm(self, count, rate=0, aid=ROW_AID, cond="ABNORMAL", code="MN"):
+        """ Send 'count' REPT ALM messages to all logged sessions (on calling thread)
+            The number of messages sent to each session is returned
+            rate : messages per second (0: as fast as possible)
+            aid  : AID format, with a placeholder for message index
+        """
+        start_time = time.time()
+
+        for idx in range(count):
+            if rate > 0:
+                delay = start_time + idx / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            with self.__lock:
+                self.__atag = (self.__atag + 1) % 1000000
+                atag        = self.__atag
+                sessions    = [s for s in self.__sessions if s.logged]
+                self.__events = self.__events + 1
+
+            text = self.__header("*", atag, "REPT ALM EQPT")
+            text = text + '   "{:s}:{:s},{:s},NSA,{:s},NEND"\r\n;'.format(aid.format(idx + 1), code, cond,
+                                                                    time.strftime("%m-%d,%H-%M-%S"))
+            for session in sessions:
+                session.send(text)
+
+        return count
+
+
+    def build_response(self, cmd, ctag, status="COMPLD", rows=None):
+        """ Return the TL1 response text of a command (see set_response())
+            cmd    : TL1 command (without ';')
+            ctag   : the command CTAG
+            status : "COMPLD" or a DENY error code
+            rows   : number of rows, or a list of row texts (default: from configuration)
+        """
+        if status != "COMPLD":
+            return "{:s}   {:s}\r\n   /* {:s} [{:s}] */\r\n;".format(self.__header("M", ctag, "DENY"),
+                                                                    status, cmd, ctag)
+
+        if rows is None  or  isinstance(rows, int):
+            rows = self.__rows_for(cmd, rows)
+
+        blocks = []
+        for idx in range(0, max(len(rows), 1), self.__block_rows):
+            text = self.__header("M", ctag, "COMPLD")
+            for row in rows[idx:idx + self.__block_rows]:
+                text = text + '   "{:s}"\r\n'.format(row)
+            blocks.append(text)
+
+        return ">".join(blocks) + "   /* {:s} [{:s}] (536871116) */\r\n;".format(cmd, ctag)
+
+
+    def serve(self, session, cmd):
+        """ INTERNAL USAGE
+            Serve a command received on a session. Return False for closing the session
+        """
+        fields = cmd.split(":")
+        while len(fields) < 4:
+            fields.append("")
+
+        verb = fields[0].strip().upper()
+        ctag = fields[3].strip() or "0"
+
+        with self.__lock:
+            self.__commands = self.__commands + 1
+
+        rows, latency, status = self.__responses.get(verb, (None, None, "COMPLD"))
+
+        if verb == "ACT-USER":
+            if fields[2] != self.__user  or  len(fields) < 6  or  fields[5] != self.__password:
+                status = "PIUI"     # Privilege, Illegal User Identity
+        elif verb == "CANC-USER":
+            pass
+        elif not session.logged:
+            status = "PLNA"         # Privilege, Login Not Active
+        elif not verb.startswith("RTRV-"):
+            rows = []
+
+        if verb == "ACT-USER":
+            session.logged = (status == "COMPLD")
+        elif verb == "CANC-USER":
+            session.logged = False
+
+        if latency is None:
+            latency = self.__latency
+
+        if latency <= 0:
+            return session.send(self.build_response(cmd, ctag, status, rows))
+
+        session.send_at(time.time() + latency, self.build_response(cmd, ctag, status, rows))
+
+        return True
+
+
+    def get_keepalive(self):
+        """ Return the interval (seconds) of KEEP ALIVE messages during a command (0: none)
+        """
+        return self.__keepalive
+
+
+    def keepalive_message(self):
+        """ Return the text of a KEEP ALIVE message
+        """
+        return self.__header("A", "0", "KEEP ALIVE MESSAGE") + ";"
+
+
+    def session_add(self, session):
+        """ INTERNAL USAGE
+        """
+        with self.__lock:
+            self.__sessions.append(session)
+
+
+    def session_del(self, session):
+        """ INTERNAL USAGE
+        """
+        with self.__lock:
+            if session in self.__sessions:
+                self.__sessions.remove(session)
+
+
+    def __rows_for(self, cmd, rows):
+        """ INTERNAL USAGE
+            Generate the rows of a RTRV response
+        """
+        fields = cmd.split(":")
+        aid    = fields[2].strip() if len(fields) > 2 else ""
+
+        if fields[0].strip().upper().startswith("RTRV-COND"):
+            template = self.COND_TEMPLATE
+        else:
+            template = self.ROW_TEMPLATE
+
+        if rows is None  and  aid != ""  and  aid.upper() != "ALL"  and  "&" not in aid:
+            return [template.format(aid=aid)]
+
+        if rows is None:
+            rows = self.__rows
+
+        return [template.format(aid=self.ROW_AID.format(idx)) for idx in range(1, rows + 1)]
+
+
+    def __header(self, code, tag, text):
+        """ INTERNAL USAGE
+        """
+        return "\r\n\n   {:s} {:s}\r\n{:<2s} {} {:s}\r\n".format(self.__sid,
+                                                                time.strftime("%y-%m-%d %H:%M:%S"),
+                                                                code, tag, text)
+
+
+    def __trc_dbg(self, msg, level=None):
+        """ INTERNAL USAGE
+        """
+        if self.__ktrc is not None:
+            self.__ktrc.k_tracer_debug(msg, level)
+
+
+
+if __name__ == "__main__":
+    print("DEBUG")
+
+    sim = TL1Simulator(port=3083, rows=100, latency=0.01)
+    sim.start()
+
+    try:
+        while True:
+            time.sleep(10)
+            sim.alarm_storm(10)
+            print(sim.get_counters())
+    except KeyboardInterrupt:
+        sim.stop()
+
+    print("FINE")
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Benchmark of TL1 plugin and facilities against the local TL1 simulator
+
+Measures:
+    - commands/sec of Plugin1850TL1 (direct, pipelined, asyncio transports)
+    - event ingest rate on EVE channel (REPT ALM storm)
+    - parse throughput of TL1message and TL1check
+    - ASCII / JSONL / BINARY codecs of TL1message (with round-trip check)
+
+@Script: bench_tl1.py
+@AUTHOR: C.Ghelfi
+@DATE  : 27/01/2016
+"""
+
+import os
+import sys
+import time
+import json
+import tempfile
+import argparse
+
+from katelibs.sim1850tl1  import TL1Simulator
+from katelibs.plugin_tl1  import Plugin1850TL1
+from katelibs.facility_tl1 import TL1message, TL1check, TL1Framer
+
+
+LOGIN = "ACT-USER::admin:MYTAG::Alcatel1;"
+
+
+def report(title, count, elapsed, unit):
+    print("{:<44s} {:>10d} {:>10.3f}s {:>12.1f} {:s}/s".format(title, count, elapsed,
+                                                              count / max(elapsed, 1e-9), unit))
+
+
+def bench_commands(port, count, transport, collector):
+    tl1 = Plugin1850TL1("127.0.0.1", PORT=port, collector=collector, transport=transport)
+    tl1.do(LOGIN)
+
+    start_time = time.time()
+    for idx in range(count):
+        tl1.do("RTRV-EQPT::MDL-1-1-{:d};".format(idx % 20 + 1))
+    report("commands, sequential ({:s})".format(transport), count, time.time() - start_time, "cmd")
+
+    tl1.pipeline_start()
+    start_time = time.time()
+    tl1.do_many(["RTRV-EQPT::MDL-1-1-{:d};".format(idx % 20 + 1) for idx in range(count)])
+    report("commands, pipelined ({:s})".format(transport), count, time.time() - start_time, "cmd")
+    tl1.pipeline_stop()
+
+    start_time = time.time()
+    rows = sum(1 for _ in tl1.do_stream("RTRV-MVC4::ALL;"))
+    report("rows, streamed RTRV ({:s})".format(transport), rows, time.time() - start_time, "row")
+
+    tl1.do("CANC-USER;")
+    tl1.thr_event_terminate()
+
+
+def bench_events(sim, port, count, collector):
+    tl1 = Plugin1850TL1("127.0.0.1", PORT=port, collector=collector)
+    tl1.event_collection_start()
+
+    # Sessions of previous plugins could be still logged: probe until an event is
+    # received on the EVE channel of this plugin
+    end_time = time.time() + 30
+    while tl1.event_collection_stats()["received"] == 0  and  time.time() < end_time:
+        sim.alarm_storm(1)
+        time.sleep(0.1)
+
+    received  = tl1.event_collection_stats()["received"]
+    collected = tl1.event_collection_stats()["collected"]
+
+    start_time = time.time()
+    sim.alarm_storm(count)
+    while tl1.event_collection_stats()["received"] < received + count  and  time.time() < end_time + 60:
+        time.sleep(0.001)
+    elapsed = time.time() - start_time
+
+    report("events, ingested", tl1.event_collection_stats()["collected"] - collected, elapsed, "evt")
+
+    tl1.event_collection_stop()
+    tl1.thr_event_terminate()
+
+
+def bench_parse(sim, count, rows):
+    framer = TL1Framer()
+
+    for cmd in ("RTRV-COND-ALL::ALL", "RTRV-MVC4::ALL"):
+        # the response as delivered by TL1 plugin (continuation blocks joined)
+        framer.feed(sim.build_response(cmd, "100", rows=rows).encode())
+        response = framer.next_message()
+
+        start_time = time.time()
+        for _ in range(count):
+            msg = TL1message(response)
+            msg.get_cmd_status()
+        report("TL1message, status only {:s}".format(cmd.split(":")[0]), count, time.time() - start_time, "msg")
+
+        start_time = time.time()
+        for _ in range(count):
+            msg = TL1message(response)
+            for the_aid in msg.get_cmd_aid_list():
+                msg.get_cmd_attr_values(the_aid)
+        elapsed = time.time() - start_time
+        report("TL1message, {:d} rows {:s}".format(rows, cmd.split(":")[0]), count * rows, elapsed, "row")
+        print("{:<44s} {:>34.1f} MB/s".format("", count * len(response) / max(elapsed, 1e-9) / 1e6))
+
+    # PM counters, converted by RTRV-PM schema
+    framer.feed(sim.build_response("RTRV-PM-VC4::ALL", "100",
+                                   rows=["{:s},VC4:BBE-P,{:d},PRTL,NEND,RCV,15-MIN,08-02,08-45".format(
+                                            TL1Simulator.ROW_AID.format(idx), idx)
+                                         for idx in range(1, rows + 1)]).encode())
+    pm_response = framer.next_message()
+
+    start_time = time.time()
+    for _ in range(count):
+        pm_msg = TL1message(pm_response)
+        for the_aid in pm_msg.get_cmd_aid_list():
+            pm_msg.get_cmd_typed_value(the_aid, "MONVAL")
+    report("TL1message, typed MONVAL RTRV-PM", count * rows, time.time() - start_time, "row")
+
+    check = TL1check()
+    check.add_pst("OOS-AU")
+    check.add_field("PTFTYPE", "MODVC4")
+
+    start_time = time.time()
+    for _ in range(count):
+        check.evaluate_msg(msg)
+    report("TL1check.evaluate_msg, {:d} rows".format(rows), count * rows, time.time() - start_time, "row")
+
+    events = [ TL1message('\r\n\n   SIM-1850TSS 16-01-27 10:00:00\r\n*  {:d} REPT ALM EQPT\r\n'
+                          '   "{:s}:MN,ABNORMAL,NSA,10-04,17-01-56,NEND"\r\n;'.format(
+                                idx, TL1Simulator.ROW_AID.format(idx % rows + 1)))
+               for idx in range(count * 10) ]
+
+    check = TL1check()
+    check.add_aid(TL1Simulator.ROW_AID.format(1) + "[0-9]")
+
+    start_time = time.time()
+    for msg in events:
+        check.evaluate_msg(msg)
+    report("TL1check.evaluate_msg, REPT ALM", len(events), time.time() - start_time, "evt")
+
+    start_time = time.time()
+    check.evaluate_batch(events, cond="ABNORMAL")
+    report("TL1check.evaluate_batch, REPT ALM", len(events), time.time() - start_time, "evt")
+
+
+def bench_codecs(sim, count, rows):
+    framer = TL1Framer()
+    framer.feed(sim.build_response("RTRV-MVC4::ALL", "100", rows=rows).encode())
+    response = framer.next_message()
+
+    loaders = { "ASCII"  : TL1message,
+                "JSONL"  : lambda data: TL1message.from_coded(json.loads(data)),
+                "BINARY" : TL1message.from_binary }
+
+    reference = TL1message(response).decode("JSONL")
+
+    for codec,loader in sorted(loaders.items()):
+        decoded = TL1message(response)
+        for the_aid in decoded.get_cmd_aid_list():
+            decoded.get_cmd_attr_values(the_aid)
+
+        for msg in (TL1message(response), decoded):
+            data = msg.decode(codec)
+            if loader(data).decode("JSONL") != reference:
+                print("{:s}: round-trip mismatch".format(codec))
+
+        start_time = time.time()
+        for _ in range(count):
+            data = TL1message(response).decode(codec)
+        report("decode {:s}, {:d} rows (not decoded)".format(codec, rows), count, time.time() - start_time, "msg")
+
+        start_time = time.time()
+        for _ in range(count):
+            decoded.decode(codec)
+        report("decode {:s}, {:d} rows (decoded)".format(codec, rows), count, time.time() - start_time, "msg")
+
+        start_time = time.time()
+        for _ in range(count):
+            loader(data).get_cmd_attr_values(TL1Simulator.ROW_AID.format(1))
+        elapsed = time.time() - start_time
+        report("load {:s}, {:d} rows".format(codec, rows), count, elapsed, "msg")
+        print("{:<44s} {:>34.1f} MB/s".format("", count * len(data) / max(elapsed, 1e-9) / 1e6))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TL1 plugin benchmark on local simulator")
+    parser.add_argument("--port",     type=int,   default=0,    help="simulator port (0: any free port)")
+    parser.add_argument("--commands", type=int,   default=1000, help="commands for each mode")
+    parser.add_argument("--events",   type=int,   default=5000, help="REPT ALM messages of storm")
+    parser.add_argument("--rows",     type=int,   default=500,  help="rows of RTRV-xxx-ALL responses")
+    parser.add_argument("--parse",    type=int,   default=200,  help="iterations of parse benchmark")
+    parser.add_argument("--latency",  type=float, default=0.0,  help="simulator latency (seconds)")
+    parser.add_argument("--transport", default="telnet,asyncio", help="transports to benchmark")
+    parser.add_argument("--parse-only", action="store_true", help="only parse benchmark (no connections)")
+    args = parser.parse_args()
+
+    sim = TL1Simulator(port=args.port, rows=args.rows, latency=args.latency)
+    sim.start()
+
+    port      = sim.get_port()
+    collector = os.path.join(tempfile.mkdtemp(), "bench_collector.log")
+
+    if not args.parse_only:
+        for transport in args.transport.split(","):
+            bench_commands(port, args.commands, transport, collector)
+
+        bench_events(sim, port, args.events, collector)
+
+    bench_parse(sim, args.parse, args.rows)
+    bench_codecs(sim, args.parse, args.rows)
+
+    sim.stop()
+
+
+if __name__ == "__main__":
+    main()